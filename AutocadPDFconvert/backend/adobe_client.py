@@ -0,0 +1,289 @@
+"""
+Async client for the Adobe PDF Services REST API.
+
+The vendored SDK issues every request with module-level requests.get/post/put,
+so each upload, status poll and download pays for a new TCP+TLS handshake
+and blocks a thread. This client talks to the same endpoints through one
+pooled httpx.AsyncClient (keep-alive, HTTP/2 when `h2` is installed), so many
+jobs share a handful of connections from a single event loop.
+
+Errors are raised as the SDK's own exception types so callers can keep
+handling ServiceApiException / ServiceUsageException / SdkException.
+
+Access tokens can be shared through a token cache (see
+backend.client_registry.TokenCache): a client first looks there before
+asking IMS for a new token, and saves every token it fetches.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Union
+
+import httpx
+
+from adobe.pdfservices.operation.exception.exceptions import (
+    SdkException,
+    ServiceApiException,
+    ServiceUsageException,
+)
+
+from backend.spool import iter_file
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_PDF_SERVICES_URI = "https://pdf-services-ue1.adobe.io"
+PDF_MEDIA_TYPE = "application/pdf"
+
+# Refresh the access token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 120
+
+
+class JobFailed(ServiceApiException):
+    """
+    The status request worked and Adobe says the job failed. Asking again
+    won't change that; status_code is the job's error status.
+    """
+
+
+class AdobePDFServicesClient:
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        base_url: Optional[str] = None,
+        limiter=None,
+        max_connections: int = 20,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+        token_cache=None,
+    ):
+        """
+        limiter     - optional AdaptiveRateLimiter every request waits on
+        token_cache - optional store (load/save) shared with other clients
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = (base_url or DEFAULT_PDF_SERVICES_URI).rstrip("/")
+        self.limiter = limiter
+        self.token_cache = token_cache
+        self._http = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    # --------------------------------------------------
+    # Transport
+    # --------------------------------------------------
+    async def _send(self, method: str, url: str, metered: bool = True,
+                    **kwargs) -> httpx.Response:
+        """
+        metered - goes through the rate limiter (False for the presigned
+                  storage URLs, which aren't PDF Services API quota)
+        """
+        limiter = self.limiter if metered else None
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            response = await self._http.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            raise SdkException(
+                "Request could not be completed. Possible cause attached!",
+                sys.exc_info(),
+            )
+        if limiter is not None:
+            if response.status_code == 429:
+                limiter.on_throttle(_retry_after(response))
+            elif response.status_code < 400:
+                limiter.on_success()
+        return response
+
+    async def _api(self, method: str, path_or_url: str, ok=(200, 201, 202),
+                   headers: Optional[Dict] = None, **kwargs) -> httpx.Response:
+        """Authenticated call to the PDF Services API (one retry on 401)."""
+        url = path_or_url if path_or_url.startswith("http") else self.base_url + path_or_url
+        for attempt in range(2):
+            request_headers = {
+                "Authorization": "Bearer " + await self.access_token(force=attempt > 0),
+                "x-api-key": self.client_id,
+                "x-request-id": str(uuid.uuid4()),
+                "Accept": "application/json, text/plain, */*",
+            }
+            request_headers.update(headers or {})
+            response = await self._send(method, url, headers=request_headers, **kwargs)
+            if response.status_code == 401 and attempt == 0:
+                continue
+            _raise_for_status(response, ok)
+            return response
+
+    # --------------------------------------------------
+    # Auth
+    # --------------------------------------------------
+    @property
+    def token_expires_in(self) -> float:
+        return self._token_expires_at - time.time() if self._token else 0.0
+
+    async def access_token(self, force: bool = False,
+                           min_ttl: float = TOKEN_REFRESH_MARGIN) -> str:
+        """
+        A token valid for at least `min_ttl` more seconds: the one held, a
+        fresher one from the token cache, or a new one from IMS.
+        `force` skips both (the held token was rejected).
+        """
+        async with self._token_lock:
+            if not force and self._token and self.token_expires_in > min_ttl:
+                return self._token
+            if not force and self.token_cache is not None:
+                cached = self.token_cache.load(self.client_id)
+                if cached and cached[1] - time.time() > min_ttl:
+                    self._token, self._token_expires_at = cached
+                    return self._token
+            response = await self._send(
+                "POST",
+                self.base_url + "/token",
+                data={
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                },
+            )
+            _raise_for_status(response, (200,))
+            content = response.json()
+            self._token = content["access_token"]
+            self._token_expires_at = time.time() + float(content["expires_in"])
+            if self.token_cache is not None:
+                self.token_cache.save(
+                    self.client_id, self._token, self._token_expires_at
+                )
+            return self._token
+
+    # --------------------------------------------------
+    # ExportPDF flow
+    # --------------------------------------------------
+    async def upload(self, source: Union[bytes, str, os.PathLike],
+                     media_type: str = PDF_MEDIA_TYPE) -> str:
+        """
+        Upload content and return its assetID. `source` is either the bytes
+        or a file path; files are streamed from disk, never read whole.
+        """
+        response = await self._api(
+            "POST", "/assets", json={"mediaType": media_type},
+        )
+        content = response.json()
+        headers = {"Content-Type": media_type}
+        if isinstance(source, (bytes, bytearray)):
+            body = source
+        else:
+            # The presigned storage URL needs a length, not chunked encoding
+            headers["Content-Length"] = str(os.path.getsize(source))
+            body = iter_file(source)
+        upload = await self._send(
+            "PUT", content["uploadUri"], metered=False, content=body, headers=headers,
+        )
+        _raise_for_status(upload, (200, 201, 202))
+        return content["assetID"]
+
+    async def submit_export(
+        self,
+        asset_id: str,
+        target_format: str = "docx",
+        ocr_lang: str = "en-US",
+        notifiers: Optional[List[Dict]] = None,
+    ) -> str:
+        """Submit an ExportPDF job and return its polling location."""
+        payload = {
+            "assetID": asset_id,
+            "targetFormat": target_format,
+            "ocrLang": ocr_lang,
+        }
+        if notifiers:
+            payload["notifiers"] = notifiers
+        response = await self._api(
+            "POST", "/operation/exportpdf", ok=(201,), json=payload,
+        )
+        location = response.headers.get("location")
+        if not location:
+            raise SdkException("ExportPDF response had no location header")
+        return location
+
+    async def poll(self, location: str) -> Dict:
+        """
+        One status request. Returns the JSON payload with an extra
+        "retry_after" key (seconds) while the job is still in progress;
+        raises JobFailed if the job failed.
+        """
+        response = await self._api("GET", location)
+        content = response.json()
+        status = content.get("status")
+        if status == "failed":
+            error = content.get("error") or {}
+            raise JobFailed(
+                message=error.get("message", "Job failed"),
+                request_tracking_id=response.headers.get("x-request-id"),
+                status_code=error.get("status"),
+                error_code=error.get("code"),
+            )
+        if status == "in progress":
+            content["retry_after"] = _retry_after(response) or 1.0
+        return content
+
+    async def download(self, download_uri: str) -> bytes:
+        response = await self._send(
+            "GET", download_uri, metered=False, follow_redirects=True
+        )
+        _raise_for_status(response, (200, 202))
+        return response.content
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _raise_for_status(response: httpx.Response, ok):
+    if response.status_code in ok:
+        return
+    tracking_id = response.headers.get("x-request-id")
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        # JSON, but a list or a bare string
+        body = {}
+    error = body.get("error")
+    if isinstance(error, dict):
+        code, message = error.get("code"), error.get("message")
+    else:
+        code = error
+        message = body.get("error_description") or body.get("message") or response.text
+    if response.status_code == 429:
+        exc = ServiceUsageException(message, tracking_id, 429, code)
+        exc.retry_after = _retry_after(response)
+        raise exc
+    raise ServiceApiException(message, tracking_id, response.status_code, code)
@@ -0,0 +1,97 @@
+"""
+Per-job output directory for converted DOCX files.
+
+Each finished document is written once to disk together with the size and
+CRC-32 the ZIP format needs, so downloads can stream archives straight from
+these files without re-reading or re-compressing anything.
+"""
+import os
+import time
+import zlib
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, List
+
+OUTPUT_DIR = Path(os.getenv(
+    "OUTPUT_DIR", str(Path(__file__).resolve().parent / "output")
+))
+
+
+def job_output_dir(job_id: str) -> Path:
+    return OUTPUT_DIR / job_id
+
+
+def archive_names(filenames: List[str]) -> List[str]:
+    """
+    Names inside the ZIP for the uploaded `filenames`, in order: the path
+    below the uploaded folder, with .docx for the extension. Names that
+    would still clash (loose files, other folders) get " (2)", " (3)", ...
+    """
+    names = []
+    seen = set()
+    for filename in filenames:
+        parts = [
+            part for part in filename.replace("\\", "/").split("/")
+            if part not in ("", ".", "..")
+        ]
+        # The first component is the folder picked for upload
+        stem = os.path.splitext("/".join(parts[1:] or parts) or "document")[0]
+        name = stem + ".docx"
+        n = 1
+        # Case-insensitive: unzipping on Windows or macOS would clash too
+        while name.lower() in seen:
+            n += 1
+            name = f"{stem} ({n}).docx"
+        seen.add(name.lower())
+        names.append(name)
+    return names
+
+
+def claim_artifact_name(task: Dict, owner: str) -> str:
+    """
+    Output filename for one claim of a file task. A worker that lost its
+    lease may still be writing; the next owner writes a file of its own.
+    """
+    claim = f"{owner}:{task['task_id']}:{task['claims']}".encode()
+    return f"{task['index']:05d}-{hashlib.sha1(claim).hexdigest()[:12]}.docx"
+
+
+def write_artifact(job_id: str, filename: str, arcname: str, data: bytes) -> Dict:
+    """
+    Write `data` to the job's output dir as `filename`; returns the member
+    record used by ZipStream (arcname is the name inside the archive).
+    """
+    path = job_output_dir(job_id) / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return {
+        "name": arcname,
+        "path": str(path),
+        "size": len(data),
+        "crc32": zlib.crc32(data) & 0xFFFFFFFF,
+        "mtime": time.time(),
+    }
+
+
+def describe_artifact(path, arcname: str) -> Dict:
+    """Member record for a file already written to the output dir."""
+    crc = 0
+    size = 0
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return {
+        "name": arcname,
+        "path": str(path),
+        "size": size,
+        "crc32": crc & 0xFFFFFFFF,
+        "mtime": os.path.getmtime(path),
+    }
+
+
+def remove_job_outputs(job_id: str):
+    shutil.rmtree(job_output_dir(job_id), ignore_errors=True)
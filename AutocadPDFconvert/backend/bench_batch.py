@@ -0,0 +1,306 @@
+"""
+End-to-end benchmark of /convert/batch against the fake PDF Services server.
+
+Generates synthetic drawing PDFs (random A0-A4 sheets, page counts and
+amounts of linework), serves backend.main with uvicorn, uploads them as
+one batch and follows the job until it has finished. The fake server runs
+in its own process, with injected latency, failed jobs and throttling.
+
+Reports:
+    files/min       - converted files per minute, upload included
+    latency p50/p95 - per file, from the upload finishing to the file
+                      being converted (or failed)
+    peak RSS        - of the process serving the backend
+    loop lag        - how late a 50 ms timer on the backend's event loop
+                      fires (p50/p99/max)
+
+    python -m backend.bench_batch --files 40 --latency 2 --failure-rate 0.05 --throttle-rate 0.02
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import statistics
+import tempfile
+import multiprocessing
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from pypdf import PdfWriter
+from pypdf.generic import ContentStream
+
+from backend.fake_pdf_services import create_app, serve_in_thread
+
+# A0-A4 landscape, in points
+SHEET_SIZES = [(3370, 2384), (2384, 1684), (1684, 1191), (1191, 842), (842, 595)]
+LAG_INTERVAL = 0.05
+TERMINAL_STATES = ("done", "failed")
+
+
+def make_drawing(rng: random.Random, pages: int, strokes: int) -> bytes:
+    """A PDF of `pages` sheets, each with `strokes` random lines."""
+    writer = PdfWriter()
+    width, height = rng.choice(SHEET_SIZES)
+    for _ in range(pages):
+        page = writer.add_blank_page(width=width, height=height)
+        ops = ["0.5 w"]
+        for _ in range(strokes):
+            ops.append("%.1f %.1f m %.1f %.1f l S" % (
+                rng.uniform(0, width), rng.uniform(0, height),
+                rng.uniform(0, width), rng.uniform(0, height),
+            ))
+        stream = ContentStream(None, None)
+        stream.set_data("\n".join(ops).encode())
+        page.replace_contents(stream)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def make_batch(directory: Path, count: int, max_pages: int, seed: int) -> List[Path]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        pages = rng.randint(1, max_pages)
+        # Mostly light sheets, with the odd dense one
+        strokes = int(rng.paretovariate(1.5) * 200)
+        path = directory / f"sheet_{i:03d}.pdf"
+        path.write_bytes(make_drawing(rng, pages, strokes))
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process, in MB."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(),
+            ctypes.byref(counters), counters.cb,
+        )
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+class LagProbe:
+    """ASGI wrapper that measures event-loop lag on the app's own loop."""
+
+    def __init__(self, app):
+        self.app = app
+        self.samples: List[float] = []
+        self._task = None
+
+    async def __call__(self, scope, receive, send):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await self.app(scope, receive, send)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve_fake(port: int, options: Dict):
+    import uvicorn
+    uvicorn.run(create_app(**options), host="127.0.0.1", port=port, log_level="warning")
+
+
+def _wait_for(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def isolate(work_dir: Path, fake_url: str):
+    """
+    Point the backend at the fake server, and everything it writes at
+    `work_dir`, so a benchmark leaves the real install alone (credentials,
+    cached tokens, spool, outputs, caches). Call before importing
+    backend.main; it reads these at import time.
+    """
+    os.environ["PDF_SERVICES_URI"] = fake_url
+    os.environ["PDF_SERVICES_CLIENT_ID"] = "bench"
+    os.environ["PDF_SERVICES_CLIENT_SECRET"] = "bench"
+    os.environ["PDF_SERVICES_CREDENTIALS_FILE"] = str(work_dir / "no-credentials.json")
+    # Every sheet must go to the fake, not come out of the cache
+    os.environ["CONVERSION_CACHE_MAX_MB"] = "0"
+    os.environ["JOB_STORE"] = "memory"
+    os.environ["TOKEN_CACHE_DIR"] = str(work_dir / "tokens")
+    os.environ["SPOOL_DIR"] = str(work_dir / "spool")
+    os.environ["OUTPUT_DIR"] = str(work_dir / "output")
+    os.environ["CONVERSION_CACHE_DIR"] = str(work_dir / "cache")
+    os.environ["PDF_STORE_DIR"] = str(work_dir / "pdfs")
+
+
+def run(args) -> Dict:
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_batch_"))
+    fake_port = _free_port()
+    fake = multiprocessing.get_context("spawn").Process(
+        target=_serve_fake,
+        args=(fake_port, {
+            "latency": args.latency,
+            "retry_after": args.retry_after,
+            "latency_per_mb": args.latency_per_mb,
+            "jitter": args.jitter,
+            "failure_rate": args.failure_rate,
+            "throttle_rate": args.throttle_rate,
+            "seed": args.seed,
+        }),
+        daemon=True,
+    )
+    fake.start()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+
+    isolate(work_dir, fake_url)
+    if args.max_in_flight:
+        os.environ["MAX_IN_FLIGHT"] = str(args.max_in_flight)
+    from backend import main
+
+    paths = make_batch(work_dir, args.files, args.max_pages, args.seed)
+    input_mb = sum(p.stat().st_size for p in paths) / (1024 * 1024)
+    _wait_for(fake_url + "/stats")
+    probe = LagProbe(main.app)
+    server, base_url = serve_in_thread(probe)
+
+    finished_at: Dict[int, float] = {}
+    states: Dict[int, str] = {}
+    try:
+        with httpx.Client(base_url=base_url, timeout=600) as client:
+            t0 = time.perf_counter()
+            handles = [open(p, "rb") for p in paths]
+            try:
+                response = client.post("/convert/batch", files=[
+                    ("files", (f"Bench/{p.name}", fh, "application/pdf"))
+                    for p, fh in zip(paths, handles)
+                ])
+            finally:
+                for fh in handles:
+                    fh.close()
+            response.raise_for_status()
+            job_id = response.json()["job_id"]
+            uploaded = time.perf_counter()
+
+            version, finished = -1, False
+            while not finished:
+                status = client.get(f"/convert/status/{job_id}", params={"since": version}).json()
+                now = time.perf_counter()
+                version, finished = status["version"], status["finished"]
+                for f in status["files"]:
+                    states[f["index"]] = f["state"]
+                    if f["state"] in TERMINAL_STATES:
+                        finished_at.setdefault(f["index"], now)
+                time.sleep(args.poll_interval)
+            elapsed = time.perf_counter() - t0
+        fake_stats = httpx.get(fake_url + "/stats").json()
+    finally:
+        server.should_exit = True
+        fake.terminate()
+        fake.join(5)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = [t - uploaded for t in finished_at.values()]
+    lag_ms = [s * 1000 for s in probe.samples]
+    converted = sum(1 for s in states.values() if s == "done")
+    return {
+        "files": args.files,
+        "input_mb": round(input_mb, 1),
+        "converted": converted,
+        "failed": sum(1 for s in states.values() if s == "failed"),
+        "seconds": round(elapsed, 2),
+        "upload_seconds": round(uploaded - t0, 2),
+        "files_per_minute": round(converted / elapsed * 60, 1),
+        "latency_p50": round(percentile(latencies, 50), 2),
+        "latency_p95": round(percentile(latencies, 95), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "loop_lag_ms": {
+            "p50": round(percentile(lag_ms, 50), 1),
+            "p99": round(percentile(lag_ms, 99), 1),
+            "max": round(max(lag_ms, default=0.0), 1),
+            "mean": round(statistics.fmean(lag_ms), 1) if lag_ms else 0.0,
+        },
+        "fake": fake_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--max-pages", type=int, default=4)
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--latency-per-mb", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    lag = report["loop_lag_ms"]
+    print(f"{report['files']} files ({report['input_mb']} MB): "
+          f"{report['converted']} converted, {report['failed']} failed "
+          f"in {report['seconds']}s (upload {report['upload_seconds']}s)")
+    print(f"  files/min      {report['files_per_minute']:>8}")
+    print(f"  latency p50    {report['latency_p50']:>8} s")
+    print(f"  latency p95    {report['latency_p95']:>8} s")
+    print(f"  peak RSS       {report['peak_rss_mb']:>8} MB")
+    print(f"  loop lag       {lag['p50']} / {lag['p99']} / {lag['max']} ms (p50/p99/max)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Throughput of one conversion worker for different max_in_flight values,
+measured against the local fake PDF Services server.
+
+    python -m backend.bench_concurrency --files 24 --latency 2 --n 1 2 4 8
+"""
+import io
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import uuid
+import asyncio
+import argparse
+from pathlib import Path
+
+from pypdf import PdfWriter
+
+from backend.bench_batch import isolate
+from backend.fake_pdf_services import create_app, serve_in_thread
+
+
+def make_pdf(title: str, width_pt: float = 2384, height_pt: float = 1684) -> bytes:
+    writer = PdfWriter()
+    writer.add_blank_page(width=width_pt, height=height_pt)
+    # Distinct content per sheet, so single-flight doesn't share conversions
+    writer.add_metadata({"/Title": title})
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+async def run_job(job_store, job_id: str, max_in_flight: int):
+    """Run a worker until the job has finished."""
+    from backend.worker import Worker
+
+    worker = asyncio.create_task(Worker(concurrency=max_in_flight).run())
+    try:
+        while job_store.get_outputs(job_id) is None:
+            await asyncio.sleep(0.05)
+    finally:
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+
+def run(n_files: int, latency: float, levels):
+    server, base_url = serve_in_thread(create_app(latency=latency, retry_after=0.2))
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_concurrency_"))
+    try:
+        measure(work_dir, base_url, n_files, latency, levels)
+    finally:
+        server.should_exit = True
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def measure(work_dir: Path, base_url: str, n_files: int, latency: float, levels):
+    isolate(work_dir, base_url)
+    os.environ["EMBEDDED_WORKER"] = "0"
+    from backend import main
+    from backend.spool import job_spool_dir
+
+    pdfs = [make_pdf(f"sheet {i}") for i in range(n_files)]
+    print(f"{n_files} files, {latency:.1f}s fake conversion latency")
+    print(f"{'max_in_flight':>14} {'seconds':>9} {'files/min':>10} {'speedup':>8}")
+
+    baseline = None
+    for n in levels:
+        job_id = str(uuid.uuid4())
+        files = []
+        for i in range(n_files):
+            name = f"sheet_{i:03d}.pdf"
+            pdf = pdfs[i]
+            path = job_spool_dir(job_id) / f"{i:05d}.pdf"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(pdf)
+            files.append({
+                "name": name,
+                "path": str(path),
+                "size": len(pdf),
+                "sha256": hashlib.sha256(pdf).hexdigest(),
+            })
+        main.JOB_STORE.create_job(job_id, main.new_job_meta("bench"), files)
+
+        t0 = time.perf_counter()
+        asyncio.run(run_job(main.JOB_STORE, job_id, n))
+        elapsed = time.perf_counter() - t0
+
+        converted = sum(1 for f in main.JOB_STORE.get_files(job_id) if f["output"])
+        if converted != n_files:
+            print(f"  warning: only {converted}/{n_files} converted")
+        baseline = baseline or elapsed
+        print(
+            f"{n:>14} {elapsed:>9.2f} {n_files / elapsed * 60:>10.1f}"
+            f" {baseline / elapsed:>7.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--n", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    run(args.files, args.latency, args.n)
+
+
+if __name__ == "__main__":
+    main()
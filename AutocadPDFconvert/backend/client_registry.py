@@ -0,0 +1,140 @@
+"""
+Adobe clients that live as long as the app.
+
+One AdobePDFServicesClient per account is created when the app starts and
+shared by every batch, so connections and access tokens are reused instead
+of being set up again for each batch. Tokens are fetched at startup and a
+background task refreshes each one TOKEN_PREFETCH_SECONDS before it
+expires, well ahead of the 2-minute margin at which a request would
+refresh it itself. Tokens are also kept on disk (TokenCache), so other
+uvicorn workers and restarts pick up a valid token instead of asking IMS
+for another.
+"""
+import os
+import json
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from backend.adobe_client import AdobePDFServicesClient
+from backend.credential_pool import CREDENTIAL_POOL, AdobeAccount, CredentialPool
+from backend.rate_limiter import AdaptiveRateLimiter, adobe_limiter
+
+TOKEN_CACHE_DIR = Path(os.getenv(
+    "TOKEN_CACHE_DIR", str(Path(__file__).resolve().parent / "tokens")
+))
+
+# Refresh tokens this long before they expire, checking this often
+TOKEN_PREFETCH_SECONDS = float(os.getenv("TOKEN_PREFETCH_SECONDS", "600"))
+TOKEN_CHECK_INTERVAL = 60.0
+
+# Optional override of the PDF Services endpoint (e.g. a local fake server)
+ADOBE_SERVICES_URI = os.getenv("PDF_SERVICES_URI")
+
+# Connections per account, shared by every batch in this process
+ADOBE_MAX_CONNECTIONS = int(os.getenv("ADOBE_MAX_CONNECTIONS", "20"))
+
+
+class TokenCache:
+    """Access tokens on disk, one file per client id."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _path(self, client_id: str) -> Path:
+        name = hashlib.sha256(client_id.encode()).hexdigest()[:16]
+        return self.directory / f"{name}.json"
+
+    def load(self, client_id: str) -> Optional[Tuple[str, float]]:
+        """(token, expires_at) or None."""
+        try:
+            data = json.loads(self._path(client_id).read_text())
+            return data["access_token"], float(data["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, client_id: str, token: str, expires_at: float):
+        path = self._path(client_id)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"access_token": token, "expires_at": expires_at}))
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[WARN] Could not save access token: {e}")
+
+
+class ClientRegistry:
+    def __init__(self, pool: CredentialPool, token_cache: TokenCache,
+                 max_connections: int = ADOBE_MAX_CONNECTIONS):
+        self.pool = pool
+        self.token_cache = token_cache
+        self.max_connections = max_connections
+        self._clients: Dict[str, AdobePDFServicesClient] = {}
+        # One per account: a 429 from one account's quota slows only that one.
+        # Kept when the clients are recreated for another loop
+        self._limiters: Dict[str, AdaptiveRateLimiter] = {}
+        self._loop = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    def get(self, account: AdobeAccount) -> AdobePDFServicesClient:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # httpx clients belong to the loop they were created on
+            self._clients = {}
+            self._loop = loop
+        client = self._clients.get(account.key)
+        if client is None:
+            client = AdobePDFServicesClient(
+                account.client_id,
+                account.client_secret,
+                base_url=ADOBE_SERVICES_URI,
+                limiter=self._limiters.setdefault(account.key, adobe_limiter()),
+                max_connections=self.max_connections,
+                token_cache=self.token_cache,
+            )
+            self._clients[account.key] = client
+        return client
+
+    def rate_limits(self) -> Dict[str, Dict]:
+        """Limiter state per account label, for accounts used so far."""
+        return {
+            account.label: self._limiters[account.key].snapshot()
+            for account in self.pool.accounts
+            if account.key in self._limiters
+        }
+
+    async def start(self):
+        """Create every account's client, fetch tokens and keep them fresh."""
+        for account in self.pool.accounts:
+            self.get(account)
+        await self._refresh_tokens()
+        self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_tokens(self):
+        clients = list(self._clients.values())
+        results = await asyncio.gather(
+            *(c.access_token(min_ttl=TOKEN_PREFETCH_SECONDS) for c in clients),
+            return_exceptions=True,
+        )
+        for client, result in zip(clients, results):
+            if isinstance(result, Exception):
+                print(f"[WARN] Token refresh failed for {client.client_id[:8]}…: {result}")
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(TOKEN_CHECK_INTERVAL)
+            await self._refresh_tokens()
+
+    async def aclose(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+CLIENT_REGISTRY = ClientRegistry(CREDENTIAL_POOL, TokenCache(TOKEN_CACHE_DIR))
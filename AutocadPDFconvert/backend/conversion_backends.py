@@ -0,0 +1,391 @@
+"""
+Conversion backends behind the conversion pipeline (backend.pipeline).
+
+AdobeBackend runs the ExportPDF flow on the credential pool. LocalBackend
+converts offline in a process pool (backend.local_engine): lower fidelity,
+but no network and no quota. choose_backend() routes each file according
+to CONVERSION_POLICY:
+
+    fallback - Adobe; files go local while Adobe is unreachable (default)
+    auto     - as fallback, and sheets with no fonts at all (drawings whose
+               text, if any, is plotted as geometry) go local
+    adobe    - Adobe only
+    local    - local only
+
+A circuit breaker watches Adobe for network failures. After a few in a row
+it opens, and new files are sent to the local backend without waiting on
+DNS or connect timeouts; after ADOBE_BREAKER_RESET seconds one file is let
+through to test whether Adobe is back.
+"""
+import os
+import time
+import asyncio
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from adobe.pdfservices.operation.exception.exceptions import (
+    ServiceApiException,
+    ServiceUsageException,
+)
+
+from backend.adobe_client import JobFailed
+from backend.client_registry import CLIENT_REGISTRY
+from backend.cpu_executor import exit_with_parent
+from backend.credential_pool import CREDENTIAL_POOL, AdobeAccount, NoAccountAvailable
+from backend.job_poller import JOB_POLLER
+from backend.job_store import JOB_STORE, FileState
+from backend.local_engine import convert_pdf
+from backend.metrics import BYTES, COOLDOWN_SECONDS, TRANSACTIONS, count, span
+from backend.retry_policy import (
+    RETRY_BUDGETS,
+    RETRY_MAX_DELAY,
+    ErrorClass,
+    classify,
+    is_outage_error,
+)
+
+CONVERSION_POLICY = os.getenv("CONVERSION_POLICY", "fallback")
+
+# ExportPDF parameters (also part of the conversion cache key)
+EXPORT_TARGET_FORMAT = "docx"
+EXPORT_OCR_LANG = os.getenv("EXPORT_OCR_LANG", "en-US")
+
+# Upper bound on how long one ExportPDF job may stay in progress
+ADOBE_JOB_TIMEOUT = float(os.getenv("ADOBE_JOB_TIMEOUT", "1800"))
+
+# Seconds between copies of the limiter, poller and breaker state into a
+# job's meta while its files are on Adobe
+ADOBE_STATE_INTERVAL = float(os.getenv("ADOBE_STATE_INTERVAL", "2"))
+
+ADOBE_BREAKER_FAILURES = int(os.getenv("ADOBE_BREAKER_FAILURES", "3"))
+ADOBE_BREAKER_RESET = float(os.getenv("ADOBE_BREAKER_RESET", "30"))
+
+LOCAL_WORKERS = int(os.getenv("LOCAL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# progress(state, percent) - reports a file's progress to the job
+Progress = Callable[[FileState, int], None]
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = 3, reset_after: float = 30.0):
+        """
+        failures    - consecutive network failures that open the circuit
+        reset_after - seconds before one call is let through to try again
+        """
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        # A trial that never reported back (its file stopped before reaching
+        # Adobe) is replaced by another after reset_after too
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            # Half-open: this caller is the trial, the others still go offline
+            self.state = "half_open"
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+    def cancel_trial(self):
+        """The trial was stopped before Adobe answered; let the next caller try."""
+        if self.state == "half_open":
+            self.state = "open"
+            self._opened_at = time.monotonic() - self.reset_after
+
+    def record_success(self):
+        if self.state != "closed":
+            print("[INFO] Adobe reachable again, closing circuit")
+        self.state = "closed"
+        self._consecutive = 0
+
+    def record_failure(self):
+        self._consecutive += 1
+        if self.state == "half_open" or (
+            self.state == "closed" and self._consecutive >= self.failures
+        ):
+            print(f"[WARN] Adobe unreachable, routing new files offline for "
+                  f"{self.reset_after:.0f}s")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        return {"state": self.state, "failures": self._consecutive}
+
+
+class ConversionBackend(ABC):
+    name: str
+    # Whether results may be stored in the conversion cache
+    cacheable: bool = False
+    # Status label for files this backend converted (None: the default)
+    done_label: Optional[str] = None
+
+    @abstractmethod
+    async def convert(self, job_id: str, f: Dict, progress: Progress) -> bytes:
+        """DOCX bytes for the work record `f`; raises on failure."""
+
+    async def resume(self, job_id: str, f: Dict, progress: Progress) -> Optional[bytes]:
+        """Finish a conversion started before a restart; None to start over."""
+        return None
+
+
+def publish_accounts(job_id: str):
+    JOB_STORE.update_meta(job_id, accounts=CREDENTIAL_POOL.snapshot())
+
+
+class AdobeBackend(ConversionBackend):
+    name = "adobe"
+    cacheable = True
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(ADOBE_BREAKER_FAILURES, ADOBE_BREAKER_RESET)
+        # job id -> (when, state) last published to its meta
+        self._published: Dict[str, Tuple[float, Dict]] = {}
+
+    async def call(self, job_id: str, coro, timeout=120, stage: str = None):
+        """Await an Adobe client call, timed as `stage`, and publish the limiter state."""
+        try:
+            if stage is None:
+                return await asyncio.wait_for(coro, timeout)
+            with span(stage, job_id):
+                return await asyncio.wait_for(coro, timeout)
+        finally:
+            await self.publish_state(job_id)
+
+    async def publish_state(self, job_id: str, final: bool = False):
+        """
+        Copy the limiter, poller and breaker state into the job's meta if it
+        changed, at most every ADOBE_STATE_INTERVAL. final: the job's file
+        is done here, publish what is left now.
+        """
+        last = self._published.get(job_id)
+        if final and last is None:
+            return
+        state = {
+            "rate_limit": CLIENT_REGISTRY.rate_limits(),
+            "poller": JOB_POLLER.snapshot(),
+            "adobe": self.breaker.snapshot(),
+        }
+        now = time.monotonic()
+        if final:
+            del self._published[job_id]
+        elif last is not None and now - last[0] < ADOBE_STATE_INTERVAL:
+            return
+        else:
+            self._published[job_id] = (now, state)
+        if last is None or state != last[1]:
+            await asyncio.to_thread(JOB_STORE.update_meta, job_id, **state)
+
+    async def _watch_outage(self, coro):
+        """Run a whole conversion, feeding the outcome to the breaker."""
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            self.breaker.cancel_trial()
+            raise
+        except Exception as e:
+            if is_outage_error(e):
+                self.breaker.record_failure()
+            else:
+                # Adobe answered, even if it was to say no
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _export(self, job_id: str, client, f: Dict, asset_id: str,
+                      account: AdobeAccount):
+        """Submit ExportPDF for an uploaded asset and wait for the result asset."""
+        token, notifiers = JOB_POLLER.new_callback()
+        location = await self.call(
+            job_id,
+            client.submit_export(
+                asset_id,
+                target_format=EXPORT_TARGET_FORMAT,
+                ocr_lang=EXPORT_OCR_LANG,
+                notifiers=notifiers,
+            ),
+            stage="submit",
+        )
+        await asyncio.to_thread(CREDENTIAL_POOL.record_transaction, account)
+        count(TRANSACTIONS, 1, job_id, account.label)
+        await asyncio.to_thread(publish_accounts, job_id)
+        # Saved so a restarted worker can keep polling instead of re-uploading;
+        # the job can only be polled with the account that submitted it.
+        # Page ranges (backend.page_split) are resumed from their saved parts.
+        if "part" not in f:
+            await asyncio.to_thread(
+                JOB_STORE.update_work, job_id, f["index"],
+                location=location, account=account.key,
+            )
+            f.update(location=location, account=account.key)
+        try:
+            return await self.call(
+                job_id, JOB_POLLER.wait(location, client, token), ADOBE_JOB_TIMEOUT,
+                stage="adobe_job",
+            )
+        except JobFailed:
+            # Nothing left to resume: the next try uploads again straight away
+            await self._forget_job(job_id, f)
+            raise
+
+    async def _forget_job(self, job_id: str, f: Dict):
+        """Drop the saved Adobe job of a file, in memory and in the store."""
+        if "part" not in f:
+            await asyncio.to_thread(
+                JOB_STORE.update_work, job_id, f["index"], location=None, account=None,
+            )
+        f.pop("location", None)
+        f.pop("account", None)
+
+    async def _convert(self, job_id: str, f: Dict, progress: Progress) -> bytes:
+        """
+        Upload, export and download on the account with the most quota left.
+        An account that answers with ServiceUsageException is cooled down and
+        the file moves on to the next one. While every account is cooling
+        down the file waits for the first to come back; it gives up once
+        the accounts are out of quota or it has been throttled more often
+        than the throttling retry budget allows.
+        """
+        tried = set()
+        throttled = 0
+        while True:
+            try:
+                account = CREDENTIAL_POOL.pick(exclude=tried)
+            except NoAccountAvailable as e:
+                if e.retry_after is None or e.retry_after > RETRY_MAX_DELAY:
+                    raise
+                # Another file's 429 shouldn't cost this one a retry
+                count(COOLDOWN_SECONDS, e.retry_after, job_id)
+                await asyncio.sleep(e.retry_after)
+                tried.clear()
+                continue
+            client = CLIENT_REGISTRY.get(account)
+            try:
+                progress(FileState.UPLOADING, 25)
+                asset_id = await self.call(job_id, client.upload(f["path"]), stage="upload")
+                count(BYTES, os.path.getsize(f["path"]), job_id, "adobe_upload")
+                progress(FileState.CONVERTING, 55)
+                result_asset = await self._export(job_id, client, f, asset_id, account)
+                progress(FileState.FINALIZING, 90)
+                docx_bytes = await self.call(
+                    job_id, client.download(result_asset["downloadUri"]), stage="download"
+                )
+                count(BYTES, len(docx_bytes), job_id, "adobe_download")
+            except ServiceUsageException as e:
+                await asyncio.to_thread(CREDENTIAL_POOL.cool_down, account, e)
+                await asyncio.to_thread(publish_accounts, job_id)
+                throttled += 1
+                if throttled > RETRY_BUDGETS[ErrorClass.THROTTLED]:
+                    raise
+                tried.add(account.key)
+                continue
+            if not docx_bytes:
+                raise RuntimeError("Empty DOCX output")
+            return docx_bytes
+
+    async def convert(self, job_id, f, progress):
+        return await self._watch_outage(self._convert(job_id, f, progress))
+
+    async def resume(self, job_id, f, progress):
+        account = CREDENTIAL_POOL.get(f.get("account"))
+        try:
+            if account is None:
+                raise RuntimeError("the account that submitted it is no longer configured")
+            client = CLIENT_REGISTRY.get(account)
+            progress(FileState.CONVERTING, 55)
+            result_asset = await self.call(
+                job_id, JOB_POLLER.wait(f["location"], client), ADOBE_JOB_TIMEOUT,
+                stage="adobe_job",
+            )
+            progress(FileState.FINALIZING, 90)
+            docx_bytes = await self.call(
+                job_id, client.download(result_asset["downloadUri"]), stage="download"
+            )
+            count(BYTES, len(docx_bytes), job_id, "adobe_download")
+            if not docx_bytes:
+                raise RuntimeError("Empty DOCX output")
+        except Exception as e:
+            if classify(e) is ErrorClass.THROTTLED or (
+                classify(e) is ErrorClass.NETWORK and not isinstance(e, ServiceApiException)
+            ):
+                # Adobe wasn't reached or was busy: the job is probably still
+                # there, poll it again on the next try. A job that reports
+                # failure is submitted again.
+                raise
+            print(f"[WARN] Could not resume {f['name']}, converting again: {e}")
+            await self._forget_job(job_id, f)
+            return None
+        return docx_bytes
+
+
+class LocalBackend(ConversionBackend):
+    name = "local"
+    done_label = "Converted ✔ (offline)"
+
+    def __init__(self, workers: int = LOCAL_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, for the same reason as the CPU workers. Its own pool, so long
+            # conversions don't hold up merges and probes
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=exit_with_parent,
+            )
+        return self._executor
+
+    async def convert(self, job_id, f, progress):
+        progress(FileState.CONVERTING, 50)
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        with span("local_convert", job_id):
+            try:
+                return await loop.run_in_executor(executor, convert_pdf, f["path"])
+            except BrokenProcessPool:
+                # A converter died (crashed, out of memory...); the next file
+                # gets a new pool
+                if self._executor is executor:
+                    self._executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+ADOBE_BACKEND = AdobeBackend()
+LOCAL_BACKEND = LocalBackend()
+
+
+def local_fallback_allowed() -> bool:
+    return CONVERSION_POLICY in ("fallback", "auto")
+
+
+async def choose_backend(pages: "asyncio.Future[List[Dict]]") -> ConversionBackend:
+    """
+    Backend for one file under CONVERSION_POLICY.
+    pages - the file's page probe (awaited only by the "auto" policy)
+    """
+    if CONVERSION_POLICY == "local":
+        return LOCAL_BACKEND
+    if CONVERSION_POLICY == "adobe":
+        return ADOBE_BACKEND
+    if CONVERSION_POLICY == "auto":
+        probed = await pages
+        if probed and not any(p.get("fonts") for p in probed):
+            return LOCAL_BACKEND
+    if not ADOBE_BACKEND.breaker.allow():
+        return LOCAL_BACKEND
+    return ADOBE_BACKEND
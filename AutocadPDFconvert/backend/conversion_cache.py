@@ -0,0 +1,175 @@
+"""
+Persistent, content-addressed cache of converted DOCX files.
+
+Keyed by SHA-256 of the PDF bytes plus the export parameters (target format,
+OCR locale), so a re-submitted drawing set only spends Adobe quota on the
+sheets that actually changed. Entries live on disk as <root>/<ab>/<key>.docx;
+file mtime doubles as the LRU clock, so the index survives restarts.
+
+Every process (uvicorn and conversion workers) keeps its own index and
+re-reads the directory before evicting, and after a put once its view is
+older than CONVERSION_CACHE_RESCAN seconds. The size bound holds across
+processes, give or take what the others wrote since the last re-read.
+
+The same store, with a ".pdf" suffix, keeps the uploaded PDFs by hash
+(backend.pdf_store).
+"""
+import os
+import time
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional
+
+from backend.spool import link_or_copy
+
+CONVERSION_CACHE_RESCAN = float(os.getenv("CONVERSION_CACHE_RESCAN", "30"))
+
+
+def cache_key(digest: str, target_format: str, ocr_lang: str) -> str:
+    return hashlib.sha256(
+        f"{digest}:{target_format}:{ocr_lang}".encode()
+    ).hexdigest()
+
+
+class ConversionCache:
+    def __init__(self, root, max_bytes: int, suffix: str = ".docx"):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+        # key -> size, LRU first
+        self._index, self._total = self._scan()
+        self._scanned_at = time.monotonic()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{self.suffix}"
+
+    def _scan(self):
+        """(index, total bytes) of what is on disk, written by any process."""
+        entries = []
+        for path in self.root.glob(f"*/*{self.suffix}"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue   # evicted by another process meanwhile
+            entries.append((st.st_mtime, path.stem, st.st_size))
+        index: "OrderedDict[str, int]" = OrderedDict()
+        for _, key, size in sorted(entries):
+            index[key] = size
+        return index, sum(index.values())
+
+    def contains(self, key: str) -> bool:
+        """Whether `key` is on disk (written by any worker); not a hit or miss."""
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                # Another worker may have evicted it
+                if key in self._index:
+                    self._total -= self._index.pop(key)
+                self.misses += 1
+            return None
+        os.utime(path)
+        with self._lock:
+            if key not in self._index:
+                self._index[key] = len(data)
+                self._total += len(data)
+            self._index.move_to_end(key)
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if key in self._index:
+                self._total -= self._index.pop(key)
+            self._index[key] = len(data)
+            self._total += len(data)
+        self._evict()
+
+    def put_file(self, key: str, src):
+        """put() for a file on disk; linked rather than copied where possible."""
+        size = os.path.getsize(src)
+        if size > self.max_bytes:
+            return
+        path = self._path(key)
+        if path.exists():
+            os.utime(path)
+        else:
+            link_or_copy(src, path)
+        with self._lock:
+            if key in self._index:
+                self._total -= self._index.pop(key)
+            self._index[key] = size
+            self._total += size
+        self._evict()
+
+    def link_to(self, key: str, dest) -> bool:
+        """Put entry `key` at `dest` (a link where possible); False if it's gone."""
+        path = self._path(key)
+        try:
+            link_or_copy(path, dest)
+        except FileNotFoundError:
+            with self._lock:
+                if key in self._index:
+                    self._total -= self._index.pop(key)
+            return False
+        os.utime(path)
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        return True
+
+    def _evict(self):
+        # Other processes write to the same directory: count their entries too
+        if (self._total > self.max_bytes
+                or time.monotonic() - self._scanned_at > CONVERSION_CACHE_RESCAN):
+            index, total = self._scan()
+            with self._lock:
+                self._index, self._total = index, total
+                self._scanned_at = time.monotonic()
+        with self._lock:
+            while self._total > self.max_bytes and self._index:
+                key, size = self._index.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+                try:
+                    self._path(key).unlink()
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+
+CONVERSION_CACHE = ConversionCache(
+    os.getenv(
+        "CONVERSION_CACHE_DIR",
+        str(Path(__file__).resolve().parent / "cache"),
+    ),
+    int(float(os.getenv("CONVERSION_CACHE_MAX_MB", "2048")) * 1024 * 1024),
+)
@@ -0,0 +1,145 @@
+"""
+Worker processes for CPU-bound stages (page probing, DOCX merging).
+
+docxcompose, lxml and pypdf hold the GIL while they work, so running
+them in a thread still stalls the event loop: status polls, SSE and every
+other batch wait until a merge step finishes. CpuExecutor runs them in
+CPU_WORKERS processes instead, started and warmed up (imports done) when
+the app starts so the first batch doesn't pay for it.
+
+Each worker is its own single-process "lane". Stateless work (run) goes to
+the least busy lane; stateful work, such as one batch's combined document,
+reserves a lane (reserve) and keeps its state in that process between
+calls (run_on). Only file paths and small dicts cross the process
+boundary, never the document bytes.
+
+CPU_WORKERS=0 runs everything in threads, as before.
+"""
+import os
+import asyncio
+import threading
+import multiprocessing
+import multiprocessing.connection
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+from backend.metrics import METRICS
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def exit_with_parent():
+    """Pool initializer: don't outlive a server process that was killed."""
+    parent = multiprocessing.parent_process()
+    if parent is None:
+        return
+
+    def watch():
+        multiprocessing.connection.wait([parent.sentinel])
+        os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def _warm_up() -> int:
+    # Pay for the heavy imports now rather than in the first batch
+    import backend.docx_merge  # noqa: F401
+    import backend.pdf_probe  # noqa: F401
+    return os.getpid()
+
+
+class CpuExecutor:
+    def __init__(self, workers: int = CPU_WORKERS):
+        self.workers = workers
+        self._lanes: List[Optional[ProcessPoolExecutor]] = [None] * workers
+        self._busy = [0] * workers
+        self._reserved = [0] * workers
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _lane(self, index: int) -> ProcessPoolExecutor:
+        with self._lock:
+            lane = self._lanes[index]
+            if lane is None:
+                # spawn, not fork: forked workers would inherit (and keep bound)
+                # uvicorn's listening socket if the server process dies
+                lane = self._lanes[index] = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=exit_with_parent,
+                )
+            return lane
+
+    async def start(self):
+        """Start every worker and load the heavy modules in it."""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._lane(i), _warm_up) for i in range(self.workers)
+        ))
+
+    def reserve(self) -> int:
+        """Pick a lane for stateful work; pair with release()."""
+        with self._lock:
+            index = min(range(self.workers), key=lambda i: (self._reserved[i], self._busy[i]))
+            self._reserved[index] += 1
+            return index
+
+    def release(self, index: int):
+        with self._lock:
+            self._reserved[index] -= 1
+
+    async def run_on(self, index: int, fn: Callable, *args):
+        """Run fn(*args) in lane `index`."""
+        loop = asyncio.get_running_loop()
+        self._busy[index] += 1
+        try:
+            return await loop.run_in_executor(self._lane(index), fn, *args)
+        except BrokenProcessPool:
+            # The worker died (killed, out of memory...); the next call gets a new one
+            with self._lock:
+                self._lanes[index] = None
+            raise
+        finally:
+            self._busy[index] -= 1
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) in the least busy worker (a thread when disabled)."""
+        if not self.enabled:
+            return await asyncio.to_thread(fn, *args)
+        index = min(range(self.workers), key=lambda i: (self._busy[i], self._reserved[i]))
+        return await self.run_on(index, fn, *args)
+
+    def snapshot(self):
+        return {"workers": self.workers, "busy": list(self._busy), "reserved": list(self._reserved)}
+
+    def shutdown(self):
+        with self._lock:
+            lanes, self._lanes = self._lanes, [None] * self.workers
+        for lane in lanes:
+            if lane is not None:
+                lane.shutdown(wait=False, cancel_futures=True)
+
+
+CPU_EXECUTOR = CpuExecutor()
+
+
+def _lane_values(key: str):
+    def collect():
+        return {(str(i),): n for i, n in enumerate(CPU_EXECUTOR.snapshot()[key])}
+    return collect
+
+
+METRICS.gauge(
+    "cpu_lane_busy", "Calls running or waiting in each CPU worker process",
+    ("lane",), _lane_values("busy"),
+)
+METRICS.gauge(
+    "cpu_lane_reserved", "Combined documents kept in each CPU worker process",
+    ("lane",), _lane_values("reserved"),
+)
@@ -0,0 +1,196 @@
+"""
+Adobe PDF Services accounts shared out between conversions.
+
+Every account only gets a fixed number of Document Transactions a month
+(500 on the free tier), so one account running dry used to stop the whole
+pipeline. Accounts are loaded from the PDF_SERVICES_CLIENT_ID/SECRET
+environment variables and from the credentials JSON file, which may hold
+one account in the format the Adobe console downloads or a list of them.
+
+Transactions used per account and calendar month are counted in JOB_STORE,
+so every worker sees the same numbers and they survive restarts. pick()
+hands out the account with the most quota left. An account that answers
+with ServiceUsageException is cooled down: for its Retry-After when the
+service sent one, until the end of the month when its quota is exhausted.
+"""
+import os
+import json
+import time
+import calendar
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from adobe.pdfservices.operation.exception.exceptions import ServiceUsageException
+
+from backend.job_store import JOB_STORE, JobStore
+
+ADOBE_CREDENTIALS_FILE = os.getenv(
+    "PDF_SERVICES_CREDENTIALS_FILE",
+    str(Path(__file__).resolve().parent / "pdfservices-api-credentials.json"),
+)
+
+# Transactions each account may use per month, unless its entry says otherwise
+ADOBE_MONTHLY_QUOTA = int(os.getenv("ADOBE_MONTHLY_QUOTA", "500"))
+
+# How long a throttled account sits out when the service gives no Retry-After
+ACCOUNT_COOLDOWN_SECONDS = float(os.getenv("ACCOUNT_COOLDOWN_SECONDS", "60"))
+
+
+class AdobeAccount:
+    def __init__(self, client_id: str, client_secret: str, quota: int):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.quota = quota
+
+    @property
+    def key(self) -> str:
+        # The client id is sent in every request header; the secret never leaves here
+        return self.client_id
+
+    @property
+    def label(self) -> str:
+        return self.client_id[:8] + "…"
+
+
+class NoAccountAvailable(ServiceUsageException):
+    """Every account is exhausted or cooling down."""
+
+    def __init__(self, retry_after: Optional[float]):
+        super().__init__(
+            "No Adobe account has quota left", None, 429, "NO_ACCOUNT_AVAILABLE"
+        )
+        self.retry_after = retry_after
+
+
+def _account_from_entry(entry: Dict) -> Optional[AdobeAccount]:
+    """One credentials entry, as downloaded from the console or plain keys."""
+    if "client_credentials" in entry:
+        entry = dict(entry, **entry["client_credentials"])
+    client_id = entry.get("CLIENT_ID") or entry.get("client_id")
+    secrets = entry.get("CLIENT_SECRETS") or [
+        entry.get("CLIENT_SECRET") or entry.get("client_secret")
+    ]
+    quota = int(entry.get("MONTHLY_QUOTA") or entry.get("monthly_quota")
+                or ADOBE_MONTHLY_QUOTA)
+    if not client_id or not secrets[0]:
+        return None
+    return AdobeAccount(client_id, secrets[0], quota)
+
+
+def load_accounts(path: str = ADOBE_CREDENTIALS_FILE) -> List[AdobeAccount]:
+    accounts = []
+    env_id = os.getenv("PDF_SERVICES_CLIENT_ID")
+    env_secret = os.getenv("PDF_SERVICES_CLIENT_SECRET")
+    if env_id and env_secret:
+        accounts.append(AdobeAccount(env_id, env_secret, ADOBE_MONTHLY_QUOTA))
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Could not read {path}: {e}")
+            data = []
+        if isinstance(data, dict):
+            data = data.get("accounts", [data])
+        for entry in data:
+            account = _account_from_entry(entry)
+            if account is not None:
+                accounts.append(account)
+    unique = {}
+    for account in accounts:
+        unique.setdefault(account.key, account)
+    return list(unique.values())
+
+
+def current_period() -> str:
+    return time.strftime("%Y-%m", time.gmtime())
+
+
+def _period_end(period: str) -> float:
+    year, month = map(int, period.split("-"))
+    if month == 12:
+        year, month = year + 1, 1
+    else:
+        month += 1
+    return float(calendar.timegm((year, month, 1, 0, 0, 0)))
+
+
+def _is_quota_error(error: BaseException) -> bool:
+    text = f"{getattr(error, 'error_code', '')} {getattr(error, 'message', error)}"
+    return "quota" in text.lower()
+
+
+class CredentialPool:
+    def __init__(self, accounts: List[AdobeAccount], store: JobStore):
+        self.accounts = accounts
+        self.store = store
+        self._by_key = {a.key: a for a in accounts}
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def get(self, key: Optional[str]) -> Optional[AdobeAccount]:
+        return self._by_key.get(key)
+
+    def pick(self, exclude=()) -> AdobeAccount:
+        """
+        The usable account with the most transactions left this month.
+        Raises NoAccountAvailable when there is none.
+        """
+        now = time.time()
+        period = current_period()
+        usage = self.store.get_account_usage(period)
+        best, best_left = None, 0
+        next_free = None
+        for account in self.accounts:
+            u = usage.get(account.key, {})
+            left = account.quota - u.get("used", 0)
+            if u.get("exhausted") or left <= 0:
+                # Free again when the quota resets
+                next_free = min(next_free or _period_end(period), _period_end(period))
+                continue
+            cooldown_until = u.get("cooldown_until", 0)
+            if cooldown_until > now:
+                next_free = min(next_free or cooldown_until, cooldown_until)
+                continue
+            if account.key in exclude:
+                continue
+            if left > best_left:
+                best, best_left = account, left
+        if best is None:
+            raise NoAccountAvailable(next_free - now if next_free else None)
+        return best
+
+    def record_transaction(self, account: AdobeAccount, transactions: int = 1):
+        self.store.add_account_usage(account.key, current_period(), transactions)
+
+    def cool_down(self, account: AdobeAccount, error: BaseException):
+        """Take an account out of rotation after a ServiceUsageException."""
+        period = current_period()
+        if _is_quota_error(error):
+            print(f"[WARN] Adobe account {account.label} is out of quota")
+            self.store.cool_down_account(
+                account.key, period, _period_end(period), exhausted=True
+            )
+            return
+        retry_after = getattr(error, "retry_after", None) or ACCOUNT_COOLDOWN_SECONDS
+        print(f"[WARN] Adobe account {account.label} throttled for {retry_after:.1f}s")
+        self.store.cool_down_account(account.key, period, time.time() + retry_after)
+
+    def snapshot(self) -> List[Dict]:
+        now = time.time()
+        usage = self.store.get_account_usage(current_period())
+        accounts = []
+        for account in self.accounts:
+            u = usage.get(account.key, {})
+            accounts.append({
+                "account": account.label,
+                "used": u.get("used", 0),
+                "quota": account.quota,
+                "exhausted": u.get("exhausted", False),
+                "cooling_for": round(max(0.0, u.get("cooldown_until", 0) - now), 1),
+            })
+        return accounts
+
+
+CREDENTIAL_POOL = CredentialPool(load_accounts(), JOB_STORE)
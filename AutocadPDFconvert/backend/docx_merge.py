@@ -0,0 +1,355 @@
+"""
+Incremental DOCX merge for the combined document.
+
+Documents are appended to the combined document as their conversions
+finish, one at a time and in input order. The job's merge task
+(backend.pipeline.merge_job) runs after each file finishes and appends
+every file up to the first one still converting; files that finish out
+of order wait in the job store, as artifacts on disk, until the ones
+before them are in. Each source is parsed just before it is appended and
+dropped afterwards.
+
+In low-memory mode the combined body is flushed to a fragment file after
+every append and spliced back into word/document.xml when the file is saved.
+This keeps the in-memory tree to one document at a time. Parts such as
+images, styles and numbering still stay in memory.
+
+The document is built in one CPU worker process (backend.cpu_executor),
+reserved for the merge, so parsing and composing don't hold the event
+loop's GIL; only paths and page sizes are sent to it.
+"""
+import os
+import re
+import time
+import uuid
+import shutil
+import asyncio
+import zipfile
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from docx import Document
+from docx.enum.section import WD_ORIENT, WD_SECTION
+from docx.shared import Pt
+from docxcompose.composer import Composer
+from docxcompose.utils import NS, xpath
+from lxml import etree
+
+from backend.cpu_executor import CPU_EXECUTOR
+from backend.metrics import span
+
+BODY_OPEN_TAG = re.compile(rb"<w:body(\s[^>]*)?>")
+W_ID = "{%s}id" % NS["w"]
+
+
+def _apply_page_size(section, page_size):
+    width_pt, height_pt = page_size
+
+    # Orientation
+    if width_pt > height_pt:
+        section.orientation = WD_ORIENT.LANDSCAPE
+        section.page_width = Pt(width_pt)
+        section.page_height = Pt(height_pt)
+    else:
+        section.orientation = WD_ORIENT.PORTRAIT
+        section.page_width = Pt(width_pt)
+        section.page_height = Pt(height_pt)
+
+    # 🔴 CRITICAL: remove margins
+    section.top_margin = Pt(12)
+    section.bottom_margin = Pt(12)
+    section.left_margin = Pt(12)
+    section.right_margin = Pt(12)
+
+
+def _apply_page_sizes(sections, page_sizes: List[Tuple[float, float]]):
+    """
+    Size the sections holding one source document. When the converter made
+    one section per PDF page they are sized page by page; otherwise the
+    document's last section gets its most common page size.
+    """
+    if not page_sizes:
+        return
+    if len(sections) == len(page_sizes):
+        for section, size in zip(sections, page_sizes):
+            _apply_page_size(section, size)
+        return
+    rounded = [(round(w, 1), round(h, 1)) for w, h in page_sizes]
+    _apply_page_size(sections[-1], Counter(rounded).most_common(1)[0][0])
+
+
+class FlushingComposer(Composer):
+    """
+    Composer whose body can be written out between appends.
+
+    docxcompose renumbers bookmark and drawing ids from scratch over the
+    whole body on every append. Once earlier content has been flushed, ids
+    have to continue after the ones already written out.
+    """
+
+    def __init__(self, doc):
+        super().__init__(doc)
+        self.flushed_bookmarks = 0
+        self.flushed_docprs = 0
+        self.flushed_cnvprs = 0
+
+    def renumber_bookmarks(self):
+        super().renumber_bookmarks()
+        for path in (".//w:bookmarkStart", ".//w:bookmarkEnd"):
+            _shift_ids(self.doc.element.body, path, W_ID, self.flushed_bookmarks)
+
+    def renumber_docpr_ids(self):
+        super().renumber_docpr_ids()
+        for element in self._id_scopes():
+            _shift_ids(element, ".//wp:docPr", "id", self.flushed_docprs)
+
+    def renumber_nvpicpr_ids(self):
+        super().renumber_nvpicpr_ids()
+        for element in self._id_scopes():
+            _shift_ids(element, ".//pic:cNvPr", "id", self.flushed_cnvprs)
+
+    def _id_scopes(self):
+        yield self.doc.element.body
+        for rel in self.doc.part.rels.values():
+            if rel.reltype.endswith(("/header", "/footer")):
+                yield rel.target_part.element
+
+    def flush_body(self, out):
+        """Write every body element except the final sectPr to `out`."""
+        body = self.doc.element.body
+        for element in list(body)[:-1]:
+            self.flushed_bookmarks += len(xpath(element, ".//w:bookmarkStart"))
+            self.flushed_docprs += len(xpath(element, ".//wp:docPr"))
+            self.flushed_cnvprs += len(xpath(element, ".//pic:cNvPr"))
+            out.write(etree.tostring(element, encoding="utf-8"))
+            body.remove(element)
+
+
+def _shift_ids(element, path: str, attr: str, offset: int):
+    if not offset:
+        return
+    for node in xpath(element, path):
+        node.set(attr, str(int(node.get(attr)) + offset))
+
+
+class _MergeState:
+    """The combined document, built in whichever process runs the merge."""
+
+    def __init__(self, work_dir: str, low_memory: bool):
+        self.work_dir = work_dir
+        self.low_memory = low_memory
+        self._master = None
+        self._composer = None
+        self._fragment = None
+        self._fragment_path = os.path.join(work_dir, "combined.body.xml")
+
+    def append(self, item: Dict) -> float:
+        """Append one source document; returns the seconds it took."""
+        t0 = time.perf_counter()
+        if self._composer is None:
+            self._master = Document(item["path"])
+            composer_cls = FlushingComposer if self.low_memory else Composer
+            self._composer = composer_cls(self._master)
+            _apply_page_sizes(list(self._master.sections), item["page_sizes"])
+        else:
+            # 🔴 NEW SECTION (not page break)
+            self._master.add_section(WD_SECTION.NEW_PAGE)
+            source = Document(item["path"])
+            source_sections = len(source.sections)
+            self._composer.append(source)
+            del source
+            sections = list(self._master.sections)[-source_sections:]
+            _apply_page_sizes(sections, item["page_sizes"])
+        if self.low_memory:
+            if self._fragment is None:
+                os.makedirs(self.work_dir, exist_ok=True)
+                self._fragment = open(self._fragment_path, "wb")
+            self._composer.flush_body(self._fragment)
+        return time.perf_counter() - t0
+
+    def save(self, path: str) -> float:
+        """Write the combined document to `path`; returns the seconds it took."""
+        t0 = time.perf_counter()
+        tmp = path + ".tmp"
+        if not self.low_memory:
+            self._composer.save(tmp)
+        else:
+            self._fragment.close()
+            skeleton = path + ".skeleton"
+            self._composer.save(skeleton)
+            part_name = self._master.part.partname.lstrip("/")
+            _splice_body(skeleton, part_name, self._fragment_path, tmp)
+            os.remove(skeleton)
+        os.replace(tmp, path)
+        return time.perf_counter() - t0
+
+    def close(self):
+        if self._fragment is not None:
+            self._fragment.close()
+            try:
+                os.remove(self._fragment_path)
+            except FileNotFoundError:
+                pass
+            self._fragment = None
+        self._master = None
+        self._composer = None
+
+
+# --------------------------------------------------
+# Run in a CPU worker (or a thread when CPU_WORKERS=0)
+# --------------------------------------------------
+# merge id -> the merge's state, in the process its lane runs
+_states: Dict[str, _MergeState] = {}
+
+
+def _remote_append(merge_id: str, work_dir: str, low_memory: bool,
+                   item: Dict, first: bool) -> float:
+    state = _states.get(merge_id)
+    if state is None:
+        if not first:
+            # The worker was restarted and the document so far went with it
+            raise RuntimeError("Combined document lost (merge worker restarted)")
+        state = _states[merge_id] = _MergeState(work_dir, low_memory)
+    return state.append(item)
+
+
+def _remote_save(merge_id: str, path: str) -> float:
+    state = _states.pop(merge_id, None)
+    if state is None:
+        raise RuntimeError("Combined document lost (merge worker restarted)")
+    try:
+        return state.save(path)
+    finally:
+        state.close()
+
+
+def _remote_close(merge_id: str):
+    state = _states.pop(merge_id, None)
+    if state is not None:
+        state.close()
+
+
+class IncrementalMerger:
+    def __init__(self, work_dir, low_memory: bool = False, job_id: Optional[str] = None):
+        """
+        work_dir   - where the low-memory body fragment is kept
+        low_memory - flush the combined body to disk after every append
+        job_id     - job the merge timings are reported for
+        """
+        self.work_dir = str(work_dir)
+        self.low_memory = low_memory
+        self.job_id = job_id
+        self.count = 0
+        self.error: Optional[str] = None
+        self._id = uuid.uuid4().hex
+        self._lock = asyncio.Lock()
+        # CPU worker holding the document, reserved on the first append
+        self._lane: Optional[int] = None
+        self._open = False
+        self._metrics = {
+            "append_seconds": 0.0,
+            "max_append_seconds": 0.0,
+            "save_seconds": 0.0,
+        }
+        self._started = None
+        self._finished = None
+
+    async def _call(self, fn, *args):
+        if not CPU_EXECUTOR.enabled:
+            return await asyncio.to_thread(fn, *args)
+        if self._lane is None:
+            self._lane = CPU_EXECUTOR.reserve()
+        return await CPU_EXECUTOR.run_on(self._lane, fn, *args)
+
+    async def add(self, docx_path: str, page_sizes: List[Tuple[float, float]]):
+        """page_sizes - displayed (width, height) of every page of the source PDF"""
+        async with self._lock:
+            if self.error:
+                return
+            if self._started is None:
+                self._started = time.perf_counter()
+            try:
+                with span("merge_append", self.job_id):
+                    self._open = True
+                    elapsed = await self._call(
+                        _remote_append, self._id, self.work_dir, self.low_memory,
+                        {"path": docx_path, "page_sizes": page_sizes}, self.count == 0,
+                    )
+            except Exception as e:
+                self.error = str(e)
+                print("[WARN] DOCX merge failed:", e)
+                await self._close()
+                return
+            self.count += 1
+            self._metrics["append_seconds"] += elapsed
+            self._metrics["max_append_seconds"] = max(
+                self._metrics["max_append_seconds"], elapsed
+            )
+
+    async def save(self, path: str) -> bool:
+        """Write the combined document to `path`; False if there is none."""
+        async with self._lock:
+            if self.error or self.count < 2:
+                await self._close()
+                return False
+            try:
+                with span("merge_save", self.job_id):
+                    self._open = False
+                    self._metrics["save_seconds"] = await self._call(
+                        _remote_save, self._id, path
+                    )
+                self._finished = time.perf_counter()
+            except Exception as e:
+                self.error = str(e)
+                print("[WARN] DOCX merge failed:", e)
+                return False
+            finally:
+                await self._close()
+            return True
+
+    async def close(self):
+        """Drop the combined document without saving it (batch cancelled)."""
+        async with self._lock:
+            await self._close()
+
+    async def _close(self):
+        if self._open:
+            self._open = False
+            try:
+                await self._call(_remote_close, self._id)
+            except Exception as e:
+                print("[WARN] Could not release the DOCX merge:", e)
+        if self._lane is not None:
+            CPU_EXECUTOR.release(self._lane)
+            self._lane = None
+
+    def snapshot(self) -> Dict:
+        snapshot = {
+            "mode": "low_memory" if self.low_memory else "in_memory",
+            "appended": self.count,
+            "error": self.error,
+        }
+        snapshot.update({k: round(v, 3) for k, v in self._metrics.items()})
+        if self._started is not None:
+            end = self._finished or time.perf_counter()
+            snapshot["elapsed_seconds"] = round(end - self._started, 3)
+        return snapshot
+
+
+def _splice_body(skeleton: str, part_name: str, fragment_path: str, out_path: str):
+    """Copy `skeleton`, inserting the fragment at the start of the document body."""
+    with zipfile.ZipFile(skeleton) as zin, \
+         zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            if info.filename != part_name:
+                zout.writestr(info, zin.read(info))
+                continue
+            xml = zin.read(info)
+            match = BODY_OPEN_TAG.search(xml)
+            if match is None:
+                raise RuntimeError("Combined document has no body")
+            with zout.open(info.filename, "w", force_zip64=True) as dst, \
+                 open(fragment_path, "rb") as fragment:
+                dst.write(xml[:match.end()])
+                shutil.copyfileobj(fragment, dst, 1024 * 1024)
+                dst.write(xml[match.end():])
@@ -0,0 +1,239 @@
+"""
+Local stand-in for the Adobe PDF Services REST API.
+
+Implements just enough of the endpoints used by the ExportPDF flow
+(token, /assets, upload, /operation/exportpdf, status polling, download)
+to drive the backend without credentials or quota. Latency, failed jobs
+and throttling can be injected for benchmarks (backend.bench_batch).
+
+Run standalone:
+    python -m backend.fake_pdf_services --port 8765 --latency 2
+and point the backend at it with PDF_SERVICES_URI=http://127.0.0.1:8765
+"""
+import io
+import time
+import random
+import uuid
+import asyncio
+import argparse
+import threading
+from typing import Dict, Optional
+
+import httpx
+import uvicorn
+from docx import Document
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+
+def _sample_docx() -> bytes:
+    doc = Document()
+    doc.add_paragraph("Converted by fake PDF Services")
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def create_app(latency: float = 2.0, retry_after: float = 0.5,
+               quota: Optional[int] = None, latency_per_mb: float = 0.0,
+               jitter: float = 0.0, failure_rate: float = 0.0,
+               throttle_rate: float = 0.0, seed: Optional[int] = None) -> FastAPI:
+    """
+    latency        - seconds an ExportPDF job stays "in progress"
+    retry_after    - value of the retry-after header on status polls
+    quota          - ExportPDF jobs each client id may submit (None: unlimited)
+    latency_per_mb - extra job seconds per MB of the uploaded PDF
+    jitter         - job latency varies by up to this fraction either way
+    failure_rate   - fraction of jobs that end "failed" (500 INTERNAL_ERROR)
+    throttle_rate  - fraction of API calls answered 429 with retry-after
+    seed           - makes the injected failures and throttling repeatable
+    """
+    app = FastAPI(title="Fake PDF Services")
+    app.state.latency = latency
+    app.state.retry_after = retry_after
+    app.state.quota = quota
+    app.state.stats = {
+        "tokens": 0, "uploads": 0, "jobs": 0, "polls": 0, "downloads": 0,
+        "failed": 0, "throttled": 0,
+    }
+    app.state.usage: Dict[str, int] = {}
+
+    assets: Dict[str, bytes] = {}
+    jobs: Dict[str, Dict] = {}
+    docx_bytes = _sample_docx()
+    callbacks = set()
+    rng = random.Random(seed)
+
+    @app.middleware("http")
+    async def throttle(request: Request, call_next):
+        api_call = request.url.path.startswith(("/assets", "/operation"))
+        if api_call and throttle_rate and rng.random() < throttle_rate:
+            app.state.stats["throttled"] += 1
+            return JSONResponse(
+                {"error": {"code": "TOO_MANY_REQUESTS",
+                           "message": "Too many requests"}},
+                status_code=429,
+                headers={"retry-after": str(app.state.retry_after)},
+            )
+        return await call_next(request)
+
+    def job_latency(asset_id: str) -> float:
+        size_mb = len(assets.get(asset_id, b"")) / (1024 * 1024)
+        seconds = app.state.latency + latency_per_mb * size_mb
+        return seconds * rng.uniform(1 - jitter, 1 + jitter)
+
+    async def fire_callbacks(job_id: str, notifiers):
+        await asyncio.sleep(app.state.latency)
+        async with httpx.AsyncClient() as client:
+            for notifier in notifiers:
+                data = notifier.get("data") or {}
+                try:
+                    await client.post(
+                        data["url"],
+                        json={"jobId": job_id, "status": "done"},
+                        headers=data.get("headers") or {},
+                    )
+                except httpx.HTTPError:
+                    pass
+
+    def base_url(request: Request) -> str:
+        return str(request.base_url).rstrip("/")
+
+    @app.post("/token")
+    async def token():
+        app.state.stats["tokens"] += 1
+        return {
+            "access_token": "fake-" + uuid.uuid4().hex,
+            "token_type": "bearer",
+            "expires_in": 86399,
+        }
+
+    @app.post("/assets")
+    async def create_asset(request: Request):
+        asset_id = "urn:aaid:fake:" + uuid.uuid4().hex
+        return {
+            "assetID": asset_id,
+            "uploadUri": f"{base_url(request)}/upload/{asset_id}",
+        }
+
+    @app.put("/upload/{asset_id}")
+    async def upload(asset_id: str, request: Request):
+        assets[asset_id] = await request.body()
+        app.state.stats["uploads"] += 1
+        return Response(status_code=200)
+
+    @app.post("/operation/exportpdf")
+    async def export_pdf(request: Request):
+        client_id = request.headers.get("x-api-key", "")
+        used = app.state.usage.get(client_id, 0)
+        if app.state.quota is not None and used >= app.state.quota:
+            return JSONResponse(
+                {"error": {"code": "QUOTA_EXCEEDED",
+                           "message": "Transaction quota exhausted"}},
+                status_code=429,
+            )
+        app.state.usage[client_id] = used + 1
+        body = await request.json()
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = {
+            "asset_id": body.get("assetID"),
+            "ready_at": time.monotonic() + job_latency(body.get("assetID")),
+            "fails": bool(failure_rate) and rng.random() < failure_rate,
+        }
+        app.state.stats["jobs"] += 1
+        if body.get("notifiers"):
+            task = asyncio.create_task(fire_callbacks(job_id, body["notifiers"]))
+            callbacks.add(task)
+            task.add_done_callback(callbacks.discard)
+        location = f"{base_url(request)}/operation/exportpdf/{job_id}/status"
+        return Response(
+            status_code=201,
+            headers={"location": location, "x-request-id": job_id},
+        )
+
+    @app.get("/operation/exportpdf/{job_id}/status")
+    async def job_status(job_id: str, request: Request):
+        app.state.stats["polls"] += 1
+        job = jobs.get(job_id)
+        if job is None:
+            return JSONResponse(
+                {"error": {"code": "NOT_FOUND", "message": "Unknown job"}},
+                status_code=404,
+            )
+        if time.monotonic() < job["ready_at"]:
+            return JSONResponse(
+                {"status": "in progress"},
+                headers={"retry-after": str(app.state.retry_after)},
+            )
+        if job["fails"]:
+            if not job.get("counted"):
+                job["counted"] = True
+                app.state.stats["failed"] += 1
+            return JSONResponse({
+                "status": "failed",
+                "error": {"code": "INTERNAL_ERROR", "status": 500,
+                          "message": "Injected failure"},
+            })
+        result_id = "urn:aaid:fake:" + job_id
+        return JSONResponse({
+            "status": "done",
+            "asset": {
+                "assetID": result_id,
+                "downloadUri": f"{base_url(request)}/download/{job_id}",
+            },
+        })
+
+    @app.get("/download/{job_id}")
+    async def download(job_id: str):
+        app.state.stats["downloads"] += 1
+        return Response(
+            content=docx_bytes,
+            media_type=(
+                "application/vnd.openxmlformats-officedocument"
+                ".wordprocessingml.document"
+            ),
+        )
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def serve_in_thread(app: FastAPI, port: int = 0, host: str = "127.0.0.1"):
+    """Start uvicorn in a daemon thread; returns (server, base_url)."""
+    config = uvicorn.Config(app, host=host, port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    return server, f"http://{host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--quota", type=int, default=None)
+    parser.add_argument("--latency-per-mb", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    app = create_app(
+        latency=args.latency, retry_after=args.retry_after, quota=args.quota,
+        latency_per_mb=args.latency_per_mb, jitter=args.jitter,
+        failure_rate=args.failure_rate, throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
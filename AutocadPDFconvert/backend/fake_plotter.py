@@ -0,0 +1,50 @@
+"""
+Stand-in for AutoCAD's accoreconsole, for running the plotter without AutoCAD.
+
+Takes the same arguments (/i drawing.dwg /s script.scr), reads the paper
+size and output path from the script the way the real plot command would,
+and writes a one-page PDF of that size. An empty drawing fails like a
+broken one would: a console message and no PDF.
+
+    PLOTTER_COMMAND="python -m backend.fake_plotter"
+"""
+import os
+import sys
+import time
+
+from pypdf import PdfWriter
+
+from backend.plotter import PAPER_SIZES
+
+MM_TO_PT = 72 / 25.4
+
+
+def main():
+    # accoreconsole style "/i <path>" pairs; argparse would take absolute
+    # POSIX paths for options, so read them by hand
+    argv = sys.argv[1:]
+    args = {argv[i].lower(): argv[i + 1] for i in range(0, len(argv) - 1, 2)}
+    drawing, script = args["/i"], args["/s"]
+    delay = float(os.getenv("FAKE_PLOT_DELAY", "0.5"))
+
+    with open(script, encoding="utf-8") as fh:
+        lines = [line.strip().strip('"') for line in fh]
+    media = {name: (w, h) for name, w, h in PAPER_SIZES.values()}
+    size = next(media[line] for line in lines if line in media)
+    output = next(line for line in lines if line.lower().endswith(".pdf"))
+    output = output.replace("\\\\", "\\")
+
+    if os.path.getsize(drawing) == 0:
+        print(f"Drawing file {drawing} is invalid.")
+        return 1
+    time.sleep(delay)
+    writer = PdfWriter()
+    writer.add_blank_page(width=size[0] * MM_TO_PT, height=size[1] * MM_TO_PT)
+    with open(output, "wb") as fh:
+        writer.write(fh)
+    print(f"Effective plotting area: {size[0]} x {size[1]} mm -> {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Central status poller for submitted ExportPDF jobs.
+
+Instead of every file looping on its own status URL, callers register the
+`location` returned by submit and await a future. One asyncio task keeps a
+schedule of all outstanding locations and polls each when it is due,
+honouring the retry-after the service returns for that job.
+
+Webhook mode: when CALLBACK_BASE_URL is set, jobs are submitted with a
+CALLBACK notifier (the SDK's notify_config_list format) pointing at
+/convert/callback/{token}. Such jobs are not polled on a timer; the callback
+marks them due and a single status request collects the result.
+CALLBACK_FALLBACK_POLL (seconds, 0 = never) polls them anyway in case a
+callback is lost.
+"""
+import json
+import heapq
+import itertools
+import os
+import time
+import uuid
+import asyncio
+from typing import Dict, List, Optional
+
+from adobe.pdfservices.operation.config.notifier.callback_notifier_data import (
+    CallbackNotifierData,
+)
+from adobe.pdfservices.operation.config.notifier.notifier_config import NotifierConfig
+from adobe.pdfservices.operation.config.notifier.notifier_type import NotifierType
+from adobe.pdfservices.operation.exception.exceptions import SdkException
+
+from backend.adobe_client import JobFailed
+from backend.retry_policy import ErrorClass, classify
+
+CALLBACK_BASE_URL = os.getenv("CALLBACK_BASE_URL")
+CALLBACK_FALLBACK_POLL = float(os.getenv("CALLBACK_FALLBACK_POLL", "60"))
+
+# Consecutive network, 5xx or 429 errors tolerated for one job before giving up
+MAX_POLL_ERRORS = 5
+
+
+class JobPoller:
+    def __init__(self, max_interval: float = 30.0):
+        self.max_interval = max_interval
+        # None turns webhooks off (a conversion worker can't receive them)
+        self.callback_base_url = CALLBACK_BASE_URL
+        self._jobs: Dict[str, Dict] = {}
+        self._tokens: Dict[str, str] = {}   # callback token -> location
+        self._early_callbacks = set()
+        self._schedule: List = []           # heap of (due, seq, location)
+        self._seq = itertools.count()
+        self._in_flight = set()
+        self._poll_tasks = set()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # --------------------------------------------------
+    # Webhook helpers
+    # --------------------------------------------------
+    def new_callback(self):
+        """Return (token, notifiers) for a submit, or (None, None) if disabled."""
+        if not self.callback_base_url:
+            return None, None
+        token = uuid.uuid4().hex
+        config = NotifierConfig(
+            NotifierType.CALLBACK,
+            CallbackNotifierData(f"{self.callback_base_url.rstrip('/')}/{token}"),
+        )
+        return token, [json.loads(config.to_json())]
+
+    def notify(self, token: str) -> bool:
+        """A callback arrived for `token`: poll that job right away."""
+        location = self._tokens.get(token)
+        if location is None:
+            # Callback can beat watch() if the job finishes very quickly
+            self._early_callbacks.add(token)
+            return False
+        self._reschedule(location, 0)
+        return True
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def watch(self, location: str, client, token: Optional[str] = None) -> asyncio.Future:
+        """Start tracking `location`; the future resolves to the result asset."""
+        if location in self._jobs:
+            return self._jobs[location]["future"]
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        self._jobs[location] = {
+            "client": client,
+            "future": future,
+            "token": token,
+            "errors": 0,
+            "polls": 0,
+        }
+        # A waiter that is cancelled (lease lost, shutdown) stops the tracking,
+        # even for a webhook job that is never polled on a timer
+        future.add_done_callback(lambda done: self._forget_future(location, done))
+        if token is None:
+            delay = 0
+        elif token in self._early_callbacks:
+            self._early_callbacks.discard(token)
+            delay = 0
+        else:
+            self._tokens[token] = location
+            delay = CALLBACK_FALLBACK_POLL or None
+        if delay is not None:
+            self._reschedule(location, delay)
+        return future
+
+    async def wait(self, location: str, client, token: Optional[str] = None) -> Dict:
+        return await self.watch(location, client, token)
+
+    def snapshot(self) -> Dict:
+        return {
+            "outstanding": len(self._jobs),
+            "webhook": bool(self.callback_base_url),
+        }
+
+    # --------------------------------------------------
+    # Scheduler
+    # --------------------------------------------------
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    def _reschedule(self, location: str, delay: float):
+        heapq.heappush(
+            self._schedule, (time.monotonic() + delay, next(self._seq), location)
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while self._jobs:
+            now = time.monotonic()
+            due = []
+            while self._schedule and self._schedule[0][0] <= now:
+                _, _, location = heapq.heappop(self._schedule)
+                if location in self._jobs and location not in self._in_flight:
+                    due.append(location)
+            for location in due:
+                # A slow status request must not hold up the others
+                self._in_flight.add(location)
+                task = asyncio.create_task(self._poll(location))
+                self._poll_tasks.add(task)
+                task.add_done_callback(self._poll_tasks.discard)
+            if due:
+                continue
+            timeout = self._schedule[0][0] - now if self._schedule else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, location: str):
+        try:
+            await self._poll_once(location)
+        finally:
+            self._in_flight.discard(location)
+
+    async def _poll_once(self, location: str):
+        job = self._jobs.get(location)
+        if job is None:
+            return
+        if job["future"].done():
+            self._forget(location)
+            return
+        job["polls"] += 1
+        try:
+            content = await job["client"].poll(location)
+        except Exception as e:
+            if isinstance(e, JobFailed) or (
+                not isinstance(e, SdkException)
+                and classify(e) not in (ErrorClass.NETWORK, ErrorClass.THROTTLED)
+            ):
+                # The job itself failed, or a 4xx that won't go away by asking again
+                self._finish(location, error=e)
+                return
+            # Network blip, 5xx or 429: the job is still running on Adobe's
+            # side, so back off and ask again before failing it
+            job["errors"] += 1
+            if job["errors"] >= MAX_POLL_ERRORS:
+                self._finish(location, error=e)
+            else:
+                delay = max(2 ** job["errors"], getattr(e, "retry_after", None) or 0)
+                self._reschedule(location, min(self.max_interval, delay))
+            return
+        job["errors"] = 0
+        if content.get("status") == "done":
+            self._finish(location, result=content["asset"])
+        elif job["token"] is not None:
+            if CALLBACK_FALLBACK_POLL:
+                self._reschedule(location, CALLBACK_FALLBACK_POLL)
+        else:
+            self._reschedule(
+                location, min(self.max_interval, content.get("retry_after", 1.0))
+            )
+
+    def _finish(self, location: str, result=None, error=None):
+        job = self._jobs.get(location)
+        if job is None:
+            return
+        if not job["future"].done():
+            if error is not None:
+                job["future"].set_exception(error)
+            else:
+                job["future"].set_result(result)
+        self._forget(location)
+
+    def _forget_future(self, location: str, future: asyncio.Future):
+        job = self._jobs.get(location)
+        if job is not None and job["future"] is future:
+            self._forget(location)
+
+    def _forget(self, location: str):
+        job = self._jobs.pop(location, None)
+        if job and job["token"]:
+            self._tokens.pop(job["token"], None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+
+JOB_POLLER = JobPoller()
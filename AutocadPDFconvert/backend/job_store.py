@@ -0,0 +1,967 @@
+"""
+Job state shared by every uvicorn worker and kept across restarts.
+
+A job is its meta dict, one public record per file (what /convert/status
+returns), one private work record per file (spool path, hash, the Adobe
+`location` once submitted, the finished artifact) and, once done, the list
+of output members for the ZIP.
+
+SQLiteJobStore (WAL mode) is the default, so any worker can answer for any
+job and a restart can pick up where it left off. MemoryJobStore implements
+the same interface with plain dicts, as a single-process stand-in for a
+key-value server.
+
+Every change to a file record (and finishing the job) bumps the job's
+version and stamps the record with it, so readers can ask for just the
+records changed since a version they have already seen.
+
+Each record carries a FileState. The job keeps per-state counts and byte
+totals, updated in the same transaction as the state change, so summaries
+cost the same for ten files or ten thousand.
+
+The store is also the conversion task queue. Creating a job queues one
+task per file; conversion workers (backend.worker) claim tasks with a
+lease they keep renewing, so a task whose worker died is claimed again
+once its lease runs out. Each job also has one merge task (index None),
+idle until a file task completes and queued again, in the same
+transaction, after every one that does; it appends the finished files to
+the combined document and publishes the outputs after the last one. A
+merge task stays leased to the worker that ran it last while it is idle
+(that process holds the document), so only that worker claims it again
+unless its lease runs out. Merge tasks are claimed before file tasks.
+
+Identical files converting at once (backend.single_flight) are led by
+one worker, recorded as a flight per content key. A flight is alive while
+its owner still holds an unexpired task lease, so a dead leader's
+flights are taken over without a lease of their own.
+
+The store also counts Adobe transactions per account and billing period
+(see backend.credential_pool), so quota use is shared by every worker.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from copy import deepcopy
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+JOB_STORE_BACKEND = os.getenv("JOB_STORE", "sqlite")
+JOB_STORE_PATH = os.getenv(
+    "JOB_STORE_PATH", str(Path(__file__).resolve().parent / "jobs.db")
+)
+
+# Identifies this process as the owner of the tasks it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class FileState(str, Enum):
+    QUEUED = "queued"
+    PREPARING = "preparing"
+    UPLOADING = "uploading"
+    CONVERTING = "converting"
+    FINALIZING = "finalizing"
+    RETRYING = "retrying"
+    DONE = "done"
+    FAILED = "failed"
+
+
+# Default status text shown in the UI for each state
+STATE_LABELS = {
+    FileState.QUEUED: "Queued",
+    FileState.PREPARING: "Preparing",
+    FileState.UPLOADING: "Uploading",
+    FileState.CONVERTING: "Converting",
+    FileState.FINALIZING: "Finalizing",
+    FileState.RETRYING: "Retrying…",
+    FileState.DONE: "Converted ✔",
+    FileState.FAILED: "Failed ❌",
+}
+
+
+class JobStore(ABC):
+    @abstractmethod
+    def create_job(self, job_id: str, meta: Dict, files: List[Dict]):
+        """
+        files - one dict per file; "name" goes public, the rest is work.
+        Queues a conversion task for every file.
+        """
+
+    @abstractmethod
+    def get_meta(self, job_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def get_files(self, job_id: str) -> Optional[List[Dict]]:
+        """Public file records in input order, or None for an unknown job."""
+
+    @abstractmethod
+    def get_counters(self, job_id: str) -> Optional[Dict]:
+        """Per-state counts and byte totals (see summarize())."""
+
+    @abstractmethod
+    def get_version(self, job_id: str) -> Optional[int]:
+        """Current change version of a job, or None for an unknown job."""
+
+    @abstractmethod
+    def get_changes(self, job_id: str, since: int) -> Tuple[int, List[Dict], bool]:
+        """
+        (version, records, finished): the public records changed after
+        version `since`, each with its "index".
+        """
+
+    @abstractmethod
+    def get_work(self, job_id: str) -> List[Dict]:
+        """Work records in input order, each with its "index" and "name"."""
+
+    @abstractmethod
+    def get_work_item(self, job_id: str, index: int) -> Optional[Dict]:
+        """One work record, as in get_work()."""
+
+    @abstractmethod
+    def update_meta(self, job_id: str, **fields):
+        ...
+
+    @abstractmethod
+    def merge_meta(self, job_id: str, merge: Callable[[Dict], Dict]):
+        """Patch the meta with merge(meta), atomically across processes."""
+
+    @abstractmethod
+    def update_file(self, job_id: str, index: int, **fields):
+        """Patch a public record; a "state" field also moves the counters."""
+
+    @abstractmethod
+    def update_work(self, job_id: str, index: int, **fields):
+        ...
+
+    @abstractmethod
+    def finish_job(self, job_id: str, outputs: List[Dict]):
+        ...
+
+    @abstractmethod
+    def get_outputs(self, job_id: str) -> Optional[List[Dict]]:
+        """Output members of a finished job, or None until it is finished."""
+
+    @abstractmethod
+    def claim_task(self, owner: str, lease_until: float,
+                   files_only: bool = False) -> Optional[Dict]:
+        """
+        Oldest task that is queued or whose lease has run out, merge tasks
+        first, as {"task_id", "job_id", "index" (None for merge), "claims"}.
+        files_only skips merge tasks (for remote workers).
+        """
+
+    @abstractmethod
+    def get_task(self, task_id: int) -> Optional[Dict]:
+        """A task as in claim_task(), plus its "state" and "owner"."""
+
+    @abstractmethod
+    def renew_tasks(self, owner: str, lease_until: float) -> List[int]:
+        """
+        Extend the lease on every task `owner` is running or keeping (an
+        idle merge task); returns their ids.
+        """
+
+    @abstractmethod
+    def complete_task(self, task_id: int, owner: str,
+                      work: Optional[Dict] = None) -> bool:
+        """
+        Remove a finished file task and queue the job's merge task; a merge
+        task goes idle, or is queued again if a file finished meanwhile, and
+        is removed once the job is finished. False if `owner` had lost the
+        task to another worker.
+        work - fields merged into the file's work record in the same
+               transaction, so only the worker holding the lease records
+               its artifact
+        """
+
+    @abstractmethod
+    def release_tasks(self, owner: str):
+        """
+        Put `owner`'s running tasks back in the queue, and let go of its
+        merge tasks (worker shutting down).
+        """
+
+    @abstractmethod
+    def lead_flight(self, key: str, owner: str) -> bool:
+        """
+        Become the worker converting `key`: True if there was no flight for
+        it or its owner has no live task lease left (it died).
+        """
+
+    @abstractmethod
+    def end_flight(self, key: str, owner: str):
+        ...
+
+    @abstractmethod
+    def evict_finished(self, finished_before: float) -> List[str]:
+        """Delete jobs finished before `finished_before`; returns their ids."""
+
+    @abstractmethod
+    def get_account_usage(self, period: str) -> Dict[str, Dict]:
+        """{account: {"used", "exhausted", "cooldown_until"}} for a billing period."""
+
+    @abstractmethod
+    def add_account_usage(self, account: str, period: str, transactions: int = 1):
+        ...
+
+    @abstractmethod
+    def cool_down_account(self, account: str, period: str, until: float,
+                          exhausted: bool = False):
+        """Keep `account` out of rotation until `until` (or the period's end)."""
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        # One connection per thread: a write waiting on another process's
+        # lock (async code makes those from a thread) doesn't hold up
+        # reads made on the event loop, which WAL lets run meanwhile
+        self._local = threading.local()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id    TEXT PRIMARY KEY,
+                    meta      TEXT NOT NULL,
+                    outputs   TEXT,
+                    created   REAL NOT NULL,
+                    finished  REAL,
+                    version   INTEGER NOT NULL DEFAULT 0,
+                    counters  TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    job_id  TEXT NOT NULL,
+                    idx     INTEGER NOT NULL,
+                    record  TEXT NOT NULL,
+                    work    TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (job_id, idx)
+                );
+                CREATE INDEX IF NOT EXISTS files_version ON files (job_id, version);
+                CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+                CREATE TABLE IF NOT EXISTS account_usage (
+                    account        TEXT NOT NULL,
+                    period         TEXT NOT NULL,
+                    used           INTEGER NOT NULL DEFAULT 0,
+                    exhausted      INTEGER NOT NULL DEFAULT 0,
+                    cooldown_until REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (account, period)
+                );
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id      TEXT NOT NULL,
+                    idx         INTEGER,
+                    state       TEXT NOT NULL DEFAULT 'queued',
+                    owner       TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    claims      INTEGER NOT NULL DEFAULT 0,
+                    wanted      INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, task_id);
+                CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id);
+                CREATE TABLE IF NOT EXISTS flights (
+                    key   TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL
+                );
+            """)
+            # Task tables made before merge tasks could be wanted again
+            columns = [r[1] for r in self._conn.execute("PRAGMA table_info(tasks)")]
+            if "wanted" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE tasks ADD COLUMN wanted INTEGER NOT NULL DEFAULT 0"
+                )
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self._path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Write transaction that takes the database's write lock up front, so
+        read-modify-writes from different workers and threads can't interleave.
+        """
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            yield
+
+    def _one(self, sql: str, *args):
+        return self._conn.execute(sql, args).fetchone()
+
+    def _patch(self, table: str, column: str, where: str, args, fields):
+        """fields - dict to merge in, or a function of the value returning one"""
+        with self._transaction():
+            row = self._conn.execute(
+                f"SELECT {column} FROM {table} WHERE {where}", args
+            ).fetchone()
+            if row is None:
+                return
+            value = json.loads(row[0])
+            value.update(fields(value) if callable(fields) else fields)
+            self._conn.execute(
+                f"UPDATE {table} SET {column} = ? WHERE {where}",
+                (json.dumps(value),) + tuple(args),
+            )
+
+    def _bump_version(self, job_id: str) -> int:
+        """Increment the job's version; call inside a transaction."""
+        self._conn.execute(
+            "UPDATE jobs SET version = version + 1 WHERE job_id = ?", (job_id,)
+        )
+        return self._conn.execute(
+            "SELECT version FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+
+    def create_job(self, job_id, meta, files):
+        now = time.time()
+        rows = []
+        records = [_new_record(f["name"]) for f in files]
+        for index, (f, record) in enumerate(zip(files, records)):
+            work = {k: v for k, v in f.items() if k != "name"}
+            rows.append((job_id, index, json.dumps(record), json.dumps(work)))
+        counters = _counters_for(records, [f.get("size") or 0 for f in files])
+        with self._transaction():
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, meta, created, counters) VALUES (?, ?, ?, ?)",
+                (job_id, json.dumps(meta), now, json.dumps(counters)),
+            )
+            self._conn.executemany(
+                "INSERT INTO files (job_id, idx, record, work) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO tasks (job_id, idx) VALUES (?, ?)",
+                [(job_id, index) for index in range(len(files))],
+            )
+            # With no files there is nothing to wait for
+            self._conn.execute(
+                "INSERT INTO tasks (job_id, state) VALUES (?, ?)",
+                (job_id, "idle" if files else "queued"),
+            )
+
+    def get_meta(self, job_id):
+        row = self._one("SELECT meta FROM jobs WHERE job_id = ?", job_id)
+        return json.loads(row[0]) if row else None
+
+    def get_files(self, job_id):
+        if self._conn.execute(
+            "SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone() is None:
+            return None
+        rows = self._conn.execute(
+            "SELECT record FROM files WHERE job_id = ? ORDER BY idx", (job_id,)
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_counters(self, job_id):
+        row = self._one("SELECT counters FROM jobs WHERE job_id = ?", job_id)
+        return json.loads(row[0]) if row else None
+
+    def get_version(self, job_id):
+        row = self._one("SELECT version FROM jobs WHERE job_id = ?", job_id)
+        return row[0] if row else None
+
+    def get_changes(self, job_id, since):
+        job = self._conn.execute(
+            "SELECT version, finished FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if job is None:
+            return since, [], False
+        rows = self._conn.execute(
+            "SELECT idx, record FROM files"
+            " WHERE job_id = ? AND version > ? ORDER BY idx",
+            (job_id, since),
+        ).fetchall()
+        records = [dict(json.loads(record), index=index) for index, record in rows]
+        return job[0], records, job[1] is not None
+
+    def get_work(self, job_id):
+        rows = self._conn.execute(
+            "SELECT idx, record, work FROM files WHERE job_id = ? ORDER BY idx",
+            (job_id,),
+        ).fetchall()
+        work = []
+        for index, record, data in rows:
+            item = json.loads(data)
+            item.update(index=index, name=json.loads(record)["name"])
+            work.append(item)
+        return work
+
+    def get_work_item(self, job_id, index):
+        row = self._one(
+            "SELECT record, work FROM files WHERE job_id = ? AND idx = ?", job_id, index
+        )
+        if row is None:
+            return None
+        return dict(json.loads(row[1]), index=index, name=json.loads(row[0])["name"])
+
+    def update_meta(self, job_id, **fields):
+        self._patch("jobs", "meta", "job_id = ?", (job_id,), fields)
+
+    def merge_meta(self, job_id, merge):
+        self._patch("jobs", "meta", "job_id = ?", (job_id,), merge)
+
+    def update_file(self, job_id, index, **fields):
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT record, work FROM files WHERE job_id = ? AND idx = ?",
+                (job_id, index),
+            ).fetchone()
+            if row is None:
+                return
+            record = json.loads(row[0])
+            old_state = record.get("state")
+            record.update(fields)
+            self._conn.execute(
+                "UPDATE files SET record = ?, version = ?"
+                " WHERE job_id = ? AND idx = ?",
+                (json.dumps(record), self._bump_version(job_id), job_id, index),
+            )
+            if record.get("state") != old_state:
+                counters = json.loads(self._conn.execute(
+                    "SELECT counters FROM jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()[0])
+                size = json.loads(row[1]).get("size") or 0
+                _move_counters(counters, old_state, record["state"], size)
+                self._conn.execute(
+                    "UPDATE jobs SET counters = ? WHERE job_id = ?",
+                    (json.dumps(counters), job_id),
+                )
+
+    def update_work(self, job_id, index, **fields):
+        self._patch("files", "work", "job_id = ? AND idx = ?", (job_id, index), fields)
+
+    def finish_job(self, job_id, outputs):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE jobs SET outputs = ?, finished = ? WHERE job_id = ?",
+                (json.dumps(outputs), time.time(), job_id),
+            )
+            self._bump_version(job_id)
+
+    def get_outputs(self, job_id):
+        row = self._one("SELECT outputs FROM jobs WHERE job_id = ?", job_id)
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def claim_task(self, owner, lease_until, files_only=False):
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT task_id, job_id, idx, claims FROM tasks"
+                " WHERE ((state = 'queued'"
+                " AND (owner IS NULL OR owner = ? OR lease_until < ?))"
+                " OR (state = 'running' AND lease_until < ?))"
+                + (" AND idx IS NOT NULL" if files_only else "")
+                + " ORDER BY idx IS NOT NULL, task_id LIMIT 1",
+                (owner, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            task_id, job_id, index, claims = row
+            self._conn.execute(
+                "UPDATE tasks SET state = 'running', owner = ?, lease_until = ?,"
+                " claims = claims + 1 WHERE task_id = ?",
+                (owner, lease_until, task_id),
+            )
+        return {"task_id": task_id, "job_id": job_id, "index": index, "claims": claims + 1}
+
+    def get_task(self, task_id):
+        row = self._one(
+            "SELECT task_id, job_id, idx, claims, state, owner FROM tasks"
+            " WHERE task_id = ?", task_id,
+        )
+        if row is None:
+            return None
+        return dict(zip(("task_id", "job_id", "index", "claims", "state", "owner"), row))
+
+    def renew_tasks(self, owner, lease_until):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE owner = ?"
+                " AND (state = 'running' OR idx IS NULL)",
+                (lease_until, owner),
+            )
+            return [r[0] for r in self._conn.execute(
+                "SELECT task_id FROM tasks WHERE owner = ?"
+                " AND (state = 'running' OR idx IS NULL)",
+                (owner,),
+            ).fetchall()]
+
+    def complete_task(self, task_id, owner, work=None):
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT job_id, idx FROM tasks"
+                " WHERE task_id = ? AND owner = ? AND state = 'running'",
+                (task_id, owner),
+            ).fetchone()
+            if row is None:
+                return False
+            job_id, index = row
+            if index is None:
+                self._complete_merge(task_id, job_id)
+                return True
+            if work:
+                value = self._conn.execute(
+                    "SELECT work FROM files WHERE job_id = ? AND idx = ?",
+                    (job_id, index),
+                ).fetchone()
+                if value is not None:
+                    self._conn.execute(
+                        "UPDATE files SET work = ? WHERE job_id = ? AND idx = ?",
+                        (json.dumps({**json.loads(value[0]), **work}), job_id, index),
+                    )
+            self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            # The merge task has something to append (or to finish) now
+            self._conn.execute(
+                "UPDATE tasks SET state = 'queued'"
+                " WHERE job_id = ? AND idx IS NULL AND state = 'idle'",
+                (job_id,),
+            )
+            self._conn.execute(
+                "UPDATE tasks SET wanted = 1"
+                " WHERE job_id = ? AND idx IS NULL AND state = 'running'",
+                (job_id,),
+            )
+            # Jobs created before merge tasks existed get theirs now
+            self._conn.execute(
+                "INSERT INTO tasks (job_id, idx) SELECT job_id, NULL FROM jobs"
+                " WHERE job_id = ? AND finished IS NULL AND NOT EXISTS"
+                " (SELECT 1 FROM tasks WHERE job_id = ? AND idx IS NULL)",
+                (job_id, job_id),
+            )
+        return True
+
+    def _complete_merge(self, task_id: int, job_id: str):
+        """complete_task() for a merge task; call inside a transaction."""
+        job = self._conn.execute(
+            "SELECT finished FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if job is None or job[0] is not None:
+            self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            return
+        # Still leased to its owner; claims start over, this run didn't kill it
+        self._conn.execute(
+            "UPDATE tasks SET state = CASE WHEN wanted THEN 'queued' ELSE 'idle' END,"
+            " claims = 0, wanted = 0 WHERE task_id = ?",
+            (task_id,),
+        )
+
+    def release_tasks(self, owner):
+        with self._transaction():
+            # Not counted as a claim: the task didn't kill its worker
+            self._conn.execute(
+                "UPDATE tasks SET state = 'queued', owner = NULL, lease_until = 0,"
+                " claims = claims - 1 WHERE owner = ? AND state = 'running'",
+                (owner,),
+            )
+            self._conn.execute(
+                "UPDATE tasks SET owner = NULL, lease_until = 0 WHERE owner = ?",
+                (owner,),
+            )
+
+    def lead_flight(self, key, owner):
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT owner FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[0] != owner and self._conn.execute(
+                "SELECT 1 FROM tasks WHERE owner = ? AND state = 'running'"
+                " AND lease_until >= ? LIMIT 1",
+                (row[0], time.time()),
+            ).fetchone() is not None:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO flights (key, owner) VALUES (?, ?)", (key, owner)
+            )
+        return True
+
+    def end_flight(self, key, owner):
+        with self._transaction():
+            self._conn.execute(
+                "DELETE FROM flights WHERE key = ? AND owner = ?", (key, owner)
+            )
+
+    def evict_finished(self, finished_before):
+        with self._transaction():
+            ids = [r[0] for r in self._conn.execute(
+                "SELECT job_id FROM jobs WHERE finished < ?", (finished_before,)
+            ).fetchall()]
+            for job_id in ids:
+                self._conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM files WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        return ids
+
+    def get_account_usage(self, period):
+        rows = self._conn.execute(
+            "SELECT account, used, exhausted, cooldown_until FROM account_usage"
+            " WHERE period = ?",
+            (period,),
+        ).fetchall()
+        return {
+            account: {
+                "used": used,
+                "exhausted": bool(exhausted),
+                "cooldown_until": cooldown_until,
+            }
+            for account, used, exhausted, cooldown_until in rows
+        }
+
+    def add_account_usage(self, account, period, transactions=1):
+        with self._transaction():
+            self._conn.execute(
+                "INSERT INTO account_usage (account, period, used) VALUES (?, ?, ?)"
+                " ON CONFLICT (account, period) DO UPDATE SET used = used + excluded.used",
+                (account, period, transactions),
+            )
+
+    def cool_down_account(self, account, period, until, exhausted=False):
+        with self._transaction():
+            self._conn.execute(
+                "INSERT INTO account_usage (account, period, exhausted, cooldown_until)"
+                " VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (account, period) DO UPDATE SET"
+                " exhausted = MAX(exhausted, excluded.exhausted),"
+                " cooldown_until = MAX(cooldown_until, excluded.cooldown_until)",
+                (account, period, int(exhausted), until),
+            )
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+        self._accounts: Dict[Tuple[str, str], Dict] = {}
+        self._tasks: "OrderedDict[int, Dict]" = OrderedDict()
+        self._task_ids = itertools.count(1)
+        self._flights: Dict[str, str] = {}
+
+    def _queue_task(self, job_id: str, index: Optional[int], state: str = "queued"):
+        task_id = next(self._task_ids)
+        self._tasks[task_id] = {
+            "task_id": task_id, "job_id": job_id, "index": index,
+            "state": state, "owner": None, "lease_until": 0.0, "claims": 0,
+            "wanted": False,
+        }
+
+    def create_job(self, job_id, meta, files):
+        now = time.time()
+        records = [_new_record(f["name"]) for f in files]
+        with self._lock:
+            self._jobs[job_id] = {
+                "meta": deepcopy(meta),
+                "records": records,
+                "work": [
+                    {k: v for k, v in f.items() if k != "name"} for f in files
+                ],
+                "outputs": None,
+                "created": now,
+                "finished": None,
+                "version": 0,
+                "versions": [0] * len(files),
+                "counters": _counters_for(
+                    records, [f.get("size") or 0 for f in files]
+                ),
+            }
+            for index in range(len(files)):
+                self._queue_task(job_id, index)
+            self._queue_task(job_id, None, "idle" if files else "queued")
+
+    def get_meta(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return deepcopy(job["meta"]) if job else None
+
+    def get_files(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return deepcopy(job["records"]) if job else None
+
+    def get_counters(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return deepcopy(job["counters"]) if job else None
+
+    def get_version(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job["version"] if job else None
+
+    def get_changes(self, job_id, since):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return since, [], False
+            records = [
+                dict(deepcopy(record), index=index)
+                for index, (record, version) in enumerate(
+                    zip(job["records"], job["versions"])
+                )
+                if version > since
+            ]
+            return job["version"], records, job["finished"] is not None
+
+    def get_work(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return []
+            return [
+                dict(deepcopy(work), index=index, name=record["name"])
+                for index, (record, work) in enumerate(zip(job["records"], job["work"]))
+            ]
+
+    def get_work_item(self, job_id, index):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not 0 <= index < len(job["work"]):
+                return None
+            return dict(
+                deepcopy(job["work"][index]), index=index, name=job["records"][index]["name"]
+            )
+
+    def update_meta(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]["meta"].update(deepcopy(fields))
+
+    def merge_meta(self, job_id, merge):
+        with self._lock:
+            if job_id in self._jobs:
+                meta = self._jobs[job_id]["meta"]
+                meta.update(deepcopy(merge(deepcopy(meta))))
+
+    def update_file(self, job_id, index, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                record = job["records"][index]
+                old_state = record.get("state")
+                record.update(deepcopy(fields))
+                job["version"] += 1
+                job["versions"][index] = job["version"]
+                if record.get("state") != old_state:
+                    _move_counters(
+                        job["counters"], old_state, record["state"],
+                        job["work"][index].get("size") or 0,
+                    )
+
+    def update_work(self, job_id, index, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]["work"][index].update(deepcopy(fields))
+
+    def finish_job(self, job_id, outputs):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]["outputs"] = deepcopy(outputs)
+                self._jobs[job_id]["finished"] = time.time()
+                self._jobs[job_id]["version"] += 1
+
+    def get_outputs(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return deepcopy(job["outputs"]) if job else None
+
+    def claim_task(self, owner, lease_until, files_only=False):
+        now = time.time()
+        with self._lock:
+            # Merge tasks first, then by age
+            for task in sorted(self._tasks.values(),
+                               key=lambda t: (t["index"] is not None, t["task_id"])):
+                if files_only and task["index"] is None:
+                    continue
+                if task["state"] == "queued":
+                    claimable = task["owner"] in (None, owner) or task["lease_until"] < now
+                else:
+                    claimable = task["state"] == "running" and task["lease_until"] < now
+                if claimable:
+                    task.update(state="running", owner=owner, lease_until=lease_until)
+                    task["claims"] += 1
+                    return {k: task[k] for k in ("task_id", "job_id", "index", "claims")}
+        return None
+
+    def get_task(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            return {k: task[k] for k in
+                    ("task_id", "job_id", "index", "claims", "state", "owner")}
+
+    def renew_tasks(self, owner, lease_until):
+        held = []
+        with self._lock:
+            for task in self._tasks.values():
+                if task["owner"] == owner and (
+                    task["state"] == "running" or task["index"] is None
+                ):
+                    task["lease_until"] = lease_until
+                    held.append(task["task_id"])
+        return held
+
+    def complete_task(self, task_id, owner, work=None):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task["owner"] != owner or task["state"] != "running":
+                return False
+            job_id = task["job_id"]
+            job = self._jobs.get(job_id)
+            if task["index"] is None:
+                if job is None or job["finished"] is not None:
+                    del self._tasks[task_id]
+                else:
+                    task.update(state="queued" if task["wanted"] else "idle",
+                                claims=0, wanted=False)
+                return True
+            del self._tasks[task_id]
+            if work and job is not None:
+                job["work"][task["index"]].update(deepcopy(work))
+            for merge in self._tasks.values():
+                if merge["job_id"] == job_id and merge["index"] is None:
+                    if merge["state"] == "idle":
+                        merge["state"] = "queued"
+                    elif merge["state"] == "running":
+                        merge["wanted"] = True
+        return True
+
+    def release_tasks(self, owner):
+        with self._lock:
+            for task in self._tasks.values():
+                if task["owner"] == owner and task["state"] == "running":
+                    task.update(state="queued", owner=None, lease_until=0.0)
+                    task["claims"] -= 1
+                elif task["owner"] == owner:
+                    task.update(owner=None, lease_until=0.0)
+
+    def lead_flight(self, key, owner):
+        now = time.time()
+        with self._lock:
+            leader = self._flights.get(key)
+            if leader is not None and leader != owner and any(
+                t["owner"] == leader and t["state"] == "running" and t["lease_until"] >= now
+                for t in self._tasks.values()
+            ):
+                return False
+            self._flights[key] = owner
+        return True
+
+    def end_flight(self, key, owner):
+        with self._lock:
+            if self._flights.get(key) == owner:
+                del self._flights[key]
+
+    def evict_finished(self, finished_before):
+        with self._lock:
+            ids = [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished"] is not None and job["finished"] < finished_before
+            ]
+            for job_id in ids:
+                del self._jobs[job_id]
+            for task_id in [t for t, task in self._tasks.items() if task["job_id"] in ids]:
+                del self._tasks[task_id]
+        return ids
+
+    def _account(self, account: str, period: str) -> Dict:
+        return self._accounts.setdefault(
+            (account, period),
+            {"used": 0, "exhausted": False, "cooldown_until": 0.0},
+        )
+
+    def get_account_usage(self, period):
+        with self._lock:
+            return {
+                account: dict(usage)
+                for (account, p), usage in self._accounts.items() if p == period
+            }
+
+    def add_account_usage(self, account, period, transactions=1):
+        with self._lock:
+            self._account(account, period)["used"] += transactions
+
+    def cool_down_account(self, account, period, until, exhausted=False):
+        with self._lock:
+            usage = self._account(account, period)
+            usage["exhausted"] = usage["exhausted"] or exhausted
+            usage["cooldown_until"] = max(usage["cooldown_until"], until)
+
+
+def _new_record(name: str) -> Dict:
+    return {
+        "name": name,
+        "state": FileState.QUEUED.value,
+        "status": STATE_LABELS[FileState.QUEUED],
+        "progress": 0,
+        "output": False,
+    }
+
+
+def _counters_for(records: List[Dict], sizes: List[int]) -> Dict:
+    counters = {state.value: 0 for state in FileState}
+    counters.update(total=len(records), bytes_total=sum(sizes),
+                    bytes_done=0, bytes_failed=0)
+    for record, size in zip(records, sizes):
+        _move_counters(counters, None, record["state"], size)
+    return counters
+
+
+def _move_counters(counters: Dict, old: Optional[str], new: str, size: int):
+    """Account for one file moving from state `old` to `new`."""
+    if old is not None:
+        counters[old] -= 1
+    counters[new] += 1
+    for state, key in ((FileState.DONE, "bytes_done"), (FileState.FAILED, "bytes_failed")):
+        if old == state.value:
+            counters[key] -= size
+        if new == state.value:
+            counters[key] += size
+    if "started" not in counters and new != FileState.QUEUED.value:
+        counters["started"] = time.time()
+
+
+def summarize(counters: Dict) -> Dict:
+    """Summary for the UI; the ETA extrapolates bytes converted so far."""
+    done, failed = counters[FileState.DONE.value], counters[FileState.FAILED.value]
+    remaining = counters["bytes_total"] - counters["bytes_done"] - counters["bytes_failed"]
+    eta = None
+    if done + failed == counters["total"]:
+        eta = 0.0
+    elif counters["bytes_done"] and "started" in counters:
+        rate = counters["bytes_done"] / max(time.time() - counters["started"], 1e-6)
+        eta = round(remaining / rate, 1)
+    return {
+        "total": counters["total"],
+        "converted": done,
+        "failed": failed,
+        "finished": done + failed,
+        "states": {state.value: counters[state.value] for state in FileState},
+        "bytes_total": counters["bytes_total"],
+        "bytes_done": counters["bytes_done"],
+        "eta_seconds": eta,
+    }
+
+
+def create_job_store() -> JobStore:
+    if JOB_STORE_BACKEND == "memory":
+        return MemoryJobStore()
+    if JOB_STORE_BACKEND == "sqlite":
+        return SQLiteJobStore(JOB_STORE_PATH)
+    raise RuntimeError(f"Unknown JOB_STORE backend: {JOB_STORE_BACKEND}")
+
+
+JOB_STORE = create_job_store()
@@ -20,6 +20,13 @@ APP = os.getenv("APP", "backend.main:app")  # FastAPI app
 # APP = os.getenv("APP", "dwg_plot_api:app")
 
 WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Conversion workers (python -m backend.worker) started next to uvicorn;
+# with 0 the API converts in its own process
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", "2"))
+# Conversions each worker keeps in flight (default: its MAX_IN_FLIGHT)
+WORKER_CONCURRENCY = os.getenv("WORKER_CONCURRENCY")
+
 CHECK_HOSTS = [os.getenv("CHECK_HOST", "127.0.0.1"), "localhost"]
 
 # Run uvicorn from project root
@@ -28,6 +35,14 @@ PIDFILE = ROOT_DIR / "uvicorn_backend_main.pid"
 LOGFILE = ROOT_DIR / "uvicorn_backend_main.log"
 
 
+def worker_pidfile(n: int) -> Path:
+    return ROOT_DIR / f"conversion_worker_{n}.pid"
+
+
+def worker_logfile(n: int) -> Path:
+    return ROOT_DIR / f"conversion_worker_{n}.log"
+
+
 def is_listening(hosts=CHECK_HOSTS, port=PORT, timeout=0.25) -> bool:
     """Check if something is already listening on HOST:PORT."""
     for h in hosts:
@@ -41,14 +56,30 @@ def is_listening(hosts=CHECK_HOSTS, port=PORT, timeout=0.25) -> bool:
     return False
 
 
-def read_pid():
+def read_pid(pidfile: Path = PIDFILE):
     try:
-        return int(PIDFILE.read_text().strip())
+        return int(pidfile.read_text().strip())
     except Exception:
         return None
 
 
 def is_alive(pid: int) -> bool:
+    if sys.platform == "win32":
+        # os.kill(pid, 0) would send CTRL_C_EVENT on Windows
+        import ctypes
+
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
     try:
         os.kill(pid, 0)
         return True
@@ -56,17 +87,45 @@ def is_alive(pid: int) -> bool:
         return False
 
 
-def _build_cmd():
-    """Build the uvicorn command using venv311 explicitly."""
-
+def _python_bin() -> Path:
     python_bin = ROOT_DIR / "venv311" / "Scripts" / "python.exe"
 
     if not python_bin.exists():
         print("ERROR: venv311 python not found:", python_bin)
         sys.exit(1)
+    return python_bin
+
+
+def _child_env():
+    env = os.environ.copy()
+    # ensure ROOT_DIR is on PYTHONPATH so 'backend' is importable
+    env["PYTHONPATH"] = str(ROOT_DIR) + (
+        os.pathsep + env["PYTHONPATH"] if "PYTHONPATH" in env else ""
+    )
+    if CONVERSION_WORKERS:
+        # Conversions run in the workers; the API only queues them
+        env["EMBEDDED_WORKER"] = "0"
+    return env
+
+
+def _spawn(cmd, logfile: Path) -> subprocess.Popen:
+    logfile.parent.mkdir(parents=True, exist_ok=True)
+    log_f = open(logfile, "ab", buffering=0)
+    return subprocess.Popen(
+        cmd,
+        cwd=str(CWD),  # run from project root
+        env=_child_env(),
+        stdout=log_f,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,  # detach
+    )
+
+
+def _build_cmd():
+    """Build the uvicorn command using venv311 explicitly."""
 
     cmd = [
-        str(python_bin),
+        str(_python_bin()),
         "-m",
         "uvicorn",
         APP,
@@ -82,8 +141,28 @@ def _build_cmd():
 
     return cmd
 
+def _worker_cmd():
+    cmd = [str(_python_bin()), "-m", "backend.worker"]
+    if WORKER_CONCURRENCY:
+        cmd += ["--concurrency", WORKER_CONCURRENCY]
+    return cmd
+
+
+def start_workers():
+    """Start the conversion workers that aren't running (again)."""
+    for n in range(CONVERSION_WORKERS):
+        pid = read_pid(worker_pidfile(n))
+        if pid and is_alive(pid):
+            continue
+        proc = _spawn(_worker_cmd(), worker_logfile(n))
+        worker_pidfile(n).write_text(str(proc.pid))
+        print(f"[launcher] Started conversion worker {n} (pid {proc.pid})")
+
+
 def start():
-    """Start uvicorn if not already running."""
+    """Start the conversion workers and uvicorn, if not already running."""
+    start_workers()
+
     if is_listening():
         print(f"[launcher] FastAPI already listening on {HOST}:{PORT}")
         return 0
@@ -92,26 +171,10 @@ def start():
     if pid and not is_alive(pid):
         PIDFILE.unlink(missing_ok=True)
 
-    LOGFILE.parent.mkdir(parents=True, exist_ok=True)
-    log_f = open(LOGFILE, "ab", buffering=0)
-
     cmd = _build_cmd()
     print(f"[launcher] Starting: {' '.join(cmd)}")
 
-    env = os.environ.copy()
-    # ensure ROOT_DIR is on PYTHONPATH so 'backend' is importable
-    env["PYTHONPATH"] = str(ROOT_DIR) + (
-        os.pathsep + env["PYTHONPATH"] if "PYTHONPATH" in env else ""
-    )
-
-    proc = subprocess.Popen(
-        cmd,
-        cwd=str(CWD),  # run uvicorn from project root
-        env=env,
-        stdout=log_f,
-        stderr=subprocess.STDOUT,
-        start_new_session=True,  # detach
-    )
+    proc = _spawn(cmd, LOGFILE)
     PIDFILE.write_text(str(proc.pid))
 
     # Wait for uvicorn to open the port
@@ -130,39 +193,46 @@ def start():
     return 1
 
 
-def stop(timeout=5):
-    """Stop uvicorn if running."""
-    pid = read_pid()
+def _stop_pid(pidfile: Path, what: str, timeout=5):
+    pid = read_pid(pidfile)
     if not pid:
-        print("[launcher] Stopped (no pidfile).")
-        return 0
+        print(f"[launcher] {what} stopped (no pidfile).")
+        return
 
     if not is_alive(pid):
-        PIDFILE.unlink(missing_ok=True)
-        print("[launcher] Stopped (stale pidfile).")
-        return 0
+        pidfile.unlink(missing_ok=True)
+        print(f"[launcher] {what} stopped (stale pidfile).")
+        return
 
     try:
         os.kill(pid, signal.SIGTERM)
     except ProcessLookupError:
-        PIDFILE.unlink(missing_ok=True)
-        print("[launcher] Stopped.")
-        return 0
+        pidfile.unlink(missing_ok=True)
+        print(f"[launcher] {what} stopped.")
+        return
 
     t0 = time.time()
     while time.time() - t0 < timeout:
         if not is_alive(pid):
-            PIDFILE.unlink(missing_ok=True)
-            print("[launcher] Stopped.")
-            return 0
+            pidfile.unlink(missing_ok=True)
+            print(f"[launcher] {what} stopped.")
+            return
         time.sleep(0.2)
 
     try:
-        os.kill(pid, signal.SIGKILL)
+        os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
     except ProcessLookupError:
         pass
-    PIDFILE.unlink(missing_ok=True)
-    print("[launcher] Force-stopped.")
+    pidfile.unlink(missing_ok=True)
+    print(f"[launcher] {what} force-stopped.")
+
+
+def stop(timeout=5):
+    """Stop uvicorn, then the conversion workers."""
+    _stop_pid(PIDFILE, "API", timeout)
+    # Every pidfile, in case CONVERSION_WORKERS was lowered since start
+    for pidfile in sorted(ROOT_DIR.glob("conversion_worker_*.pid")):
+        _stop_pid(pidfile, f"Conversion worker {pidfile.stem.rsplit('_', 1)[-1]}", timeout)
     return 0
 
 
@@ -172,6 +242,10 @@ def restart():
 
 
 def status():
+    for n in range(CONVERSION_WORKERS):
+        pid = read_pid(worker_pidfile(n))
+        state = f"running (pid {pid})" if pid and is_alive(pid) else "not running"
+        print(f"[launcher] Conversion worker {n}: {state}")
     pid = read_pid()
     if pid and is_alive(pid):
         print(f"[launcher] Running (pid {pid}) on {HOST}:{PORT}")
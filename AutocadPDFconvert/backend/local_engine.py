@@ -0,0 +1,254 @@
+"""
+Offline PDF → DOCX conversion with pypdf, Pillow and python-docx.
+
+Used when Adobe can't be reached (or by policy, see
+backend.conversion_backends). Every PDF page becomes one section of the
+same size holding:
+  - the page's vector drawing (paths, rectangles, curves, including those
+    inside form XObjects) rasterised to a grayscale PNG, and
+  - the page's text runs, extracted by pypdf, as editable paragraphs
+    after the picture.
+Embedded raster images and text glyphs are not drawn into the picture.
+Layout fidelity is well below Adobe's ExportPDF, but a batch can finish
+without the network and without using quota.
+
+Runs in worker processes: convert_pdf() takes a path and returns bytes.
+"""
+import io
+import os
+import math
+from typing import List, Optional, Tuple
+
+from docx import Document
+from docx.enum.section import WD_SECTION
+from docx.shared import Pt
+from PIL import Image, ImageDraw
+from pypdf import PdfReader
+from pypdf.generic import ContentStream
+
+from backend.docx_merge import _apply_page_size
+
+LOCAL_RENDER_DPI = float(os.getenv("LOCAL_RENDER_DPI", "150"))
+# Large sheets are rendered at a lower DPI to stay under this many pixels
+LOCAL_RENDER_MAX_PIXELS = int(os.getenv("LOCAL_RENDER_MAX_PIXELS", "40000000"))
+
+# Bézier curves are flattened into this many line segments
+CURVE_SEGMENTS = 8
+# Form XObjects nested deeper than this are not drawn
+MAX_FORM_DEPTH = 8
+
+PAGE_MARGIN_PT = 12
+TEXT_SIZE_PT = 8
+
+Matrix = Tuple[float, float, float, float, float, float]
+
+
+def _multiply(m: Matrix, n: Matrix) -> Matrix:
+    """m then n (PDF row-vector convention)."""
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = n
+    return (
+        a * A + b * C, a * B + b * D,
+        c * A + d * C, c * B + d * D,
+        e * A + f * C + E, e * B + f * D + F,
+    )
+
+
+def _apply(m: Matrix, x: float, y: float) -> Tuple[float, float]:
+    return m[0] * x + m[2] * y + m[4], m[1] * x + m[3] * y + m[5]
+
+
+def _gray(operator: str, operands) -> Optional[int]:
+    """0-255 luminance for a colour operator, None if it isn't one we read."""
+    try:
+        values = [float(v) for v in operands]
+    except (TypeError, ValueError):
+        return None
+    if operator in ("G", "g") and len(values) == 1:
+        level = values[0]
+    elif operator in ("RG", "rg") and len(values) == 3:
+        r, g, b = values
+        level = 0.299 * r + 0.587 * g + 0.114 * b
+    elif operator in ("K", "k") and len(values) == 4:
+        c, m, y, k = values
+        level = (1 - min(1.0, c + k)) * 0.299 + (1 - min(1.0, m + k)) * 0.587 \
+            + (1 - min(1.0, y + k)) * 0.114
+    elif operator in ("SC", "sc", "SCN", "scn") and len(values) in (1, 3, 4):
+        return _gray({1: "G", 3: "RG", 4: "K"}[len(values)], values)
+    else:
+        return None
+    return max(0, min(255, round(level * 255)))
+
+
+class _Rasteriser:
+    def __init__(self, draw: ImageDraw.ImageDraw, device: Matrix, scale: float):
+        self.draw = draw
+        self.scale = scale
+        self.state = {"ctm": device, "width": 1.0, "stroke": 0, "fill": 0}
+        self.stack = []
+        self.subpaths: List[List[Tuple[float, float]]] = []
+
+    def run(self, content, resources, depth: int = 0):
+        stream = content if isinstance(content, ContentStream) else ContentStream(content, None)
+        for operands, operator in stream.operations:
+            op = operator.decode("latin-1") if isinstance(operator, bytes) else operator
+            try:
+                self._op(op, operands, resources, depth)
+            except (TypeError, ValueError, IndexError, KeyError, ZeroDivisionError):
+                continue
+
+    def _point(self, x, y):
+        return _apply(self.state["ctm"], float(x), float(y))
+
+    def _current(self):
+        return self.subpaths[-1][-1]
+
+    def _curve(self, p1, p2, p3):
+        p0 = self._current()
+        for i in range(1, CURVE_SEGMENTS + 1):
+            t = i / CURVE_SEGMENTS
+            u = 1 - t
+            self.subpaths[-1].append((
+                u ** 3 * p0[0] + 3 * u * u * t * p1[0] + 3 * u * t * t * p2[0] + t ** 3 * p3[0],
+                u ** 3 * p0[1] + 3 * u * u * t * p1[1] + 3 * u * t * t * p2[1] + t ** 3 * p3[1],
+            ))
+
+    def _line_width(self) -> int:
+        a, b, c, d = self.state["ctm"][:4]
+        device_scale = math.sqrt(abs(a * d - b * c)) or self.scale
+        return max(1, round(self.state["width"] * device_scale))
+
+    def _paint(self, stroke: bool, fill: bool, close: bool = False):
+        for path in self.subpaths:
+            if len(path) < 2:
+                continue
+            if fill and len(path) >= 3:
+                self.draw.polygon(path, fill=self.state["fill"])
+            if stroke:
+                points = path + [path[0]] if close else path
+                self.draw.line(points, fill=self.state["stroke"], width=self._line_width())
+        self.subpaths = []
+
+    def _op(self, op: str, args, resources, depth: int):
+        if op == "q":
+            self.stack.append(dict(self.state))
+        elif op == "Q":
+            if self.stack:
+                self.state = self.stack.pop()
+        elif op == "cm":
+            m = tuple(float(v) for v in args)
+            self.state["ctm"] = _multiply(m, self.state["ctm"])
+        elif op == "w":
+            self.state["width"] = float(args[0])
+        elif op in ("G", "RG", "K", "SC", "SCN"):
+            level = _gray(op, args)
+            if level is not None:
+                self.state["stroke"] = level
+        elif op in ("g", "rg", "k", "sc", "scn"):
+            level = _gray(op, args)
+            if level is not None:
+                self.state["fill"] = level
+        elif op == "m":
+            self.subpaths.append([self._point(*args)])
+        elif op == "l":
+            self.subpaths[-1].append(self._point(*args))
+        elif op == "c":
+            self._curve(self._point(args[0], args[1]), self._point(args[2], args[3]),
+                        self._point(args[4], args[5]))
+        elif op == "v":
+            self._curve(self._current(), self._point(args[0], args[1]),
+                        self._point(args[2], args[3]))
+        elif op == "y":
+            end = self._point(args[2], args[3])
+            self._curve(self._point(args[0], args[1]), end, end)
+        elif op == "h":
+            if self.subpaths and len(self.subpaths[-1]) > 1:
+                self.subpaths[-1].append(self.subpaths[-1][0])
+        elif op == "re":
+            x, y, w, h = (float(v) for v in args)
+            self.subpaths.append([
+                self._point(x, y), self._point(x + w, y),
+                self._point(x + w, y + h), self._point(x, y + h), self._point(x, y),
+            ])
+        elif op in ("S", "s"):
+            self._paint(stroke=True, fill=False, close=op == "s")
+        elif op in ("f", "F", "f*"):
+            self._paint(stroke=False, fill=True)
+        elif op in ("B", "B*", "b", "b*"):
+            self._paint(stroke=True, fill=True, close=op.startswith("b"))
+        elif op == "n":
+            self.subpaths = []
+        elif op == "Do" and depth < MAX_FORM_DEPTH:
+            self._form(args[0], resources, depth)
+
+    def _form(self, name, resources, depth: int):
+        xobjects = resources["/XObject"] if "/XObject" in resources else {}
+        if name not in xobjects:
+            return
+        form = xobjects[name].get_object()
+        if form.get("/Subtype") != "/Form":
+            return
+        saved = dict(self.state)
+        if "/Matrix" in form:
+            m = tuple(float(v) for v in form["/Matrix"])
+            self.state["ctm"] = _multiply(m, self.state["ctm"])
+        form_resources = form["/Resources"] if "/Resources" in form else resources
+        self.run(form, form_resources, depth + 1)
+        self.state = saved
+
+
+def render_page(page, dpi: float = LOCAL_RENDER_DPI) -> bytes:
+    """The page's vector content as a PNG, at most LOCAL_RENDER_MAX_PIXELS."""
+    box = page.mediabox
+    width_pt, height_pt = float(box.width), float(box.height)
+    scale = dpi / 72
+    pixels = width_pt * height_pt * scale * scale
+    if pixels > LOCAL_RENDER_MAX_PIXELS:
+        scale *= math.sqrt(LOCAL_RENDER_MAX_PIXELS / pixels)
+    size = (max(1, round(width_pt * scale)), max(1, round(height_pt * scale)))
+    image = Image.new("L", size, 255)
+    # PDF space (origin bottom left) to image space (origin top left)
+    device = (scale, 0, 0, -scale, -float(box.left) * scale, float(box.top) * scale)
+    contents = page.get_contents()
+    if contents is not None:
+        resources = page["/Resources"] if "/Resources" in page else {}
+        _Rasteriser(ImageDraw.Draw(image), device, scale).run(contents, resources)
+    rotate = page.rotation % 360
+    if rotate:
+        # /Rotate is clockwise, PIL rotates anticlockwise
+        image = image.rotate(-rotate, expand=True)
+    out = io.BytesIO()
+    image.save(out, "PNG", optimize=True)
+    return out.getvalue()
+
+
+def convert_pdf(pdf_path: str) -> bytes:
+    """Convert a PDF to DOCX bytes, one section per page."""
+    doc = Document()
+    with open(pdf_path, "rb") as fh:
+        reader = PdfReader(fh, strict=False)
+        for number, page in enumerate(reader.pages):
+            section = doc.sections[0] if number == 0 else doc.add_section(WD_SECTION.NEW_PAGE)
+            width_pt, height_pt = float(page.mediabox.width), float(page.mediabox.height)
+            if page.rotation % 180:
+                width_pt, height_pt = height_pt, width_pt
+            _apply_page_size(section, (width_pt, height_pt))
+
+            picture = render_page(page)
+            # Leave a little room so the picture never spills onto a new page
+            max_w = width_pt - 2 * PAGE_MARGIN_PT
+            max_h = height_pt - 2 * PAGE_MARGIN_PT - TEXT_SIZE_PT * 2
+            fit = min(max_w / width_pt, max_h / height_pt)
+            paragraph = doc.paragraphs[0] if number == 0 and doc.paragraphs else doc.add_paragraph()
+            paragraph.add_run().add_picture(
+                io.BytesIO(picture), width=Pt(width_pt * fit), height=Pt(height_pt * fit)
+            )
+
+            text = page.extract_text() or ""
+            for line in text.splitlines():
+                if line.strip():
+                    run = doc.add_paragraph().add_run(line.strip())
+                    run.font.size = Pt(TEXT_SIZE_PT)
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
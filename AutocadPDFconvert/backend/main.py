@@ -1,39 +1,87 @@
-import io
 import os
-import zipfile
+import json
+import time
 import uuid
+import secrets
 import asyncio
+from contextlib import asynccontextmanager
 from typing import List, Dict
-from docx import Document
-from docxcompose.composer import Composer
-from docx.shared import Pt
-from docx.enum.section import WD_ORIENT, WD_SECTION
-from pypdf import PdfReader
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException
+from fastapi import Body, FastAPI, UploadFile, File, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
-from adobe.pdfservices.operation.auth.service_principal_credentials import (
-    ServicePrincipalCredentials,
+from fastapi import Query
+
+from backend.client_registry import CLIENT_REGISTRY
+from backend.artifacts import (
+    archive_names,
+    claim_artifact_name,
+    describe_artifact,
+    job_output_dir,
+    remove_job_outputs,
 )
-from adobe.pdfservices.operation.pdf_services import PDFServices
-from adobe.pdfservices.operation.pdf_services_media_type import PDFServicesMediaType
-from adobe.pdfservices.operation.pdfjobs.jobs.export_pdf_job import ExportPDFJob
-from adobe.pdfservices.operation.pdfjobs.params.export_pdf.export_pdf_params import (
-    ExportPDFParams,
+from backend.conversion_cache import CONVERSION_CACHE, cache_key
+from backend.conversion_backends import EXPORT_OCR_LANG, EXPORT_TARGET_FORMAT, LOCAL_BACKEND
+from backend.credential_pool import CREDENTIAL_POOL
+from backend.cpu_executor import CPU_EXECUTOR
+from backend.job_poller import JOB_POLLER
+from backend.job_store import JOB_STORE, FileState, summarize
+from backend.metrics import (
+    BYTES,
+    LOOP_LAG_INTERVAL,
+    METRICS,
+    add_job_metrics,
+    count,
+    flush_job,
+    monitor_loop_lag,
+    span,
 )
-from adobe.pdfservices.operation.pdfjobs.params.export_pdf.export_pdf_target_format import (
-    ExportPDFTargetFormat,
+from backend.pdf_store import PDF_STORE, parse_manifest
+from backend.pipeline import (
+    JOB_LISTENERS,
+    archive_name,
+    count_cache,
+    fail_file,
+    notify_job,
+    set_file,
+    store_file,
 )
-from adobe.pdfservices.operation.pdfjobs.result.export_pdf_result import (
-    ExportPDFResult,
+from backend.plotter import (
+    PLOT_DEFAULT_CTB,
+    PLOT_DEFAULT_LAYOUT,
+    PLOT_DEFAULT_PAPER,
+    PLOTTER,
+    PlotError,
+    check_plot_options,
 )
-from fastapi import Query
+from backend.spool import job_spool_dir, link_or_copy, remove_job_spool, spool_upload
+from backend.worker import TASK_LEASE_SECONDS, TASK_MAX_CLAIMS, Worker
+from backend.zip_stream import ZipStream, parse_range
 
 # --------------------------------------------------
 # App + CORS
 # --------------------------------------------------
-app = FastAPI(title="Batch PDF → DOCX Converter")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await CLIENT_REGISTRY.start()
+    background = [asyncio.create_task(maintain_jobs())]
+    if LOOP_LAG_INTERVAL:
+        background.append(asyncio.create_task(monitor_loop_lag()))
+    if WORKER is not None:
+        # Start the CPU workers now, not on the first batch's first merge
+        await CPU_EXECUTOR.start()
+        background.append(asyncio.create_task(WORKER.run()))
+    yield
+    for task in background:
+        task.cancel()
+    # Lets the worker put its unfinished tasks back in the queue
+    await asyncio.gather(*background, return_exceptions=True)
+    await CLIENT_REGISTRY.aclose()
+    LOCAL_BACKEND.shutdown()
+    CPU_EXECUTOR.shutdown()
+
+app = FastAPI(title="Batch PDF → DOCX Converter", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,353 +93,624 @@ app.add_middleware(
 # --------------------------------------------------
 # Adobe credentials
 # --------------------------------------------------
-ADOBE_CLIENT_ID = os.getenv("PDF_SERVICES_CLIENT_ID")
-ADOBE_CLIENT_SECRET = os.getenv("PDF_SERVICES_CLIENT_SECRET")
-
-if not ADOBE_CLIENT_ID or not ADOBE_CLIENT_SECRET:
+# Every configured account is in CREDENTIAL_POOL (backend.credential_pool)
+if not len(CREDENTIAL_POOL):
     raise RuntimeError("Adobe credentials not set")
 
 # --------------------------------------------------
 # Global job store
 # --------------------------------------------------
-JOB_STATUS: Dict[str, Dict[str, Dict]] = {}
-JOB_ZIPS: Dict[str, bytes] = {}
+# Job state lives in JOB_STORE (backend.job_store), shared by all workers;
+# so does the queue of conversion tasks (backend.worker).
 
-# --------------------------------------------------
-# Helpers
-# --------------------------------------------------
-async def run_with_timeout(fn, timeout=120):
-    return await asyncio.wait_for(asyncio.to_thread(fn), timeout)
+# Finished jobs (and their files on disk) are dropped after this long
+JOB_TTL = float(os.getenv("JOB_TTL_HOURS", "24")) * 3600
+JOB_MAINTENANCE_INTERVAL = 15.0
 
-def chunk_list(items, size=10):
-    for i in range(0, len(items), size):
-        yield items[i:i + size]
+# Run a conversion worker in this process too. backend.launcher turns it
+# off when it starts separate workers (python -m backend.worker).
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "1") == "1"
+WORKER = Worker() if EMBEDDED_WORKER else None
 
-def get_pdf_page_size(pdf_bytes: bytes):
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    page = reader.pages[0]
-    box = page.mediabox
+# /convert/events: changes are pushed at most this often per stream; the
+# store is re-checked on a timer too, for jobs run by another worker
+SSE_COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_SECONDS", "0.5"))
+SSE_POLL_INTERVAL = 2.0
+SSE_KEEPALIVE_INTERVAL = 15.0
 
-    width_pt = float(box.width)
-    height_pt = float(box.height)
+# Event streams waiting for changes are in JOB_LISTENERS (backend.pipeline)
 
-    return width_pt, height_pt  # points
+# Shared secret remote workers send as "Authorization: Bearer ...". The
+# /tasks endpoints hand out uploads and accept outputs, so they are off
+# unless it is set.
+WORKER_TOKEN = os.getenv("WORKER_TOKEN")
 
-async def apply_cooldown(job_id: str, seconds: int):
-    meta = JOB_STATUS[job_id]["__meta__"]
-    meta["cooldown"] = True
-
-    for remaining in range(seconds, 0, -1):
-        meta["cooldown_remaining"] = remaining
-        await asyncio.sleep(1)
-
-    meta["cooldown"] = False
-    meta["cooldown_remaining"] = 0
+# --------------------------------------------------
+# Helpers
+# --------------------------------------------------
+def job_summary(job_id: str):
+    counters = JOB_STORE.get_counters(job_id)
+    return summarize(counters) if counters is not None else None
 
+def new_job_meta(folder_name: str) -> Dict:
+    return {
+        "folder_name": folder_name,
+        "created": time.time(),
+        "rate_limit": CLIENT_REGISTRY.rate_limits(),
+        "cache": {"hits": 0, "misses": 0},
+        "cache_store": CONVERSION_CACHE.stats(),
+        "accounts": CREDENTIAL_POOL.snapshot(),
+    }
 
 # --------------------------------------------------
-# Background worker
+# Maintenance
 # --------------------------------------------------
-async def process_batch(job_id: str, files: List[Dict]):
-    credentials = ServicePrincipalCredentials(
-        client_id=ADOBE_CLIENT_ID,
-        client_secret=ADOBE_CLIENT_SECRET,
-    )
-    pdf_services = PDFServices(credentials)
-    zip_buffer = io.BytesIO()
-    COOLDOWN_SECONDS = 30
-    merged_docx_items: List[bytes] = []
-    chunks = list(chunk_list(files, 5))
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_writer:
-        for batch_index, chunk in enumerate(chunks, start=1):
-            for f in chunk:
-                name = f["name"]
-                JOB_STATUS[job_id][name]["status"] = (
-                    f"Batch {batch_index}/{len(chunks)} – Preparing"
-                )
-                JOB_STATUS[job_id][name]["progress"] = 5
-                pdf_bytes = f["bytes"]
-                out_name = os.path.splitext(name)[0] + ".docx"
-                try:
-                    if not pdf_bytes:
-                        raise ValueError("Empty file")
-                    JOB_STATUS[job_id][name]["status"] = "Uploading"
-                    JOB_STATUS[job_id][name]["progress"] = 25
-                    pdf_stream = io.BytesIO()
-                    pdf_stream.write(pdf_bytes)
-                    pdf_stream.seek(0)
-                    input_asset = pdf_services.upload(
-                        input_stream=pdf_stream,
-                        mime_type=PDFServicesMediaType.PDF,
-                    )
-                    JOB_STATUS[job_id][name]["status"] = "Converting"
-                    JOB_STATUS[job_id][name]["progress"] = 55
-                    export_job = ExportPDFJob(
-                        input_asset=input_asset,
-                        export_pdf_params=ExportPDFParams(
-                            target_format=ExportPDFTargetFormat.DOCX
-                        ),
-                    )
-                    location = await run_with_timeout(
-                        lambda: pdf_services.submit(export_job)
-                    )
-                    job_result = await run_with_timeout(
-                        lambda: pdf_services.get_job_result(
-                            location, ExportPDFResult
-                        )
-                    )
-                    JOB_STATUS[job_id][name]["status"] = "Finalizing"
-                    JOB_STATUS[job_id][name]["progress"] = 90
-                    result_asset = job_result.get_result().get_asset()
-                    stream_asset = pdf_services.get_content(result_asset)
-                    stream = stream_asset.get_input_stream()
-                    if isinstance(stream, (bytes, bytearray)):
-                        docx_bytes = stream
-                    else:
-                        docx_bytes = stream.read()
-                    if not docx_bytes:
-                        raise RuntimeError("Empty DOCX output")
-                    zip_writer.writestr(out_name, docx_bytes)
-                    merged_docx_items.append({
-                        "docx": docx_bytes,
-                        "page_size": f["page_size"],
-                    })
-                    JOB_STATUS[job_id][name]["status"] = "Converted ✔"
-                    JOB_STATUS[job_id][name]["progress"] = 100
-                    JOB_STATUS[job_id][name]["output"] = True
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"[ERROR] {name}: {error_msg}")
-                    JOB_STATUS[job_id][name]["status"] = f"Failed ❌"
-                    JOB_STATUS[job_id][name]["progress"] = 0
-                    JOB_STATUS[job_id][name]["output"] = False
-                    await apply_cooldown(job_id, 20)
-                    if "Request could not be completed" in error_msg:
-                        JOB_STATUS[job_id][name]["status"] = "Retrying…"
-                        JOB_STATUS[job_id][name]["progress"] = 20
-                        await asyncio.sleep(5)
-                        try:
-                            # recreate stream (important)
-                            pdf_stream = io.BytesIO(pdf_bytes)
-                            input_asset = pdf_services.upload(
-                                input_stream=pdf_stream,
-                                mime_type=PDFServicesMediaType.PDF,
-                            )
-                            export_job = ExportPDFJob(
-                                input_asset=input_asset,
-                                export_pdf_params=ExportPDFParams(
-                                    target_format=ExportPDFTargetFormat.DOCX
-                                ),
-                            )
-                            location = await run_with_timeout(
-                                lambda: pdf_services.submit(export_job)
-                            )
-                            job_result = await run_with_timeout(
-                                lambda: pdf_services.get_job_result(
-                                    location, ExportPDFResult
-                                )
-                            )
-                            result_asset = job_result.get_result().get_asset()
-                            stream_asset = pdf_services.get_content(result_asset)
-                            stream = stream_asset.get_input_stream()
-                            docx_bytes = stream if isinstance(stream, (bytes, bytearray)) else stream.read()
-                            if not docx_bytes:
-                                raise RuntimeError("Empty DOCX output")
-                            zip_writer.writestr(out_name, docx_bytes)
-                            merged_docx_items.append({
-                                "docx": docx_bytes,
-                                "page_size": f["page_size"],
-                            })
-                            JOB_STATUS[job_id][name]["status"] = "Converted ✔"
-                            JOB_STATUS[job_id][name]["progress"] = 100
-                            JOB_STATUS[job_id][name]["output"] = True
-                            continue   # 🔴 VERY IMPORTANT
-                        except Exception as e2:
-                            error_msg2 = str(e2)
-                            print(f"[ERROR] Retry failed for {name}: {error_msg2}")
-                            JOB_STATUS[job_id][name]["status"] = f"Failed ❌"
-                            JOB_STATUS[job_id][name]["progress"] = 0
-                            JOB_STATUS[job_id][name]["output"] = False
-                    # --------------------------------------------------
-        # Merge all DOCX into ONE combined document
-        # --------------------------------------------------
-        if len(merged_docx_items) >= 2:
-            try:
-                combined_bytes = merge_docx_bytes(merged_docx_items)
-
-                combined_name = (
-                    JOB_STATUS[job_id]["__meta__"]["folder_name"]
-                    .replace(" ", "_")
-                    + "_COMBINED.docx"
-                )
-                zip_writer.writestr(combined_name, combined_bytes)
-                # 👇 expose for UI / status
-                JOB_STATUS[job_id]["__meta__"]["combined"] = combined_name
-            except Exception as e:
-                print("[WARN] DOCX merge failed:", e)
-            # ---- cooldown after every 10 files ----
-            meta = JOB_STATUS[job_id]["__meta__"]
-            if batch_index < len(chunks):
-                for remaining in range(COOLDOWN_SECONDS, 0, -1):
-                    meta["cooldown"] = True
-                    meta["cooldown_remaining"] = remaining
-                    await asyncio.sleep(10)
-                meta["cooldown"] = False
-                meta["cooldown_remaining"] = 0
-    zip_buffer.seek(0)
-    JOB_ZIPS[job_id] = zip_buffer.getvalue()
+async def maintain_jobs():
+    """Evict expired jobs and their files."""
+    while True:
+        try:
+            evicted = await asyncio.to_thread(
+                JOB_STORE.evict_finished, time.time() - JOB_TTL
+            )
+            for job_id in evicted:
+                remove_job_outputs(job_id)
+                remove_job_spool(job_id)
+        except Exception as e:
+            print("[WARN] Job maintenance failed:", e)
+        await asyncio.sleep(JOB_MAINTENANCE_INTERVAL)
 
 # --------------------------------------------------
 # Start batch
 # --------------------------------------------------
+@app.post("/convert/batch/prepare")
+def prepare_batch(payload: Dict = Body(...)):
+    """
+    Hash-first upload: given the batch's manifest, {"files": [{"name",
+    "size", "sha256"}]}, say which PDFs still have to be sent ("missing")
+    and which the server has ("have"; "converted" if their DOCX is cached).
+    Then POST the missing ones to /convert/batch with the same manifest.
+    """
+    try:
+        manifest = parse_manifest(payload.get("files"))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    hashes = sorted({f["sha256"] for f in manifest})
+    have = [h for h in hashes if PDF_STORE.contains(h)]
+    converted = [
+        h for h in have
+        if CONVERSION_CACHE.contains(cache_key(h, EXPORT_TARGET_FORMAT, EXPORT_OCR_LANG))
+    ]
+    return {
+        "missing": sorted(set(hashes) - set(have)),
+        "have": have,
+        "converted": converted,
+    }
+
 @app.post("/convert/batch")
 async def start_batch(
-    background_tasks: BackgroundTasks,
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(None),
+    manifest: str = Form(None),
 ):
+    """
+    Without a manifest: every file of the batch, as before. With one (see
+    /convert/batch/prepare): only the files the server doesn't have; the
+    job is built in manifest order. 409 {"missing": [...]} if a PDF the
+    server had is gone by now; upload those too and try again.
+    """
+    files = files or []
+    if manifest is not None:
+        try:
+            entries = parse_manifest(json.loads(manifest))
+        except ValueError as e:
+            raise HTTPException(400, f"Bad manifest: {e}")
+    elif not files:
+        raise HTTPException(400, "No files")
     job_id = str(uuid.uuid4())
-    JOB_STATUS[job_id] = {}
     payloads = []
     folder_name = None
-    for f in files:
-        data = await f.read()
+    spool_dir = job_spool_dir(job_id)
+    uploaded = {}
+    for index, f in enumerate(files):
+        # Stream to disk; only the path and metadata stay in memory
+        with span("spool", job_id):
+            spooled = await spool_upload(
+                f, spool_dir / (f"{index:05d}.pdf" if manifest is None else f"upload-{index:05d}.pdf")
+            )
+        count(BYTES, spooled["size"], job_id, "upload_in")
+        # Kept by hash, so the next batch with this PDF can skip sending it
+        await asyncio.to_thread(PDF_STORE.put_file, spooled["sha256"], spooled["path"])
+        if manifest is not None:
+            # Placed per manifest entry below
+            if spooled["sha256"] in uploaded:
+                os.unlink(spooled["path"])
+            uploaded.setdefault(spooled["sha256"], spooled)
+            continue
         # 👇 extract folder name once
         if folder_name is None and "/" in f.filename:
             folder_name = f.filename.split("/", 1)[0]
         basename = os.path.basename(f.filename)
-        JOB_STATUS[job_id][basename] = {
-            "name": basename,
-            "status": "Queued",
-            "progress": 0,
-            "output": False,
-        }
-        payloads.append({
-            "name": basename,
-            "bytes": data,
-            "page_size": get_pdf_page_size(data),
-        })
+        payloads.append({"name": basename, **spooled})
+    for payload, arcname in zip(payloads, archive_names([f.filename for f in files])):
+        payload["arcname"] = arcname
+    if manifest is not None:
+        payloads, missing = await asyncio.to_thread(
+            spool_from_manifest, job_id, entries, uploaded
+        )
+        if missing:
+            remove_job_spool(job_id)
+            raise HTTPException(409, {"missing": missing})
+        folder_name = next(
+            (e["name"].split("/", 1)[0] for e in entries if "/" in e["name"]), None
+        )
     # Fallback if user uploaded loose files
     if not folder_name:
         folder_name = "converted_batch"
     # 🔐 Store it
-    JOB_STATUS[job_id]["__meta__"] = {
-        "folder_name": folder_name
-    }
-    background_tasks.add_task(process_batch, job_id, payloads)
+    await asyncio.to_thread(JOB_STORE.create_job, job_id, new_job_meta(folder_name), payloads)
+    await asyncio.to_thread(flush_job, job_id)
+    if WORKER is not None:
+        WORKER.wake()
+    return {"job_id": job_id, "folder": folder_name}
+
+def spool_from_manifest(job_id: str, entries: List[Dict], uploaded: Dict):
+    """
+    (payloads, missing hashes): one spooled PDF per manifest entry, from
+    this request's uploads or else the PDF store.
+    """
+    spool_dir = job_spool_dir(job_id)
+    payloads = []
+    missing = set()
+    arcnames = archive_names([entry["name"] for entry in entries])
+    for index, entry in enumerate(entries):
+        dest = spool_dir / f"{index:05d}.pdf"
+        sha256 = entry["sha256"]
+        if sha256 in uploaded:
+            link_or_copy(uploaded[sha256]["path"], dest)
+        elif PDF_STORE.link_to(sha256, dest):
+            count(BYTES, dest.stat().st_size, job_id, "upload_skipped")
+        else:
+            missing.add(sha256)
+            continue
+        payloads.append({
+            "name": os.path.basename(entry["name"]),
+            "arcname": arcnames[index],
+            "path": str(dest),
+            "size": dest.stat().st_size,
+            "sha256": sha256,
+        })
+    for spooled in uploaded.values():
+        os.unlink(spooled["path"])
+    return payloads, sorted(missing)
+
+# --------------------------------------------------
+# DWG → PDF plotting
+# --------------------------------------------------
+def plot_options(layout: str, paper: str, ctb: str) -> Dict:
+    try:
+        check_plot_options(layout, paper, ctb)
+    except PlotError as e:
+        raise HTTPException(400, str(e))
+    return {"layout": layout, "paper": paper, "ctb": ctb}
+
+@app.post("/convert_dwg")
+async def convert_dwg(
+    file: UploadFile = File(...),
+    layout: str = Form(PLOT_DEFAULT_LAYOUT),
+    paper: str = Form(PLOT_DEFAULT_PAPER),
+    ctb: str = Form(PLOT_DEFAULT_CTB),
+):
+    """Plot one drawing and return the PDF."""
+    options = plot_options(layout, paper, ctb)
+    work_id = "dwg-" + str(uuid.uuid4())
+    spool_dir = job_spool_dir(work_id)
+    spooled = await spool_upload(file, spool_dir / "drawing.dwg")
+    count(BYTES, spooled["size"], label="upload_in")
+    try:
+        with span("plot"):
+            pdf_path = await PLOTTER.plot(spooled["path"], spool_dir / "drawing.pdf", **options)
+    except PlotError as e:
+        remove_job_spool(work_id)
+        raise HTTPException(422, str(e))
+    count(BYTES, pdf_path.stat().st_size, label="pdf_out")
+    return FileResponse(
+        pdf_path,
+        media_type="application/pdf",
+        filename=os.path.splitext(os.path.basename(file.filename))[0] + ".pdf",
+        background=BackgroundTask(remove_job_spool, work_id),
+    )
+
+@app.post("/convert_dwg/batch")
+async def start_dwg_batch(
+    files: List[UploadFile] = File(...),
+    layout: str = Form(PLOT_DEFAULT_LAYOUT),
+    paper: str = Form(PLOT_DEFAULT_PAPER),
+    ctb: str = Form(PLOT_DEFAULT_CTB),
+):
+    """
+    Plot drawings and convert the PDFs to DOCX in one job; progress and
+    downloads work as for /convert/batch.
+    """
+    options = plot_options(layout, paper, ctb)
+    job_id = str(uuid.uuid4())
+    payloads = []
+    folder_name = None
+    spool_dir = job_spool_dir(job_id)
+    arcnames = archive_names([f.filename for f in files])
+    for index, (f, arcname) in enumerate(zip(files, arcnames)):
+        with span("spool", job_id):
+            spooled = await spool_upload(f, spool_dir / f"{index:05d}.dwg")
+        count(BYTES, spooled["size"], job_id, "upload_in")
+        if folder_name is None and "/" in f.filename:
+            folder_name = f.filename.split("/", 1)[0]
+        payloads.append({
+            "name": os.path.basename(f.filename),
+            "arcname": arcname,
+            "dwg": spooled["path"],
+            "size": spooled["size"],
+            "plot": options,
+        })
+    if not folder_name:
+        folder_name = "converted_batch"
+    await asyncio.to_thread(JOB_STORE.create_job, job_id, new_job_meta(folder_name), payloads)
+    await asyncio.to_thread(flush_job, job_id)
+    if WORKER is not None:
+        WORKER.wake()
     return {"job_id": job_id, "folder": folder_name}
 
 # --------------------------------------------------
 # Poll status
 # --------------------------------------------------
 @app.get("/convert/status/{job_id}")
-def get_status(job_id: str):
-    if job_id not in JOB_STATUS:
+def get_status(job_id: str, since: int = Query(None)):
+    """
+    Without `since`: every file record followed by the job meta.
+    With `since`: only files changed after that version, plus the summary;
+    pass the returned "version" back as the next `since`.
+    """
+    if since is None:
+        files = JOB_STORE.get_files(job_id)
+        if files is None:
+            raise HTTPException(404, "Job not found")
+        return files + [JOB_STORE.get_meta(job_id)]
+    summary = job_summary(job_id)
+    if summary is None:
         raise HTTPException(404, "Job not found")
-    return list(JOB_STATUS[job_id].values())
+    version, records, finished = JOB_STORE.get_changes(job_id, since)
+    return {
+        "version": version,
+        "files": records,
+        "summary": summary,
+        "finished": finished,
+    }
+
+# --------------------------------------------------
+# Push status (Server-Sent Events)
+# --------------------------------------------------
+def _sse(event: str, version: int, data: Dict) -> str:
+    return f"id: {version}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_job_events(job_id: str):
+    """
+    One "snapshot" event, then an "update" with only the files that changed
+    (plus summary counters) per coalescing window, then "done".
+    """
+    wake = asyncio.Event()
+    JOB_LISTENERS.setdefault(job_id, set()).add(wake)
+    try:
+        version, records, finished = JOB_STORE.get_changes(job_id, -1)
+        yield _sse("snapshot", version, {
+            "files": records, "summary": job_summary(job_id),
+        })
+        last_sent = time.monotonic()
+        while not finished:
+            try:
+                await asyncio.wait_for(wake.wait(), SSE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            current = JOB_STORE.get_version(job_id)
+            if current is None:
+                return
+            if current == version:
+                if time.monotonic() - last_sent > SSE_KEEPALIVE_INTERVAL:
+                    last_sent = time.monotonic()
+                    yield ": keep-alive\n\n"
+                continue
+            # Let a burst of updates collapse into one event
+            await asyncio.sleep(SSE_COALESCE_SECONDS)
+            version, records, finished = JOB_STORE.get_changes(job_id, version)
+            if records:
+                last_sent = time.monotonic()
+                yield _sse("update", version, {
+                    "files": records, "summary": job_summary(job_id),
+                })
+        meta = JOB_STORE.get_meta(job_id) or {}
+        yield _sse("done", version, {
+            "summary": job_summary(job_id),
+            "combined": meta.get("combined"),
+        })
+    finally:
+        listeners = JOB_LISTENERS.get(job_id)
+        if listeners is not None:
+            listeners.discard(wake)
+            if not listeners:
+                del JOB_LISTENERS[job_id]
+
+@app.get("/convert/events/{job_id}")
+def job_events(job_id: str):
+    if JOB_STORE.get_version(job_id) is None:
+        raise HTTPException(404, "Job not found")
+    return StreamingResponse(
+        stream_job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # --------------------------------------------------
 # Download ZIP
 # --------------------------------------------------
 @app.get("/convert/download/{job_id}")
-def download_zip(job_id: str, include_merged: int = Query(1)):
-    if job_id not in JOB_ZIPS:
+def download_zip(job_id: str, request: Request, include_merged: int = Query(1)):
+    outputs = JOB_STORE.get_outputs(job_id)
+    if outputs is None:
         raise HTTPException(404, "ZIP not ready")
-    zip_bytes = JOB_ZIPS[job_id]
-    if include_merged == 0:
-        # remove combined docx from zip
-        zip_in = io.BytesIO(zip_bytes)
-        zip_out = io.BytesIO()
-        with zipfile.ZipFile(zip_in, "r") as zin, \
-             zipfile.ZipFile(zip_out, "w", zipfile.ZIP_DEFLATED) as zout:
-            for item in zin.infolist():
-                if item.filename.endswith("_COMBINED.docx"):
-                    continue
-                zout.writestr(item, zin.read(item.filename))
-        zip_bytes = zip_out.getvalue()
-    folder_name = JOB_STATUS[job_id].get("__meta__", {}).get(
+    members = [
+        m for m in outputs
+        if include_merged or not m.get("combined")
+    ]
+    archive = ZipStream(members)
+    folder_name = (JOB_STORE.get_meta(job_id) or {}).get(
         "folder_name", "converted_batch"
     )
     safe_name = folder_name.replace(" ", "_")
+    headers = {
+        "Content-Disposition": (
+            f'attachment; filename="{safe_name}_converted.zip"'
+        ),
+        "Accept-Ranges": "bytes",
+        "ETag": archive.etag,
+    }
+    # Resume only if the archive is still the one the client started on
+    if_range = request.headers.get("if-range")
+    range_header = request.headers.get("range")
+    if if_range and if_range != archive.etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, archive.size)
+    except ValueError:
+        raise HTTPException(
+            416, "Range not satisfiable",
+            headers={"Content-Range": f"bytes */{archive.size}"},
+        )
+    if byte_range is None:
+        start, end, status_code = 0, archive.size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{archive.size}"
+    headers["Content-Length"] = str(end - start + 1)
     return StreamingResponse(
-        io.BytesIO(zip_bytes),
+        metered_zip(job_id, archive.iter_bytes(start, end)),
+        status_code=status_code,
         media_type="application/zip",
-        headers={
-            "Content-Disposition": (
-                f'attachment; filename="{safe_name}_converted.zip"'
-            )
-        },
+        headers=headers,
     )
 
+async def metered_zip(job_id: str, chunks):
+    """Pass ZIP chunks through, timing the download and counting its bytes."""
+    sent = 0
+    try:
+        with span("zip_stream", job_id):
+            async for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+    finally:
+        count(BYTES, sent, job_id, "zip_out")
+        await asyncio.to_thread(flush_job, job_id)
 
-@app.get("/convert/summary/{job_id}")
-def get_summary(job_id: str):
-    if job_id not in JOB_STATUS:
-        raise HTTPException(404, "Job not found")
-    files = [
-        f for k, f in JOB_STATUS[job_id].items()
-        if not k.startswith("__")
-    ]
-    total = len(files)
-    converted = sum(1 for f in files if f.get("output") is True)
-    failed = sum(
-        1 for f in files
-        if f.get("status", "").startswith("Failed")
-    )
+
+# --------------------------------------------------
+# Remote workers (python -m backend.remote_worker)
+# --------------------------------------------------
+# File tasks leased over HTTP: claim, heartbeat, fetch the input, report
+# progress, upload the DOCX, complete. Merge tasks stay with the
+# workers that share the job store, since they need every artifact.
+def check_worker(request: Request, worker: str):
+    if not WORKER_TOKEN:
+        raise HTTPException(403, "Remote workers are disabled (WORKER_TOKEN is not set)")
+    if not secrets.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {WORKER_TOKEN}"
+    ):
+        raise HTTPException(401, "Bad worker token")
+    if not worker:
+        raise HTTPException(400, "worker is required")
+
+def leased_task(request: Request, task_id: int, worker: str) -> Dict:
+    """The task, if `worker` still holds its lease."""
+    check_worker(request, worker)
+    task = JOB_STORE.get_task(task_id)
+    if task is None or task["index"] is None:
+        raise HTTPException(404, "Task not found")
+    if task["state"] != "running" or task["owner"] != worker:
+        raise HTTPException(409, "Lease lost to another worker")
+    return task
+
+def finish_remote_task(task: Dict, worker: str):
+    if not JOB_STORE.complete_task(task["task_id"], worker):
+        raise HTTPException(409, "Lease lost to another worker")
+    # The job's merge task is queued now
+    if WORKER is not None:
+        WORKER.wake()
+
+@app.post("/tasks/claim")
+def claim_task(request: Request, payload: Dict = Body(...)):
+    """
+    Lease the oldest file task: 200 with the task and what the worker
+    needs to convert it, or 204 if there is nothing to do.
+    """
+    worker = payload.get("worker")
+    check_worker(request, worker)
+    while True:
+        task = JOB_STORE.claim_task(worker, time.time() + TASK_LEASE_SECONDS, files_only=True)
+        if task is None:
+            return Response(status_code=204)
+        job_id, index = task["job_id"], task["index"]
+        f = JOB_STORE.get_work_item(job_id, index)
+        if f is not None and not f.get("artifact") and not f.get("failed"):
+            if task["claims"] <= TASK_MAX_CLAIMS:
+                break
+            print(f"[ERROR] Giving up on job {job_id} file {index} after "
+                  f"{task['claims'] - 1} claims")
+            fail_file(job_id, index)
+        # Nothing left to do for this one
+        finish_remote_task(task, worker)
+    # A drawing not plotted yet is sent as is; the worker plots it
+    plot = bool(f.get("dwg")) and not f.get("sha256")
     return {
-        "total": total,
-        "converted": converted,
-        "failed": failed,
-        "finished": converted + failed,
+        **task,
+        "lease_seconds": TASK_LEASE_SECONDS,
+        "file": {
+            "name": f["name"],
+            "size": f["size"],
+            "sha256": None if plot else f["sha256"],
+            "plot": f["plot"] if plot else None,
+        },
     }
 
-def merge_docx_bytes(docx_items: List[Dict]) -> bytes:
+@app.post("/tasks/heartbeat")
+def renew_tasks(request: Request, payload: Dict = Body(...)):
+    """Extend every lease of the worker; lists the tasks it still holds."""
+    worker = payload.get("worker")
+    check_worker(request, worker)
+    held = JOB_STORE.renew_tasks(worker, time.time() + TASK_LEASE_SECONDS)
+    return {"tasks": held, "lease_seconds": TASK_LEASE_SECONDS}
+
+@app.post("/tasks/release")
+def release_tasks(request: Request, payload: Dict = Body(...)):
+    """Put the worker's tasks back in the queue (it is shutting down)."""
+    worker = payload.get("worker")
+    check_worker(request, worker)
+    JOB_STORE.release_tasks(worker)
+    if WORKER is not None:
+        WORKER.wake()
+    return {"ok": True}
+
+@app.get("/tasks/{task_id}/input")
+def task_input(task_id: int, request: Request, worker: str = Query(...)):
+    """The task's PDF, or its drawing if it still has to be plotted."""
+    task = leased_task(request, task_id, worker)
+    f = JOB_STORE.get_work_item(task["job_id"], task["index"])
+    path = f["dwg"] if f.get("dwg") and not f.get("sha256") else f["path"]
+    count(BYTES, os.path.getsize(path), task["job_id"], "task_input_out")
+    return FileResponse(path, media_type="application/octet-stream")
+
+@app.post("/tasks/{task_id}/progress")
+def task_progress(task_id: int, request: Request, payload: Dict = Body(...)):
+    task = leased_task(request, task_id, payload.get("worker"))
+    try:
+        state = FileState(payload["state"])
+    except (KeyError, ValueError):
+        raise HTTPException(400, "Unknown state")
+    # Final states come with the result
+    if state not in (FileState.DONE, FileState.FAILED):
+        set_file(task["job_id"], task["index"], state,
+                 int(payload.get("progress") or 0), payload.get("label"))
+    return {"ok": True}
+
+@app.put("/tasks/{task_id}/artifact")
+async def upload_artifact(task_id: int, request: Request, worker: str = Query(...)):
+    """The converted DOCX, as the raw request body."""
+    task = leased_task(request, task_id, worker)
+    # Per claim: a worker that lost the lease may still be uploading
+    path = job_output_dir(task["job_id"]) / claim_artifact_name(task, worker)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    size = 0
+    try:
+        with span("task_artifact_in", task["job_id"]):
+            with open(tmp, "wb") as out:
+                async for chunk in request.stream():
+                    size += len(chunk)
+                    await asyncio.to_thread(out.write, chunk)
+        # The lease may have run out while the body streamed in
+        leased_task(request, task_id, worker)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    count(BYTES, size, task["job_id"], "task_artifact_in")
+    return {"size": size}
+
+@app.post("/tasks/{task_id}/complete")
+async def complete_task(task_id: int, request: Request, payload: Dict = Body(...)):
     """
-    docx_items = [
-      {
-        "docx": bytes,
-        "page_size": (width_pt, height_pt)
-      },
-      ...
-    ]
+    Report the outcome of a task: {"worker", "outcome": "done" | "failed",
+    "page_sizes", "label", "cached", "metrics"}. "done" needs the artifact
+    uploaded first.
     """
+    worker = payload.get("worker")
+    task = leased_task(request, task_id, worker)
+    job_id, index = task["job_id"], task["index"]
+    outcome = payload.get("outcome")
+    if outcome == "done":
+        f = JOB_STORE.get_work_item(job_id, index)
+        # This claim's upload; recorded only if the lease is still ours
+        path = job_output_dir(job_id) / claim_artifact_name(task, worker)
+        if not path.exists():
+            raise HTTPException(400, "Upload the artifact first")
+        artifact = await asyncio.to_thread(
+            describe_artifact, path, archive_name(f)
+        )
+        work = {"artifact": artifact, "page_sizes": payload.get("page_sizes")}
+    elif outcome == "failed":
+        # The worker counted the failure in its metrics
+        work = {"failed": True}
+    else:
+        raise HTTPException(400, "outcome must be done or failed")
+
+    def record() -> bool:
+        # `work` only lands if the lease is still ours
+        if not JOB_STORE.complete_task(task_id, worker, work):
+            return False
+        if outcome == "done":
+            store_file(job_id, index, FileState.DONE, 100, payload.get("label"))
+        else:
+            store_file(job_id, index, FileState.FAILED, 0, payload.get("label"))
+        if payload.get("cached") is not None:
+            count_cache(job_id, bool(payload["cached"]))
+        add_job_metrics(job_id, payload.get("metrics"))
+        return True
+
+    # Off the event loop: the store may be busy with other workers' writes
+    if not await asyncio.to_thread(record):
+        # The new owner uploads and records an artifact of its own
+        if outcome == "done":
+            path.unlink(missing_ok=True)
+        raise HTTPException(409, "Lease lost to another worker")
+    notify_job(job_id)
+    # The job's merge task is queued now
+    if WORKER is not None:
+        WORKER.wake()
+    return {"ok": True}
 
-    if not docx_items:
-        raise RuntimeError("No DOCX files to merge")
-
-    first = docx_items[0]
-    master = Document(io.BytesIO(first["docx"]))
-    composer = Composer(master)
-
-    # Apply size to first section
-    _apply_page_size(master.sections[0], first["page_size"])
 
-    for item in docx_items[1:]:
-        # 🔴 NEW SECTION (not page break)
-        section = master.add_section(WD_SECTION.NEW_PAGE)
-        _apply_page_size(section, item["page_size"])
+# --------------------------------------------------
+# Adobe job-completion webhook
+# --------------------------------------------------
+@app.post("/convert/callback/{token}")
+async def adobe_callback(token: str):
+    JOB_POLLER.notify(token)
+    return {"ok": True}
 
-        composer.append(Document(io.BytesIO(item["docx"])))
 
-    out = io.BytesIO()
-    composer.save(out)
-    out.seek(0)
-    return out.read()
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of this process's metrics."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
 
-def _apply_page_size(section, page_size):
-    width_pt, height_pt = page_size
 
-    # Orientation
-    if width_pt > height_pt:
-        section.orientation = WD_ORIENT.LANDSCAPE
-        section.page_width = Pt(width_pt)
-        section.page_height = Pt(height_pt)
-    else:
-        section.orientation = WD_ORIENT.PORTRAIT
-        section.page_width = Pt(width_pt)
-        section.page_height = Pt(height_pt)
-
-    # 🔴 CRITICAL: remove margins
-    section.top_margin = Pt(12)
-    section.bottom_margin = Pt(12)
-    section.left_margin = Pt(12)
-    section.right_margin = Pt(12)
+@app.get("/convert/summary/{job_id}")
+def get_summary(job_id: str):
+    summary = job_summary(job_id)
+    if summary is None:
+        raise HTTPException(404, "Job not found")
+    return summary
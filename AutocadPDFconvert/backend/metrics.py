@@ -0,0 +1,284 @@
+"""
+Timing spans, counters, histograms and gauges for the conversion pipeline.
+
+Everything is exposed on /metrics in the Prometheus text format (rendered
+here, no client library needed) and also summed up per job and saved in
+the job's meta under "metrics", so a slow batch can still be looked at
+after it has finished:
+
+    "metrics": {
+        "stages": {"upload": {"count": 12, "seconds": 3.1, "max": 0.6}, ...},
+        "counters": {"bytes_total:adobe_upload": 1843200, ...}
+    }
+
+Stages: spool, plot, probe, cache_lookup, upload, submit, adobe_job
+(Adobe queueing and processing, until the poller sees the job done),
+download, local_convert, split, stitch, write_artifact, merge_append,
+merge_save, zip_stream and batch (from the upload to the job finishing).
+
+event_loop_lag_seconds samples how late a LOOP_LAG_INTERVAL timer fires on
+the server's event loop: anything CPU-bound left on the loop shows up here.
+
+Gauges (how busy the CPU workers are right now, and so on) are read from
+the component that owns them when /metrics is rendered, and are not saved
+per job.
+
+Values are per process; with several uvicorn or conversion workers each
+one reports its own. The per-job totals are summed over all of them.
+"""
+import os
+import math
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+METRICS_PREFIX = "pdfconvert"
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# How often the event loop's lag is sampled (0 turns the monitor off)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        for values, total in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(total)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # label values -> [bucket counts..., sum, count]
+        self.values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        for values, series in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%s"' % _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {count}"
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {round(series[-2], 6)}"
+            yield f"{self.name}_count{labels} {series[-1]}"
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[LabelValues, float]]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        # Called on every render: label values -> current value
+        self.collect = collect
+
+    def render(self):
+        for values, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self._metrics = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(f"{self.prefix}_{name}", help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = STAGE_BUCKETS) -> Histogram:
+        metric = Histogram(f"{self.prefix}_{name}", help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str],
+              collect: Callable[[], Dict[LabelValues, float]]) -> Gauge:
+        metric = Gauge(f"{self.prefix}_{name}", help_text, labels, collect)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for metric in self._metrics:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry()
+
+STAGE_SECONDS = METRICS.histogram(
+    "stage_seconds", "Time spent in each pipeline stage", ("stage",)
+)
+BYTES = METRICS.counter(
+    "bytes_total", "Bytes received from clients, sent to and from Adobe, and served",
+    ("direction",),
+)
+RETRIES = METRICS.counter("retries_total", "File retries by error class", ("kind",))
+COOLDOWN_SECONDS = METRICS.counter(
+    "cooldown_seconds_total",
+    "Seconds files waited before a retry or for an Adobe account to free up",
+)
+TRANSACTIONS = METRICS.counter(
+    "adobe_transactions_total", "ExportPDF transactions (quota used) per account",
+    ("account",),
+)
+FILES = METRICS.counter("files_total", "Files finished, by outcome", ("outcome",))
+LOOP_LAG = METRICS.histogram(
+    "event_loop_lag_seconds", "How late a timer on the server's event loop fires",
+    buckets=LAG_BUCKETS,
+)
+
+# job id -> what this process added since its last flush:
+# {"stages": {stage: {...}}, "counters": {key: value}}
+_jobs: Dict[str, Dict] = {}
+
+
+def _job(job_id: str) -> Dict:
+    job = _jobs.get(job_id)
+    if job is None:
+        job = _jobs[job_id] = {"stages": {}, "counters": {}}
+    return job
+
+
+def observe_stage(stage: str, seconds: float, job_id: Optional[str] = None):
+    with METRICS.lock:
+        STAGE_SECONDS.observe(seconds, stage)
+        if job_id is None:
+            return
+        stats = _job(job_id)["stages"].setdefault(
+            stage, {"count": 0, "seconds": 0.0, "max": 0.0}
+        )
+        stats["count"] += 1
+        stats["seconds"] = round(stats["seconds"] + seconds, 3)
+        stats["max"] = round(max(stats["max"], seconds), 3)
+
+
+@contextmanager
+def span(stage: str, job_id: Optional[str] = None):
+    """Time a block as one `stage` observation (exceptions included)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0, job_id)
+
+
+def count(counter: Counter, amount: float = 1, job_id: Optional[str] = None,
+          label: Optional[str] = None):
+    """Add to a counter (and the job's copy); `label` is its one label value."""
+    label_values = (label,) if label is not None else ()
+    with METRICS.lock:
+        counter.inc(amount, *label_values)
+        if job_id is None:
+            return
+        key = ":".join((counter.name[len(METRICS_PREFIX) + 1:],) + label_values)
+        counters = _job(job_id)["counters"]
+        counters[key] = round(counters.get(key, 0) + amount, 3)
+
+
+def _add_job_metrics(saved: Optional[Dict], added: Dict) -> Dict:
+    merged = {
+        "stages": {k: dict(v) for k, v in (saved or {}).get("stages", {}).items()},
+        "counters": dict((saved or {}).get("counters", {})),
+    }
+    for stage, stats in added["stages"].items():
+        total = merged["stages"].setdefault(stage, {"count": 0, "seconds": 0.0, "max": 0.0})
+        total["count"] += stats["count"]
+        total["seconds"] = round(total["seconds"] + stats["seconds"], 3)
+        total["max"] = max(total["max"], stats["max"])
+    for key, value in added["counters"].items():
+        merged["counters"][key] = round(merged["counters"].get(key, 0) + value, 3)
+    return merged
+
+
+def take_job(job_id: str) -> Optional[Dict]:
+    """What this process measured for the job since the last take/flush."""
+    with METRICS.lock:
+        return _jobs.pop(job_id, None)
+
+
+def add_job_metrics(job_id: str, added: Optional[Dict]):
+    """Add measurements (from take_job) to the totals in the job's meta."""
+    if not added:
+        return
+    # Imported here: this module is also loaded in CPU worker processes,
+    # which have no business opening the job store
+    from backend.job_store import JOB_STORE
+
+    JOB_STORE.merge_meta(
+        job_id, lambda meta: {"metrics": _add_job_metrics(meta.get("metrics"), added)}
+    )
+
+
+def flush_job(job_id: str):
+    """
+    Add what this process measured for the job to the totals in its meta.
+    Several workers convert files of the same job, so each only ever adds.
+    """
+    add_job_metrics(job_id, take_job(job_id))
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Sample how late the event loop runs a timer, until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        with METRICS.lock:
+            LOOP_LAG.observe(lag)
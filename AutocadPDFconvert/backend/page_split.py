@@ -0,0 +1,148 @@
+"""
+Split-by-page conversion for long PDFs (opt-in).
+
+A multi-hundred-page specification would otherwise be one ExportPDF job,
+converted serially on Adobe's side and bounded by a single job timeout.
+With SPLIT_PAGES_OVER set, a PDF with more pages than that is cut with
+pypdf into ranges of SPLIT_RANGE_PAGES pages. Up to SPLIT_PARALLEL ranges
+of one document are converted at once, and the DOCX parts are stitched
+back in page order with IncrementalMerger, each part's sections sized
+from the page probe.
+
+A range that fails is retried on its own (SPLIT_RANGE_RETRIES times);
+outages are not, they go straight to the caller's offline fallback.
+Finished parts are kept in the job spool until the document is stitched,
+so if the whole file has to be converted again (retry, fallback to the
+local backend, restart) only the missing ranges are redone.
+"""
+import os
+import random
+import shutil
+import asyncio
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from pypdf import PdfReader, PdfWriter
+
+from backend.retry_policy import is_outage_error
+from backend.docx_merge import IncrementalMerger
+from backend.job_store import FileState
+from backend.metrics import span
+from backend.pdf_probe import page_sizes
+
+# 0 turns splitting off
+SPLIT_PAGES_OVER = int(os.getenv("SPLIT_PAGES_OVER", "0"))
+SPLIT_RANGE_PAGES = max(1, int(os.getenv("SPLIT_RANGE_PAGES", "50")))
+SPLIT_PARALLEL = int(os.getenv("SPLIT_PARALLEL", "4"))
+SPLIT_RANGE_RETRIES = int(os.getenv("SPLIT_RANGE_RETRIES", "2"))
+
+# convert_part(part) - DOCX bytes for a work record of one range
+ConvertPart = Callable[[Dict], Awaitable[bytes]]
+
+
+def page_ranges(count: int, size: int = SPLIT_RANGE_PAGES) -> List[Tuple[int, int]]:
+    """[start, stop) page ranges of at most `size` pages."""
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+def should_split(pages: List[Dict]) -> bool:
+    return bool(SPLIT_PAGES_OVER) and len(pages) > max(SPLIT_PAGES_OVER, SPLIT_RANGE_PAGES)
+
+
+def parts_dir(pdf_path: str) -> Path:
+    return Path(pdf_path).with_suffix(".parts")
+
+
+def write_ranges(pdf_path: str, ranges: List[Tuple[int, int]], out_dir: Path) -> List[str]:
+    """Write each range as its own PDF (reusing ones already written)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = [str(out_dir / f"{n:04d}.pdf") for n in range(len(ranges))]
+    missing = [n for n, path in enumerate(paths) if not os.path.exists(path)]
+    if missing:
+        with open(pdf_path, "rb") as fh:
+            reader = PdfReader(fh, strict=False)
+            for n in missing:
+                writer = PdfWriter()
+                writer.append(reader, pages=ranges[n])
+                tmp = paths[n] + ".tmp"
+                with open(tmp, "wb") as out:
+                    writer.write(out)
+                os.replace(tmp, paths[n])
+    return paths
+
+
+def _write_part(path: str, docx_bytes: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as out:
+        out.write(docx_bytes)
+    os.replace(tmp, path)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+async def convert_split(job_id: str, f: Dict, pages: List[Dict],
+                        convert_part: ConvertPart,
+                        progress: Callable[[FileState, int, str], None]) -> bytes:
+    """
+    Convert the work record `f` range by range and return the stitched DOCX.
+    progress(state, percent, label) - reports the file's progress
+    """
+    ranges = page_ranges(len(pages))
+    out_dir = parts_dir(f["path"])
+    progress(FileState.PREPARING, 10, f"Splitting into {len(ranges)} parts")
+    with span("split", job_id):
+        pdf_paths = await asyncio.to_thread(write_ranges, f["path"], ranges, out_dir)
+    docx_paths = [path[:-len(".pdf")] + ".docx" for path in pdf_paths]
+    done = sum(1 for path in docx_paths if os.path.exists(path))
+    slots = asyncio.Semaphore(SPLIT_PARALLEL)
+
+    def report():
+        pct = 20 + 70 * done // len(ranges)
+        progress(FileState.CONVERTING, pct, f"Converting parts {done}/{len(ranges)}")
+
+    async def convert_range(n: int):
+        nonlocal done
+        if os.path.exists(docx_paths[n]):
+            return
+        # Same record as the file, pointing at the range; "part" marks it
+        # so backends don't save resume state for the whole file
+        part = dict(f, path=pdf_paths[n], part=n, name=f"{f['name']} [part {n + 1}]")
+        async with slots:
+            for attempt in range(SPLIT_RANGE_RETRIES + 1):
+                try:
+                    docx_bytes = await convert_part(part)
+                    break
+                except Exception as e:
+                    if attempt == SPLIT_RANGE_RETRIES or is_outage_error(e):
+                        raise
+                    delay = 2 ** attempt + random.random()
+                    print(f"[WARN] {part['name']} failed, retrying in {delay:.1f}s: {e}")
+                    await asyncio.sleep(delay)
+        await asyncio.to_thread(_write_part, docx_paths[n], docx_bytes)
+        done += 1
+        report()
+
+    report()
+    tasks = [asyncio.create_task(convert_range(n)) for n in range(len(ranges))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    progress(FileState.FINALIZING, 92, "Joining parts")
+    merger = IncrementalMerger(out_dir, low_memory=True)
+    with span("stitch", job_id):
+        for n, (start, stop) in enumerate(ranges):
+            await merger.add(docx_paths[n], page_sizes(pages[start:stop]))
+        stitched = out_dir / "stitched.docx"
+        saved = await merger.save(str(stitched))
+    if not saved:
+        raise RuntimeError(f"Could not join parts: {merger.error}")
+    docx_bytes = await asyncio.to_thread(_read, str(stitched))
+    await asyncio.to_thread(shutil.rmtree, out_dir, True)
+    return docx_bytes
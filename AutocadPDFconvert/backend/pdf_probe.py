@@ -0,0 +1,71 @@
+"""
+Page geometry for uploaded PDFs.
+
+pypdf only reads the xref table, the trailer and each page dictionary to
+answer MediaBox / Rotate; content streams are never decoded. Probes run in
+the CPU worker processes (backend.cpu_executor) so large drawing sets don't
+block the event loop, and results are cached by the PDF's SHA-256 so
+re-submitted sheets are free.
+"""
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+from backend.cpu_executor import CPU_EXECUTOR
+
+PROBE_CACHE_SIZE = int(os.getenv("PROBE_CACHE_SIZE", "4096"))
+
+_cache: "OrderedDict[str, List[Dict]]" = OrderedDict()
+
+
+def probe_pages(pdf_path: str) -> List[Dict]:
+    """
+    MediaBox and rotation of every page, its size as displayed (points) and
+    how many fonts its resources name (0 for drawings with no real text).
+    """
+    pages = []
+    with open(pdf_path, "rb") as fh:
+        reader = PdfReader(fh, strict=False)
+        for page in reader.pages:
+            box = page.mediabox
+            rotate = page.rotation % 360
+            width, height = float(box.width), float(box.height)
+            if rotate in (90, 270):
+                width, height = height, width
+            resources = page["/Resources"] if "/Resources" in page else {}
+            fonts = resources["/Font"] if "/Font" in resources else {}
+            pages.append({
+                "mediabox": [float(v) for v in box],
+                "rotate": rotate,
+                "width": width,
+                "height": height,
+                "fonts": len(fonts),
+            })
+    return pages
+
+
+def page_sizes(pages: List[Dict]) -> List[Tuple[float, float]]:
+    return [(p["width"], p["height"]) for p in pages]
+
+
+async def probe(pdf_path: str, sha256: Optional[str] = None) -> List[Dict]:
+    """
+    Probe a PDF off the event loop. Returns [] (and logs) if the file
+    can't be parsed, so one bad sheet doesn't fail the batch.
+    """
+    if sha256 and sha256 in _cache:
+        _cache.move_to_end(sha256)
+        return _cache[sha256]
+    try:
+        pages = await CPU_EXECUTOR.run(probe_pages, pdf_path)
+    except Exception as e:
+        print(f"[WARN] Page probe failed for {pdf_path}: {e}")
+        return []
+    if sha256:
+        _cache[sha256] = pages
+        while len(_cache) > PROBE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return pages
+
@@ -0,0 +1,45 @@
+"""
+Uploaded PDFs kept by SHA-256, so a browser can skip sending them again.
+
+Every PDF uploaded to /convert/batch is linked into the store (a hard
+link, so it costs no extra disk while its job still has it). A client
+hashes its files first and asks /convert/batch/prepare which ones the
+server already has; it then uploads only the others, and /convert/batch
+takes the rest from here. Same on-disk layout and LRU as the conversion
+cache; PDF_STORE_MAX_MB bounds it.
+"""
+import os
+import re
+from pathlib import Path
+from typing import Dict, List
+
+from backend.conversion_cache import ConversionCache
+
+PDF_STORE = ConversionCache(
+    os.getenv(
+        "PDF_STORE_DIR",
+        str(Path(__file__).resolve().parent / "pdfs"),
+    ),
+    int(float(os.getenv("PDF_STORE_MAX_MB", "4096")) * 1024 * 1024),
+    suffix=".pdf",
+)
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+def parse_manifest(files) -> List[Dict]:
+    """
+    A batch manifest: [{"name", "size", "sha256"}] in upload order.
+    Raises ValueError if it isn't one.
+    """
+    if not isinstance(files, list) or not files:
+        raise ValueError("manifest must be a non-empty list of files")
+    manifest = []
+    for f in files:
+        if not isinstance(f, dict) or not isinstance(f.get("name"), str):
+            raise ValueError("every file needs a name")
+        sha256 = str(f.get("sha256", "")).lower()
+        if not _SHA256.match(sha256):
+            raise ValueError(f"{f['name']}: sha256 must be 64 hex digits")
+        manifest.append({"name": f["name"], "size": f.get("size"), "sha256": sha256})
+    return manifest
@@ -0,0 +1,433 @@
+"""
+The conversion pipeline, as run by conversion workers (backend.worker).
+
+run_file() takes one file of a job from its spooled upload to a DOCX
+artifact: plot (DWG), cache lookup, conversion on the backend the policy
+picks (shared with identical files converting at the same time, see
+backend.single_flight), retried per backend.retry_policy, and the page
+probe the combined document is sized from. merge_job() runs after each
+file of the job is converted or failed: it appends the finished files to
+the combined document in input order, and once every file is finished
+saves it and publishes the job's outputs.
+
+All progress goes through the job store, which the API reads; set_file()
+also wakes event streams of the same process (an embedded worker). The
+conversion steps report through a FileReport, so a remote worker
+(backend.remote_worker) can run them and send the progress to the API.
+"""
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional
+
+from backend.artifacts import describe_artifact, job_output_dir, write_artifact
+from backend.conversion_cache import CONVERSION_CACHE, cache_key
+from backend.conversion_backends import (
+    ADOBE_BACKEND,
+    EXPORT_OCR_LANG,
+    EXPORT_TARGET_FORMAT,
+    LOCAL_BACKEND,
+    ConversionBackend,
+    choose_backend,
+    local_fallback_allowed,
+)
+from backend.docx_merge import IncrementalMerger
+from backend.job_store import JOB_STORE, STATE_LABELS, FileState
+from backend.metrics import (
+    BYTES,
+    COOLDOWN_SECONDS,
+    FILES,
+    RETRIES,
+    count,
+    flush_job,
+    observe_stage,
+    span,
+)
+from backend.page_split import convert_split, should_split, SPLIT_PAGES_OVER
+from backend.pdf_probe import page_sizes, probe
+from backend.plotter import PLOTTER, PlotError
+from backend.retry_policy import RETRY_POLICY, BadInput, classify, is_outage_error
+from backend.single_flight import SINGLE_FLIGHT
+from backend.spool import describe_file, job_spool_dir, remove_job_spool
+
+# Flush the combined document's body to disk after every append
+MERGE_LOW_MEMORY = os.getenv("MERGE_LOW_MEMORY", "1") == "1"
+
+# Combined documents this process is building: job id ->
+# {"merger": IncrementalMerger, "next": index of the next file to append}
+_MERGES: Dict[str, Dict] = {}
+
+# Event streams in this process waiting for changes, per job
+JOB_LISTENERS: Dict[str, set] = {}
+
+# --------------------------------------------------
+# Helpers
+# --------------------------------------------------
+def notify_job(job_id: str):
+    for wake in JOB_LISTENERS.get(job_id, ()):
+        wake.set()
+
+def store_file(job_id: str, index: int, state: FileState, progress: int,
+               label: str = None):
+    """set_file() without waking event streams (callable from any thread)."""
+    JOB_STORE.update_file(
+        job_id, index,
+        state=state.value,
+        status=label or STATE_LABELS[state],
+        progress=progress,
+        output=state is FileState.DONE,
+    )
+
+def set_file(job_id: str, index: int, state: FileState, progress: int,
+             label: str = None):
+    store_file(job_id, index, state, progress, label)
+    notify_job(job_id)
+
+def fail_file(job_id: str, index: int):
+    set_file(job_id, index, FileState.FAILED, 0)
+    JOB_STORE.update_work(job_id, index, failed=True)
+    count(FILES, 1, job_id, "failed")
+
+def count_cache(job_id: str, hit: bool):
+    """Count a cache lookup in the job's meta (other workers count its files too)."""
+    def merge(meta: Dict) -> Dict:
+        counts = dict(meta.get("cache") or {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+        return {"cache": counts, "cache_store": CONVERSION_CACHE.stats()}
+    JOB_STORE.merge_meta(job_id, merge)
+
+
+class FileReport:
+    """
+    Where the progress of one file goes: report(state, percent, label=None)
+    and report.cache(hit). This one writes to the job store, from a thread
+    and latest progress only, so a busy database doesn't hold up the event
+    loop; close() waits for the writes.
+    """
+    def __init__(self, job_id: str, index: int):
+        self.job_id = job_id
+        self.index = index
+        self._latest = None
+        self._hit = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def __call__(self, state: FileState, progress: int, label: str = None):
+        self._latest = (state, progress, label)
+        self._write_soon()
+
+    def cache(self, hit: bool):
+        self._hit = hit
+        self._write_soon()
+
+    def _write_soon(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        while self._latest is not None or self._hit is not None:
+            latest, self._latest = self._latest, None
+            hit, self._hit = self._hit, None
+            try:
+                if hit is not None:
+                    await asyncio.to_thread(count_cache, self.job_id, hit)
+                if latest is not None:
+                    await asyncio.to_thread(store_file, self.job_id, self.index, *latest)
+                    notify_job(self.job_id)
+            except Exception as e:
+                print(f"[WARN] Could not record the progress of file {self.index}: {e}")
+
+    async def close(self):
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+
+# --------------------------------------------------
+# One file
+# --------------------------------------------------
+async def run_backend(job_id: str, backend: ConversionBackend, f: Dict,
+                      key: str, pages: asyncio.Future, report: FileReport) -> bytes:
+    probed = await pages if SPLIT_PAGES_OVER else []
+    if should_split(probed):
+        docx_bytes = await convert_split(
+            job_id, f, probed,
+            lambda part: backend.convert(job_id, part, lambda state, pct: None),
+            report,
+        )
+    else:
+        docx_bytes = await backend.convert(job_id, f, report)
+    if backend.cacheable:
+        await asyncio.to_thread(CONVERSION_CACHE.put, key, docx_bytes)
+    report(FileState.DONE, 100, backend.done_label)
+    return docx_bytes
+
+
+async def convert_with_fallback(job_id: str, f: Dict, key: str,
+                                pages: asyncio.Future, report: FileReport) -> bytes:
+    """Convert on the backend the policy picks; offline if Adobe is unreachable."""
+    backend = await choose_backend(pages)
+    try:
+        return await run_backend(job_id, backend, f, key, pages, report)
+    except Exception as e:
+        if backend is LOCAL_BACKEND or not local_fallback_allowed() \
+                or not is_outage_error(e):
+            raise
+        print(f"[WARN] {f['name']}: Adobe unreachable, converting offline: {e}")
+        return await run_backend(job_id, LOCAL_BACKEND, f, key, pages, report)
+
+
+async def attempt_conversion(job_id: str, f: Dict, key: str,
+                             pages: asyncio.Future, report: FileReport) -> bytes:
+    """One try at a file, picking up an Adobe job that was already submitted."""
+    if f.get("location"):
+        docx_bytes = await ADOBE_BACKEND.resume(job_id, f, report)
+        if docx_bytes is not None:
+            await asyncio.to_thread(CONVERSION_CACHE.put, key, docx_bytes)
+            report(FileState.DONE, 100)
+            return docx_bytes
+    if not f["size"]:
+        raise BadInput("Empty file")
+    return await convert_with_fallback(job_id, f, key, pages, report)
+
+
+async def convert_with_retries(job_id: str, f: Dict, key: str,
+                               semaphore: asyncio.Semaphore, pages: asyncio.Future,
+                               report: FileReport) -> Optional[bytes]:
+    """Attempts per RETRY_POLICY, each holding a slot; None if the file failed."""
+    name = f["name"]
+    attempts = {}
+    while True:
+        try:
+            async with semaphore:
+                docx_bytes = await attempt_conversion(job_id, f, key, pages, report)
+            count(FILES, 1, job_id, "converted")
+            return docx_bytes
+        except Exception as e:
+            delay = RETRY_POLICY.next_delay(e, attempts)
+            if delay is None:
+                print(f"[ERROR] {name}: {e}")
+                report(FileState.FAILED, 0)
+                count(FILES, 1, job_id, "failed")
+                return None
+            kind = classify(e).value
+            count(RETRIES, 1, job_id, kind)
+            count(COOLDOWN_SECONDS, delay, job_id)
+            print(f"[WARN] {name}: {kind} error, retrying in {delay:.1f}s: {e}")
+            report(FileState.RETRYING, 20,
+                   f"Retrying in {delay:.0f}s ({kind.replace('_', ' ')})")
+            # Waits outside the slot, so healthy files keep converting
+            await asyncio.sleep(delay)
+
+
+async def _cached(key: str) -> Optional[bytes]:
+    if not CONVERSION_CACHE.contains(key):
+        return None
+    return await asyncio.to_thread(CONVERSION_CACHE.get, key)
+
+
+async def convert_one(
+    job_id: str,
+    f: Dict,
+    semaphore: asyncio.Semaphore,
+    pages: asyncio.Future,
+    report: FileReport,
+):
+    """Convert a single PDF to DOCX, holding one of the in-flight slots.
+
+    pages  - the file's page probe, for routing by policy
+    report - where progress goes
+
+    Returns the DOCX bytes, or None if the file failed.
+    """
+    if not f["size"]:
+        return await convert_with_retries(job_id, f, None, semaphore, pages, report)
+    # Cache hits skip the upload entirely and never take a slot
+    key = cache_key(f["sha256"], EXPORT_TARGET_FORMAT, EXPORT_OCR_LANG)
+    with span("cache_lookup", job_id):
+        cached = await asyncio.to_thread(CONVERSION_CACHE.get, key)
+    report.cache(bool(cached))
+    if cached:
+        report(FileState.DONE, 100, "Converted ✔ (cached)")
+        count(FILES, 1, job_id, "cached")
+        return cached
+    # The same content converting right now (this batch or another) is shared
+    docx_bytes, shared = await SINGLE_FLIGHT.run(
+        key,
+        lambda: convert_with_retries(job_id, f, key, semaphore, pages, report),
+        lambda: _cached(key),
+        on_wait=lambda: report(FileState.CONVERTING, 50, "Waiting for an identical file"),
+    )
+    if shared:
+        report(FileState.DONE, 100, "Converted ✔ (identical file)")
+        count(FILES, 1, job_id, "shared")
+    return docx_bytes
+
+
+async def plot_one(job_id: str, f: Dict, report: FileReport) -> bool:
+    """Plot a DWG work item to PDF and record the PDF's path and hash."""
+    index = f["index"]
+    report(FileState.PREPARING, 5, "Plotting")
+    try:
+        with span("plot", job_id):
+            pdf_path = await PLOTTER.plot(
+                f["dwg"], job_spool_dir(job_id) / f"{index:05d}.pdf", **f["plot"]
+            )
+    except PlotError as e:
+        print(f"[ERROR] {f['name']}: {e}")
+        report(FileState.FAILED, 0)
+        count(FILES, 1, job_id, "failed")
+        return False
+    pdf = await asyncio.to_thread(describe_file, pdf_path)
+    # The job's byte counters keep the drawing's size
+    await asyncio.to_thread(
+        JOB_STORE.update_work, job_id, index, path=pdf["path"], sha256=pdf["sha256"]
+    )
+    f.update(path=pdf["path"], sha256=pdf["sha256"])
+    return True
+
+
+async def probe_file(job_id: str, f: Dict):
+    with span("probe", job_id):
+        return await probe(f["path"], f["sha256"])
+
+
+def archive_name(f: Dict) -> str:
+    """The file's name inside the job's ZIP (see artifacts.archive_names)."""
+    # Jobs queued before arcnames were stored fall back to the basename
+    return f.get("arcname") or os.path.splitext(f["name"])[0] + ".docx"
+
+
+async def run_file(job_id: str, index: int, semaphore: asyncio.Semaphore,
+                   filename: str) -> Optional[Dict]:
+    """
+    Convert file `index` of a job to its DOCX artifact, or fail it.
+    semaphore - the worker's in-flight conversion slots
+    filename  - this claim's artifact file (backend.artifacts.claim_artifact_name)
+
+    Returns the fields to record in the file's work item when the task is
+    completed (None if there is nothing left to do), so a worker that lost
+    its lease meanwhile records nothing.
+    """
+    f = JOB_STORE.get_work_item(job_id, index)
+    if f is None or f.get("artifact") or f.get("failed"):
+        return None
+    report = FileReport(job_id, index)
+    try:
+        if f.get("dwg") and not f.get("sha256"):
+            if not await plot_one(job_id, f, report):
+                return {"failed": True}
+        else:
+            report(FileState.PREPARING, 5)
+        # Page geometry is only needed for the merge; probe it meanwhile
+        pages = asyncio.create_task(probe_file(job_id, f))
+        docx_bytes = await convert_one(job_id, f, semaphore, pages, report)
+        if docx_bytes is None:
+            pages.cancel()
+            return {"failed": True}
+        with span("write_artifact", job_id):
+            artifact = await asyncio.to_thread(
+                write_artifact, job_id, filename, archive_name(f), docx_bytes
+            )
+        count(BYTES, artifact["size"], job_id, "docx_out")
+        # The combined document may be built by another worker
+        return {"artifact": artifact, "page_sizes": page_sizes(await pages)}
+    finally:
+        await report.close()
+        await ADOBE_BACKEND.publish_state(job_id, final=True)
+        await asyncio.to_thread(flush_job, job_id)
+
+# --------------------------------------------------
+# Whole job
+# --------------------------------------------------
+async def merge_job(job_id: str):
+    """
+    Append the job's finished files to its combined document, in input
+    order and as far as no earlier file is still converting; once every
+    file is finished, save it and publish the outputs.
+
+    Runs as the job's merge task, queued again whenever one of its files
+    finishes and kept leased by this worker while the document is in this
+    process. A worker taking it over (this one died or shut down) starts
+    the document over from the first file.
+    """
+    await _drop_stale_merges(job_id)
+    files = await asyncio.to_thread(JOB_STORE.get_work, job_id)
+    meta = JOB_STORE.get_meta(job_id)
+    if meta is None:
+        await _drop_merge(job_id)
+        return
+    merge = _MERGES.get(job_id)
+    if merge is None:
+        merger = IncrementalMerger(
+            job_output_dir(job_id), low_memory=MERGE_LOW_MEMORY, job_id=job_id
+        )
+        merge = _MERGES[job_id] = {"merger": merger, "next": 0}
+    merger = merge["merger"]
+    try:
+        # Files that finished out of order wait in the store for the ones before
+        while merge["next"] < len(files):
+            f = files[merge["next"]]
+            if not (f.get("artifact") or f.get("failed")):
+                break
+            if f.get("artifact"):
+                sizes = f.get("page_sizes")
+                if sizes is None:
+                    sizes = page_sizes(await probe_file(job_id, f))
+                await merger.add(f["artifact"]["path"], sizes)
+            merge["next"] += 1
+    except BaseException:
+        # Don't leave the half-built document in a CPU worker
+        await asyncio.shield(_drop_merge(job_id))
+        raise
+    if merge["next"] < len(files):
+        await asyncio.to_thread(JOB_STORE.update_meta, job_id, merge=merger.snapshot())
+        return
+    del _MERGES[job_id]
+    await finish_merged_job(job_id, meta, files, merger)
+
+
+async def finish_merged_job(job_id: str, meta: Dict, files: List[Dict],
+                            merger: IncrementalMerger):
+    """Save the combined document and publish the job's outputs."""
+    # Archive in input order, whatever order the conversions finished in
+    outputs = [f["artifact"] for f in files if f.get("artifact")]
+    # --------------------------------------------------
+    # Save the combined document
+    # --------------------------------------------------
+    combined_name = meta["folder_name"].replace(" ", "_") + "_COMBINED.docx"
+    combined_path = job_output_dir(job_id) / "combined.docx"
+    if await merger.save(str(combined_path)):
+        combined = await asyncio.to_thread(
+            describe_artifact, combined_path, combined_name
+        )
+        combined["combined"] = True
+        outputs.append(combined)
+        # 👇 expose for UI / status
+        JOB_STORE.update_meta(job_id, combined=combined_name)
+    JOB_STORE.update_meta(job_id, merge=merger.snapshot())
+    if "created" in meta:
+        observe_stage("batch", time.time() - meta["created"], job_id)
+    flush_job(job_id)
+    JOB_STORE.finish_job(job_id, outputs)
+    notify_job(job_id)
+    remove_job_spool(job_id)
+
+
+async def _drop_merge(job_id: str):
+    merge = _MERGES.pop(job_id, None)
+    if merge is not None:
+        await merge["merger"].close()
+
+
+async def _drop_stale_merges(job_id: str):
+    """Close documents of jobs another worker finished (or that are gone)."""
+    for other in list(_MERGES):
+        if other != job_id and (
+            JOB_STORE.get_meta(other) is None or JOB_STORE.get_outputs(other) is not None
+        ):
+            await _drop_merge(other)
+
+
+def abandon_job(job_id: str):
+    """Finish a job with no outputs (its merge task keeps failing)."""
+    JOB_STORE.finish_job(job_id, [])
+    notify_job(job_id)
+    remove_job_spool(job_id)
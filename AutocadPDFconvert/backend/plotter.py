@@ -0,0 +1,175 @@
+"""
+DWG → PDF plotting with AutoCAD's headless console.
+
+plot_dwg_to_pdf.scr used to be run by hand, with the layout, paper, plot
+style and a single output file (C:\\dwg_plot_temp\\output.pdf) written into
+it. Each drawing now gets its own copy of that script (PLOT_SCRIPT), with
+its own layout, paper size, plot style table and output path filled in,
+and its own console process. At most PLOTTER_WORKERS
+drawings are plotted at once.
+
+PLOTTER_COMMAND is the console to start; it is run as
+    <command> /i <drawing.dwg> /s <plot.scr>
+(accoreconsole's arguments), so tests can use `python -m backend.fake_plotter`.
+"""
+import os
+import re
+import sys
+import shlex
+import shutil
+import asyncio
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+from backend.metrics import METRICS
+
+PLOTTER_COMMAND = os.getenv("PLOTTER_COMMAND", "accoreconsole.exe")
+PLOTTER_WORKERS = int(os.getenv("PLOTTER_WORKERS", "2"))
+# A plot that runs longer than this is killed and reported as failed
+PLOT_TIMEOUT = float(os.getenv("PLOT_TIMEOUT", "300"))
+
+PLOT_DEFAULT_LAYOUT = os.getenv("PLOT_LAYOUT", "tender")
+PLOT_DEFAULT_PAPER = os.getenv("PLOT_PAPER", "A1")
+PLOT_DEFAULT_CTB = os.getenv("PLOT_CTB", "monochrome.ctb")
+
+PLOT_SCRIPT = Path(os.getenv(
+    "PLOT_SCRIPT", str(Path(__file__).resolve().parent.parent / "plot_dwg_to_pdf.scr")
+))
+
+# Paper size -> (media name in "DWG To PDF.pc3", width mm, height mm)
+PAPER_SIZES = {
+    "A0": ("ISO full bleed A0 (1189.00 x 841.00 MM)", 1189, 841),
+    "A1": ("ISO full bleed A1 (841.00 x 594.00 MM)", 841, 594),
+    "A2": ("ISO full bleed A2 (594.00 x 420.00 MM)", 594, 420),
+    "A3": ("ISO full bleed A3 (420.00 x 297.00 MM)", 420, 297),
+    "A4": ("ISO full bleed A4 (297.00 x 210.00 MM)", 297, 210),
+}
+
+# Settings are pasted into the script inside quotes: the layout can't hold
+# quotes or line breaks, the plot style is a file name in Plot Styles
+_UNSAFE_LAYOUT = re.compile(r'["\x00-\x1f\x7f]')
+_PLOT_STYLE = re.compile(r"[\w .()+-]+\.(ctb|stb)", re.IGNORECASE)
+
+
+class PlotError(RuntimeError):
+    pass
+
+
+def check_plot_options(layout: str, paper: str, ctb: str):
+    """Raises PlotError unless the settings are safe to put in the script."""
+    if paper not in PAPER_SIZES:
+        raise PlotError(f"paper must be one of {', '.join(PAPER_SIZES)}")
+    if not layout or _UNSAFE_LAYOUT.search(layout):
+        raise PlotError("layout must be a layout name without quotes or line breaks")
+    if not _PLOT_STYLE.fullmatch(ctb):
+        raise PlotError("ctb must be a .ctb or .stb file name")
+
+
+def render_plot_script(output: Path, layout: str = PLOT_DEFAULT_LAYOUT,
+                       paper: str = PLOT_DEFAULT_PAPER,
+                       ctb: str = PLOT_DEFAULT_CTB) -> str:
+    """
+    PLOT_SCRIPT with this drawing's settings. They are found by what the
+    lines hold (the media and size follow the printer and the window's
+    first corner), so the file can change around them.
+    """
+    check_plot_options(layout, paper, ctb)
+    media, width, height = PAPER_SIZES[paper]
+    lines = PLOT_SCRIPT.read_text(encoding="utf-8").splitlines()
+    filled = set()
+    for i, line in enumerate(lines):
+        value = line.strip().strip('"').lower()
+        if value.startswith("_.layout set "):
+            lines[i] = f'_.LAYOUT SET "{layout}"'
+            filled.add("layout")
+        elif value.endswith(".pc3") and i + 1 < len(lines):
+            lines[i + 1] = f'"{media}"'
+            filled.add("media")
+        elif value == "0,0" and i + 1 < len(lines):
+            lines[i + 1] = f"{width},{height}"
+            filled.add("size")
+        elif value.endswith((".ctb", ".stb")):
+            lines[i] = f'"{ctb}"'
+            filled.add("ctb")
+        elif value.endswith(".pdf"):
+            # Backslashes doubled, as in the original script
+            lines[i] = '"' + str(output).replace("\\", "\\\\") + '"'
+            filled.add("output")
+    if len(filled) != 5:
+        raise PlotError(f"{PLOT_SCRIPT} doesn't have the settings the plotter fills in")
+    return "\n".join(lines) + "\n"
+
+
+def _command() -> List[str]:
+    return shlex.split(PLOTTER_COMMAND, posix=sys.platform != "win32")
+
+
+def _run(cmd: List[str], cwd: Path) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        cmd, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, timeout=PLOT_TIMEOUT,
+    )
+
+
+def _console_tail(output: bytes, lines: int = 5) -> str:
+    # accoreconsole writes UTF-16 on Windows; dropping the NULs is enough here
+    text = output.replace(b"\x00", b"").decode("utf-8", errors="replace")
+    return " | ".join(text.strip().splitlines()[-lines:])
+
+
+class Plotter:
+    def __init__(self, workers: int = PLOTTER_WORKERS):
+        self.workers = workers
+        self._slots = None
+        self.running = 0
+        self.waiting = 0
+
+    async def plot(self, dwg_path, pdf_path, layout: str = PLOT_DEFAULT_LAYOUT,
+                   paper: str = PLOT_DEFAULT_PAPER,
+                   ctb: str = PLOT_DEFAULT_CTB) -> Path:
+        """Plot one drawing to `pdf_path`; raises PlotError on failure."""
+        pdf_path = Path(pdf_path).resolve()
+        work_dir = pdf_path.with_suffix(".plot")
+        work_dir.mkdir(parents=True, exist_ok=True)
+        script = work_dir / "plot.scr"
+        script.write_text(render_plot_script(pdf_path, layout, paper, ctb))
+        cmd = _command() + ["/i", str(Path(dwg_path).resolve()), "/s", str(script)]
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        try:
+            self.waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+            self.running += 1
+            try:
+                result = await asyncio.to_thread(_run, cmd, work_dir)
+            finally:
+                self.running -= 1
+                self._slots.release()
+        except subprocess.TimeoutExpired:
+            raise PlotError(f"Plot timed out after {PLOT_TIMEOUT:.0f}s")
+        except OSError as e:
+            raise PlotError(f"Could not start plotter {cmd[0]!r}: {e}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if not pdf_path.exists() or pdf_path.stat().st_size == 0:
+            raise PlotError(
+                f"Plotter exited with {result.returncode} and no PDF: "
+                f"{_console_tail(result.stdout)}"
+            )
+        return pdf_path
+
+    def snapshot(self) -> Dict:
+        return {"workers": self.workers, "running": self.running, "waiting": self.waiting}
+
+
+PLOTTER = Plotter()
+
+METRICS.gauge(
+    "plots", "Drawings this process is plotting or has waiting for a plotter slot",
+    ("state",),
+    lambda: {(state,): PLOTTER.snapshot()[state] for state in ("running", "waiting")},
+)
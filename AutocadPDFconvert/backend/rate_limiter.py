@@ -0,0 +1,99 @@
+"""
+Adaptive rate limiting for Adobe PDF Services calls.
+
+A token bucket whose refill rate follows AIMD: every successful call nudges
+the rate up additively, every HTTP 429 cuts it multiplicatively and, when
+the service says how long to wait (Retry-After), blocks the bucket until
+then. With no
+push-back the bucket stays at its ceiling and calls go straight through.
+"""
+import os
+import time
+import asyncio
+from typing import Optional
+
+
+class AdaptiveRateLimiter:
+    def __init__(
+        self,
+        rate: float = 10.0,
+        min_rate: float = 0.2,
+        max_rate: float = 20.0,
+        burst: float = 10.0,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+    ):
+        """
+        rate     - starting refill rate (calls / second)
+        min_rate - floor the rate never drops below
+        max_rate - ceiling for additive increase
+        burst    - bucket capacity
+        increase - calls / second added per successful call
+        decrease - factor the rate is multiplied by on a throttle
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self.throttle_count = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    async def acquire(self):
+        """Wait until a call may be made, then consume one token."""
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        self.throttle_count += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self._tokens = min(self._tokens, 0)
+        if retry_after:
+            self._blocked_until = max(
+                self._blocked_until, time.monotonic() + retry_after
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            "rate": round(self.rate, 2),
+            "throttled": self.throttle_count,
+            "blocked_for": round(max(0.0, self._blocked_until - time.monotonic()), 1),
+        }
+
+
+# Per Adobe account, since each has its own quota. Status polls go through
+# the bucket too, so the ceiling must leave room for many jobs polling at once.
+ADOBE_RATE = float(os.getenv("ADOBE_RATE", "50"))
+ADOBE_RATE_MIN = float(os.getenv("ADOBE_RATE_MIN", "0.2"))
+ADOBE_RATE_MAX = float(os.getenv("ADOBE_RATE_MAX", "50"))
+ADOBE_RATE_BURST = float(os.getenv("ADOBE_RATE_BURST", "50"))
+
+
+def adobe_limiter() -> AdaptiveRateLimiter:
+    """A new limiter for one Adobe account."""
+    return AdaptiveRateLimiter(
+        rate=ADOBE_RATE,
+        min_rate=ADOBE_RATE_MIN,
+        max_rate=ADOBE_RATE_MAX,
+        burst=ADOBE_RATE_BURST,
+    )
@@ -0,0 +1,287 @@
+"""
+Conversion worker on another machine, fed by the API over plain HTTP.
+
+    python -m backend.remote_worker --api http://converter-host:8000 --concurrency 4
+
+It leases file tasks from the API's /tasks endpoints instead of the job
+store: claim a task, download its PDF (or its drawing, plotted here with
+this machine's AutoCAD), convert it with this machine's Adobe accounts or
+local backend, upload the DOCX and complete the task. Progress goes to
+the API as the file converts, so the page shows it like any other file.
+
+Leases work as for local workers (backend.worker): the worker renews them
+with a heartbeat every lease / 4, a worker that stops answering has its
+tasks claimed again once the lease runs out, and one that is stopped
+gives them back. Merge tasks (the combined document) are left to the
+workers next to the API, which have the other files' artifacts.
+
+The API only serves remote workers when it has a WORKER_TOKEN; pass the
+same value with --token (or the same env var). Adobe quota is counted
+per job store, so give each machine its own accounts.
+"""
+import os
+import shutil
+import asyncio
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.conversion_backends import ADOBE_BACKEND
+from backend.job_store import WORKER_ID, FileState
+from backend.metrics import BYTES, FILES, count, span, take_job
+from backend.pdf_probe import page_sizes
+from backend.pipeline import FileReport, convert_one, probe_file
+from backend.plotter import PLOTTER, PlotError
+from backend.spool import CHUNK_SIZE, describe_file
+from backend.worker import MAX_IN_FLIGHT, Worker, run_worker
+
+REMOTE_WORK_DIR = Path(os.getenv(
+    "REMOTE_WORK_DIR", str(Path(__file__).resolve().parent / "remote_work")
+))
+
+# Tries at a download or result report before giving up on it
+HTTP_ATTEMPTS = 3
+
+
+class LeaseLost(Exception):
+    """The API gave the task to another worker."""
+
+
+class RemoteReport(FileReport):
+    """Sends a file's progress to the API, one request at a time, latest only."""
+    def __init__(self, worker: "RemoteWorker", task: Dict):
+        super().__init__(task["job_id"], task["index"])
+        self.worker = worker
+        self.task_id = task["task_id"]
+        self.cached = None
+        self.label = None
+        self._latest = None
+        self._changed = asyncio.Event()
+        self._sender = asyncio.create_task(self._send())
+
+    def __call__(self, state: FileState, progress: int, label: str = None):
+        if state in (FileState.DONE, FileState.FAILED):
+            # Sent with the result instead
+            self.label = label
+            return
+        self._latest = (state, progress, label)
+        self._changed.set()
+
+    def cache(self, hit: bool):
+        self.cached = hit
+
+    async def _send(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            state, progress, label = self._latest
+            try:
+                await self.worker.post(
+                    f"/tasks/{self.task_id}/progress",
+                    state=state.value, progress=progress, label=label,
+                )
+            except (httpx.HTTPError, LeaseLost):
+                pass
+
+    async def close(self):
+        self._sender.cancel()
+        await asyncio.gather(self._sender, return_exceptions=True)
+
+
+class RemoteWorker(Worker):
+    def __init__(self, api_url: str, concurrency: int = MAX_IN_FLIGHT,
+                 prefetch: Optional[int] = None, owner: str = WORKER_ID,
+                 token: Optional[str] = None):
+        super().__init__(concurrency, prefetch, owner)
+        self.api_url = api_url.rstrip("/")
+        self.token = token
+        self._client: Optional[httpx.AsyncClient] = None
+        self._api_down = False
+
+    async def run(self):
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        async with httpx.AsyncClient(
+            base_url=self.api_url, headers=headers,
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        ) as client:
+            self._client = client
+            await super().run()
+
+    async def post(self, path: str, **fields) -> httpx.Response:
+        response = await self._client.post(path, json={"worker": self.owner, **fields})
+        if response.status_code == 409:
+            raise LeaseLost(path)
+        response.raise_for_status()
+        return response
+
+    # --------------------------------------------------
+    # Task source
+    # --------------------------------------------------
+    async def claim(self) -> Optional[Dict]:
+        try:
+            response = await self.post("/tasks/claim")
+        except httpx.HTTPError as e:
+            if not self._api_down:
+                print(f"[WARN] API unreachable at {self.api_url}: {e!r}")
+            self._api_down = True
+            return None
+        if self._api_down:
+            print("[INFO] API reachable again")
+            self._api_down = False
+        if response.status_code == 204:
+            return None
+        task = response.json()
+        self.lease_seconds = task["lease_seconds"]
+        return task
+
+    async def renew(self) -> List[int]:
+        response = await self.post("/tasks/heartbeat")
+        return response.json()["tasks"]
+
+    async def release(self):
+        try:
+            await self.post("/tasks/release")
+        except httpx.HTTPError as e:
+            print("[WARN] Could not give tasks back (their leases will run out):", e)
+
+    async def give_up(self, task: Dict) -> Dict:
+        count(FILES, 1, task["job_id"], "failed")
+        return {"outcome": "failed"}
+
+    async def complete(self, task: Dict, result: Dict) -> bool:
+        if result.get("lost"):
+            return False
+        for attempt in range(HTTP_ATTEMPTS):
+            try:
+                await self.post(
+                    f"/tasks/{task['task_id']}/complete",
+                    metrics=take_job(task["job_id"]), **result,
+                )
+                return True
+            except LeaseLost:
+                return False
+            except httpx.HTTPError as e:
+                print(f"[WARN] Could not report task {task['task_id']}: {e!r}")
+                await asyncio.sleep(2 ** attempt)
+        print(f"[ERROR] Task {task['task_id']} not reported; it runs again "
+              "once its lease runs out")
+        return True
+
+    # --------------------------------------------------
+    # One file
+    # --------------------------------------------------
+    async def execute(self, task: Dict, slots: asyncio.Semaphore) -> Dict:
+        work_dir = REMOTE_WORK_DIR / f"{self.owner.replace(':', '_')}-{task['task_id']}"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        report = RemoteReport(self, task)
+        try:
+            return await self._convert(task, slots, work_dir, report)
+        except LeaseLost:
+            return {"lost": True}
+        finally:
+            # Before awaiting anything: shutting down may cancel us again
+            shutil.rmtree(work_dir, ignore_errors=True)
+            await report.close()
+            await ADOBE_BACKEND.publish_state(task["job_id"], final=True)
+
+    async def _convert(self, task: Dict, slots: asyncio.Semaphore,
+                       work_dir: Path, report: RemoteReport) -> Dict:
+        job_id = task["job_id"]
+        f = dict(task["file"], index=task["index"])
+        failed = {"outcome": "failed"}
+        if f["plot"]:
+            report(FileState.PREPARING, 5, "Plotting")
+            drawing = await self._download(task, work_dir / "drawing.dwg")
+            try:
+                with span("plot", job_id):
+                    pdf_path = await PLOTTER.plot(
+                        drawing, work_dir / "drawing.pdf", **f["plot"]
+                    )
+            except PlotError as e:
+                print(f"[ERROR] {f['name']}: {e}")
+                count(FILES, 1, job_id, "failed")
+                return failed
+            pdf = await asyncio.to_thread(describe_file, pdf_path)
+            # The job's byte counters keep the drawing's size
+            f.update(path=pdf["path"], sha256=pdf["sha256"])
+        else:
+            report(FileState.PREPARING, 5)
+            f["path"] = str(await self._download(task, work_dir / "input.pdf"))
+        pages = asyncio.create_task(probe_file(job_id, f))
+        docx_bytes = await convert_one(job_id, f, slots, pages, report)
+        if docx_bytes is None:
+            pages.cancel()
+            return dict(failed, cached=report.cached)
+        with span("task_artifact_out", job_id):
+            response = await self._client.put(
+                f"/tasks/{task['task_id']}/artifact",
+                params={"worker": self.owner}, content=docx_bytes,
+            )
+        if response.status_code == 409:
+            raise LeaseLost("artifact")
+        response.raise_for_status()
+        count(BYTES, len(docx_bytes), job_id, "docx_out")
+        return {
+            "outcome": "done",
+            "page_sizes": page_sizes(await pages),
+            "label": report.label,
+            "cached": report.cached,
+        }
+
+    async def _download(self, task: Dict, dest: Path) -> Path:
+        """The task's input, checked against its hash when there is one."""
+        expected = task["file"]["sha256"]
+        for attempt in range(1, HTTP_ATTEMPTS + 1):
+            try:
+                with span("task_input_in", task["job_id"]):
+                    digest = await self._fetch(task, dest)
+                if expected is None or digest == expected:
+                    count(BYTES, dest.stat().st_size, task["job_id"], "task_input_in")
+                    return dest
+                error = "hash mismatch"
+            except httpx.HTTPError as e:
+                error = repr(e)
+            print(f"[WARN] {task['file']['name']}: download failed "
+                  f"({attempt}/{HTTP_ATTEMPTS}): {error}")
+            await asyncio.sleep(attempt)
+        raise RuntimeError(f"could not download the input: {error}")
+
+    async def _fetch(self, task: Dict, dest: Path) -> str:
+        digest = hashlib.sha256()
+        async with self._client.stream(
+            "GET", f"/tasks/{task['task_id']}/input", params={"worker": self.owner}
+        ) as response:
+            if response.status_code == 409:
+                raise LeaseLost("input")
+            response.raise_for_status()
+            with open(dest, "wb") as out:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    await asyncio.to_thread(out.write, chunk)
+        return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run conversion tasks leased from an API.")
+    parser.add_argument("--api", default=os.getenv("WORKER_API_URL"),
+                        help="the API's base URL, e.g. http://converter-host:8000")
+    parser.add_argument("--concurrency", type=int, default=MAX_IN_FLIGHT,
+                        help="conversions in flight at once")
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="tasks claimed at once (default: 2 x concurrency)")
+    parser.add_argument("--token", default=os.getenv("WORKER_TOKEN"),
+                        help="the API's WORKER_TOKEN")
+    args = parser.parse_args()
+    if not args.api:
+        parser.error("--api (or WORKER_API_URL) is required")
+    if not args.token:
+        parser.error("--token (or WORKER_TOKEN) is required")
+    run_worker(RemoteWorker(args.api, args.concurrency, args.prefetch, token=args.token),
+               f"for {args.api}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Retry policy for file conversions.
+
+Errors are sorted into classes, each with its own retry budget:
+
+    network   - Adobe unreachable, timeouts, 5xx            (RETRY_NETWORK)
+    throttled - 429 / quota, every account cooling down     (RETRY_THROTTLED)
+    auth      - 401 / 403 after the client's token refresh  (RETRY_AUTH)
+    bad_input - empty or corrupt PDF, rejected by Adobe     (RETRY_BAD_INPUT)
+    unknown   - anything else                               (RETRY_UNKNOWN)
+
+Waits grow exponentially from RETRY_BASE_DELAY up to RETRY_MAX_DELAY with
+full jitter, so files that failed together don't retry together. A
+Retry-After from Adobe is the minimum wait; if it is longer than
+RETRY_MAX_DELAY (a quota that resets next month) the file is not retried.
+"""
+import os
+import random
+import asyncio
+from enum import Enum
+from typing import Dict, Optional
+
+import httpx
+from adobe.pdfservices.operation.exception.exceptions import (
+    SdkException,
+    ServiceApiException,
+    ServiceUsageException,
+)
+from pypdf.errors import PyPdfError
+
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+
+
+class BadInput(ValueError):
+    """A file that can't be converted however often it is retried."""
+
+
+class ErrorClass(str, Enum):
+    NETWORK = "network"
+    THROTTLED = "throttled"
+    AUTH = "auth"
+    BAD_INPUT = "bad_input"
+    UNKNOWN = "unknown"
+
+
+RETRY_BUDGETS = {
+    ErrorClass.NETWORK: int(os.getenv("RETRY_NETWORK", "3")),
+    ErrorClass.THROTTLED: int(os.getenv("RETRY_THROTTLED", "5")),
+    ErrorClass.AUTH: int(os.getenv("RETRY_AUTH", "1")),
+    ErrorClass.BAD_INPUT: int(os.getenv("RETRY_BAD_INPUT", "0")),
+    ErrorClass.UNKNOWN: int(os.getenv("RETRY_UNKNOWN", "1")),
+}
+
+
+def is_outage_error(error: BaseException) -> bool:
+    """True when Adobe couldn't be reached at all (DNS, connect, reset...)."""
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return True
+    return isinstance(error, SdkException) and "Request could not be completed" in str(error)
+
+
+def classify(error: BaseException) -> ErrorClass:
+    if is_outage_error(error) or isinstance(error, asyncio.TimeoutError):
+        return ErrorClass.NETWORK
+    if isinstance(error, ServiceUsageException):
+        return ErrorClass.THROTTLED
+    if isinstance(error, ServiceApiException):
+        status = error.status_code or 0
+        if status == 429:
+            return ErrorClass.THROTTLED
+        if status in (401, 403):
+            return ErrorClass.AUTH
+        if status >= 500:
+            return ErrorClass.NETWORK
+        if 400 <= status < 500:
+            return ErrorClass.BAD_INPUT
+    if isinstance(error, (BadInput, PyPdfError)):
+        return ErrorClass.BAD_INPUT
+    return ErrorClass.UNKNOWN
+
+
+def backoff(attempt: int, base: float = RETRY_BASE_DELAY,
+            cap: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryPolicy:
+    def __init__(self, budgets: Dict[ErrorClass, int] = None,
+                 base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY):
+        self.budgets = dict(RETRY_BUDGETS if budgets is None else budgets)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def next_delay(self, error: BaseException,
+                   attempts: Dict[ErrorClass, int]) -> Optional[float]:
+        """
+        Seconds to wait before retrying after `error`, or None to give up.
+        attempts - retries used so far per class; updated in place
+        """
+        kind = classify(error)
+        used = attempts.get(kind, 0)
+        if used >= self.budgets.get(kind, 0):
+            return None
+        retry_after = getattr(error, "retry_after", None) or 0.0
+        if retry_after > self.max_delay:
+            return None
+        attempts[kind] = used + 1
+        return max(retry_after, backoff(used, self.base_delay, self.max_delay))
+
+
+RETRY_POLICY = RetryPolicy()
@@ -0,0 +1,108 @@
+"""
+One conversion at a time per content hash (single-flight).
+
+Two people uploading the same drawing set minutes apart, or the same
+sheet sitting in two subfolders of one batch, used to convert every copy:
+twice the Adobe quota and twice the wait. SingleFlight.run() lets the
+first caller for a key (the leader) convert; the others attach to it and
+share its result, and each job still writes its own artifact.
+
+Callers in the same process wait on the leader's future. Workers in
+other processes see the leader's flight in the job store and poll for its
+result in the conversion cache, which they share; if the leader fails,
+dies (its task lease runs out) or its result isn't cacheable, the next
+caller leads and converts the file itself.
+
+Shared results are counted under files_total{outcome="shared"}.
+
+SINGLE_FLIGHT=0 turns this off.
+"""
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.job_store import JOB_STORE, WORKER_ID
+from backend.metrics import METRICS
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT", "1") == "1"
+
+# How often a worker waiting on another process's flight checks on it
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", "1.0"))
+
+
+class SingleFlight:
+    def __init__(self, owner: str = WORKER_ID, enabled: bool = SINGLE_FLIGHT_ENABLED,
+                 poll_interval: float = SINGLE_FLIGHT_POLL_INTERVAL):
+        self.owner = owner
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, asyncio.Future] = {}
+
+    async def run(
+        self,
+        key: str,
+        work: Callable[[], Awaitable[Optional[bytes]]],
+        lookup: Callable[[], Awaitable[Optional[bytes]]],
+        on_wait: Callable[[], None] = lambda: None,
+    ) -> Tuple[Optional[bytes], bool]:
+        """
+        (result, shared): work()'s result, or the result of the flight
+        already running for `key` (shared=True).
+
+        lookup  - the result another process left behind (None if not there)
+        on_wait - called once if this call has to wait for another flight
+        """
+        if not self.enabled:
+            return await work(), False
+        waited = False
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                if await asyncio.to_thread(JOB_STORE.lead_flight, key, self.owner):
+                    # A flight that ended between two polls left its result
+                    result = await lookup() if waited else None
+                    if key in self._flights:
+                        # Another call in this process started leading meanwhile
+                        continue
+                    if result is None:
+                        break
+                    await asyncio.to_thread(JOB_STORE.end_flight, key, self.owner)
+                    return result, True
+                # Led by another process: its result lands in the shared cache
+                if not waited:
+                    waited = True
+                    on_wait()
+                await asyncio.sleep(self.poll_interval)
+                result = await lookup()
+                if result is not None:
+                    return result, True
+                continue
+            if not waited:
+                waited = True
+                on_wait()
+            result = await asyncio.shield(flight)
+            if result is not None:
+                return result, True
+            # The leader failed or was stopped; the next one in line leads
+
+        # Leading
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        result = None
+        try:
+            result = await work()
+            return result, False
+        finally:
+            del self._flights[key]
+            flight.set_result(result)
+            await asyncio.to_thread(JOB_STORE.end_flight, key, self.owner)
+
+    def snapshot(self) -> Dict:
+        return {"in_flight": len(self._flights)}
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+METRICS.gauge(
+    "single_flight_in_flight", "Conversions this process leads for other callers to share",
+    (), lambda: {(): SINGLE_FLIGHT.snapshot()["in_flight"]},
+)
@@ -0,0 +1,81 @@
+"""
+Per-job spool directory for uploaded PDFs.
+
+Uploads are streamed to disk in fixed-size chunks (hashing as they go), so
+a job record only carries paths and metadata and peak memory no longer grows
+with the size of the batch.
+"""
+import os
+import uuid
+import shutil
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import AsyncIterator, Dict
+
+SPOOL_DIR = Path(os.getenv(
+    "SPOOL_DIR", str(Path(__file__).resolve().parent / "spool")
+))
+CHUNK_SIZE = 1024 * 1024
+
+
+def job_spool_dir(job_id: str) -> Path:
+    return SPOOL_DIR / job_id
+
+
+async def spool_upload(upload, dest: Path) -> Dict:
+    """Stream a Starlette UploadFile to `dest`; returns path, size and sha256."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest, "wb") as out:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            await asyncio.to_thread(out.write, chunk)
+    await upload.close()
+    return {"path": str(dest), "size": size, "sha256": digest.hexdigest()}
+
+
+def describe_file(path) -> Dict:
+    """Path, size and sha256 of a file already on disk."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return {"path": str(path), "size": size, "sha256": digest.hexdigest()}
+
+
+async def iter_file(path, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read a file in chunks without blocking the event loop."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def link_or_copy(src, dest):
+    """Hard-link `src` to `dest` (no second copy on disk), else copy it."""
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f"{dest.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        os.link(src, tmp)
+    except FileNotFoundError:
+        # Nothing to copy either
+        raise
+    except OSError:
+        # Another volume, or a file system without hard links
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+def remove_job_spool(job_id: str):
+    shutil.rmtree(job_spool_dir(job_id), ignore_errors=True)
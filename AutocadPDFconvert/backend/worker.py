@@ -0,0 +1,240 @@
+"""
+Conversion worker: runs the tasks queued in the job store.
+
+    python -m backend.worker --concurrency 4
+
+The API only spools uploads, queues tasks (one per file, see
+backend.job_store) and reads state. Workers claim file tasks, and the
+merge task a job gets queued as its files finish, up to --prefetch
+at a time, and keep up to --concurrency conversions in flight
+(MAX_IN_FLIGHT); the rest wait on cache lookups, probes or retry backoff.
+
+Claims are leases, renewed every TASK_LEASE_SECONDS / 4. The tasks of a
+worker that died are claimed again once their lease runs out; a task
+that has been claimed more than TASK_MAX_CLAIMS times (it keeps killing
+its worker) is failed instead. A worker that is stopped puts its tasks
+back in the queue for the others.
+
+backend.launcher starts CONVERSION_WORKERS of these next to uvicorn and
+turns the API's own worker off (EMBEDDED_WORKER=0). Run on its own,
+`uvicorn backend.main:app` converts in-process as before.
+
+Adobe webhooks (CALLBACK_BASE_URL) can only reach the API process, so a
+separate worker doesn't ask for them and polls its Adobe jobs instead.
+
+Workers on other machines lease tasks over HTTP (backend.remote_worker);
+claim(), renew(), release(), execute() and complete() are the hooks a
+task source overrides.
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from backend.artifacts import claim_artifact_name
+from backend.client_registry import CLIENT_REGISTRY
+from backend.conversion_backends import LOCAL_BACKEND
+from backend.cpu_executor import CPU_EXECUTOR
+from backend.credential_pool import CREDENTIAL_POOL
+from backend.job_poller import JOB_POLLER
+from backend.job_store import JOB_STORE, WORKER_ID
+from backend.pipeline import abandon_job, fail_file, merge_job, run_file
+
+# How many files one worker keeps in flight at once
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "4"))
+
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "60"))
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "0.5"))
+
+# A task that keeps killing its worker is given up after this many claims
+TASK_MAX_CLAIMS = 3
+
+
+class Worker:
+    def __init__(self, concurrency: int = MAX_IN_FLIGHT,
+                 prefetch: Optional[int] = None, owner: str = WORKER_ID):
+        """
+        concurrency - conversions in flight at once
+        prefetch    - tasks claimed at once (default: twice concurrency)
+        """
+        self.concurrency = concurrency
+        self.prefetch = prefetch or concurrency * 2
+        self.owner = owner
+        self.lease_seconds = TASK_LEASE_SECONDS
+        self._running: Dict[int, asyncio.Task] = {}
+        self._claimed_at: Dict[int, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def wake(self):
+        """Claim new tasks now rather than on the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        """Claim and run tasks until cancelled."""
+        self._wakeup = asyncio.Event()
+        slots = asyncio.Semaphore(self.concurrency)
+        renewer = asyncio.create_task(self._renew())
+        try:
+            while True:
+                while len(self._running) < self.prefetch:
+                    task = await self.claim()
+                    if task is None:
+                        break
+                    self._claimed_at[task["task_id"]] = time.monotonic()
+                    self._running[task["task_id"]] = asyncio.create_task(
+                        self._run_task(task, slots)
+                    )
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), TASK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            renewer.cancel()
+            running = list(self._running.values())
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            await self.release()
+
+    # --------------------------------------------------
+    # Task source (the job store; see RemoteWorker for the HTTP one)
+    # --------------------------------------------------
+    # Store calls run in a thread: they can wait on other workers' writes
+    async def claim(self) -> Optional[Dict]:
+        return await asyncio.to_thread(
+            JOB_STORE.claim_task, self.owner, time.time() + self.lease_seconds
+        )
+
+    async def renew(self) -> List[int]:
+        """Extend our leases; returns the ids of the tasks we still hold."""
+        return await asyncio.to_thread(
+            JOB_STORE.renew_tasks, self.owner, time.time() + self.lease_seconds
+        )
+
+    async def release(self):
+        await asyncio.to_thread(JOB_STORE.release_tasks, self.owner)
+
+    async def execute(self, task: Dict, slots: asyncio.Semaphore) -> Dict:
+        """Run a task; returns the result complete() reports."""
+        if task["index"] is None:
+            await merge_job(task["job_id"])
+            return {}
+        work = await run_file(
+            task["job_id"], task["index"], slots,
+            claim_artifact_name(task, self.owner),
+        )
+        return {"work": work}
+
+    async def give_up(self, task: Dict) -> Dict:
+        if task["index"] is None:
+            abandon_job(task["job_id"])
+        else:
+            fail_file(task["job_id"], task["index"])
+        return {}
+
+    async def complete(self, task: Dict, result: Dict) -> bool:
+        work = result.get("work")
+        if await asyncio.to_thread(
+            JOB_STORE.complete_task, task["task_id"], self.owner, work
+        ):
+            return True
+        # The new owner writes and records an artifact of its own
+        if work and work.get("artifact"):
+            Path(work["artifact"]["path"]).unlink(missing_ok=True)
+        return False
+
+    # --------------------------------------------------
+    # Running tasks
+    # --------------------------------------------------
+    async def _run_task(self, task: Dict, slots: asyncio.Semaphore):
+        try:
+            if task["claims"] > TASK_MAX_CLAIMS:
+                print(f"[ERROR] Giving up on {_describe(task)} after "
+                      f"{task['claims'] - 1} claims")
+                result = await self.give_up(task)
+            else:
+                result = await self.execute(task, slots)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] {_describe(task)} failed: {e}")
+            result = await self.give_up(task)
+        finally:
+            self._running.pop(task["task_id"], None)
+            self._claimed_at.pop(task["task_id"], None)
+            self._wakeup.set()
+        if not await self.complete(task, result):
+            print(f"[WARN] Lost the lease on {_describe(task)} to another worker")
+        # The job's merge task may be ours to run now
+        self._wakeup.set()
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 4)
+            started = time.monotonic()
+            try:
+                held = set(await self.renew())
+            except Exception as e:
+                print("[WARN] Could not renew task leases:", e)
+                continue
+            # Another worker has it now (we were too slow to renew): stop
+            for task_id, claimed_at in list(self._claimed_at.items()):
+                if task_id not in held and claimed_at < started:
+                    print(f"[WARN] Lost the lease on task {task_id}, stopping it")
+                    self._running[task_id].cancel()
+
+
+def _describe(task: Dict) -> str:
+    if task["index"] is None:
+        return f"job {task['job_id']} (merge)"
+    return f"job {task['job_id']} file {task['index']}"
+
+
+async def serve(worker: Worker):
+    await CLIENT_REGISTRY.start()
+    await CPU_EXECUTOR.start()
+    try:
+        await worker.run()
+    finally:
+        await CLIENT_REGISTRY.aclose()
+        LOCAL_BACKEND.shutdown()
+        CPU_EXECUTOR.shutdown()
+
+
+def run_worker(worker: Worker, where: str = "on the job store"):
+    """Run `worker` in this process until Ctrl+C or SIGTERM."""
+    if not len(CREDENTIAL_POOL):
+        print("[ERROR] Adobe credentials not set")
+        sys.exit(1)
+    if JOB_POLLER.callback_base_url:
+        print("[INFO] Webhooks go to the API process; this worker polls its Adobe jobs")
+        JOB_POLLER.callback_base_url = None
+    # Stop like Ctrl+C, so running tasks go back to the queue
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"[INFO] Worker {worker.owner} started {where} "
+          f"(concurrency {worker.concurrency})")
+    try:
+        asyncio.run(serve(worker))
+    except KeyboardInterrupt:
+        pass
+    print(f"[INFO] Worker {worker.owner} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run conversion tasks from the job store.")
+    parser.add_argument("--concurrency", type=int, default=MAX_IN_FLIGHT,
+                        help="conversions in flight at once")
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="tasks claimed at once (default: 2 x concurrency)")
+    args = parser.parse_args()
+    run_worker(Worker(args.concurrency, args.prefetch))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 import React, { useEffect, useState } from "react";
 import { API_BASE_URL } from "../config";
+import { startBatch } from "../services/batchUpload";
 import "./BatchPdfUploader.css";
 
 type LogItem = {
+  index?: number;
   name: string;
   status: string;
   progress: number;
@@ -18,6 +20,7 @@ export default function BatchPdfUploader() {
   const [folder, setFolder] = useState<string>("converted_batch");
   const [collapsed, setCollapsed] = useState(false);
   const [batchDone, setBatchDone] = useState(false);
+  const [uploadNote, setUploadNote] = useState<string | null>(null);
 
   const [summary, setSummary] = useState<{
     total: number;
@@ -50,60 +53,111 @@ export default function BatchPdfUploader() {
   async function handleConvert() {
     if (!files) return;
 
-    const formData = new FormData();
-    Array.from(files).forEach((f) => {
-      formData.append("files", f, f.webkitRelativePath || f.name);
-    });
-
     setConverting(true);
     setCollapsed(true);
 
-    const res = await fetch(`${API_BASE_URL}/convert/batch`, {
-      method: "POST",
-      body: formData,
-    });
-
-    const data = await res.json();
-    setJobId(data.job_id);
+    // Files the server already has (same content) aren't sent again
+    try {
+      const data = await startBatch(Array.from(files), setUploadNote);
+      setJobId(data.job_id);
+    } catch (err) {
+      alert(String(err));
+      setConverting(false);
+    } finally {
+      setUploadNote(null);
+    }
   }
 
   // -------------------------
-  // Polling
+  // Progress (pushed over SSE, polling as a fallback)
   // -------------------------
   useEffect(() => {
     if (!jobId) return;
 
-    const timer = setInterval(async () => {
-      try {
-        const statusRes = await fetch(
-          `${API_BASE_URL}/convert/status/${jobId}`
-        );
-        if (!statusRes.ok) return;
+    let timer: ReturnType<typeof setInterval> | null = null;
+
+    function finish() {
+      setBatchDone(true);
+      setConverting(false);
+    }
+
+    function startPolling() {
+      timer = setInterval(async () => {
+        try {
+          const statusRes = await fetch(
+            `${API_BASE_URL}/convert/status/${jobId}`
+          );
+          if (!statusRes.ok) return;
+
+          const statusData: LogItem[] = await statusRes.json();
+
 
-        const statusData: LogItem[] = await statusRes.json();
+          setLog(statusData.filter((f) => typeof f.status === "string"));
 
+          const summaryRes = await fetch(
+            `${API_BASE_URL}/convert/summary/${jobId}`
+          );
+          if (!summaryRes.ok) return;
 
-        setLog(statusData.filter((f) => typeof f.status === "string"));
+          const s = await summaryRes.json();
+          setSummary(s);
 
-        const summaryRes = await fetch(
-          `${API_BASE_URL}/convert/summary/${jobId}`
-        );
-        if (!summaryRes.ok) return;
+          if (s.converted + s.failed === s.total) {
+            finish();
+            if (timer) clearInterval(timer);
+          }
+        } catch {
+          console.warn("Polling failed");
+        }
+      }, 1500);
+    }
+
+    if (typeof EventSource === "undefined") {
+      startPolling();
+      return () => {
+        if (timer) clearInterval(timer);
+      };
+    }
+
+    const events = new EventSource(`${API_BASE_URL}/convert/events/${jobId}`);
 
-        const s = await summaryRes.json();
-        setSummary(s);
+    events.addEventListener("snapshot", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setLog(data.files);
+      setSummary(data.summary);
+    });
 
-        if (s.converted + s.failed === s.total) {
-          setBatchDone(true);
-          setConverting(false);
-          clearInterval(timer);
+    // Only the files that changed are sent; patch them in by index
+    events.addEventListener("update", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setLog((prev) => {
+        const next = [...prev];
+        for (const f of data.files as LogItem[]) {
+          if (f.index !== undefined) next[f.index] = f;
         }
-      } catch {
-        console.warn("Polling failed");
+        return next;
+      });
+      setSummary(data.summary);
+    });
+
+    events.addEventListener("done", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setSummary(data.summary);
+      finish();
+      events.close();
+    });
+
+    events.onerror = () => {
+      // EventSource retries on its own; fall back only if it gave up
+      if (events.readyState === EventSource.CLOSED && !timer) {
+        startPolling();
       }
-    }, 1500);
+    };
 
-    return () => clearInterval(timer);
+    return () => {
+      events.close();
+      if (timer) clearInterval(timer);
+    };
   }, [jobId]);
 
   // -------------------------
@@ -173,6 +227,7 @@ export default function BatchPdfUploader() {
         >
           {converting ? "Converting…" : "Convert"}
         </button>
+        {uploadNote && <div className="fileInfo">{uploadNote}</div>}
       </div>
 
       <div className={`card collapsible ${collapsed ? "collapsed" : ""}`}>
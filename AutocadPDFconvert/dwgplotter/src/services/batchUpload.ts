@@ -0,0 +1,96 @@
+import { API_BASE_URL } from "../config";
+import { hashFiles } from "./hashFiles";
+
+type ManifestEntry = { name: string; size: number; sha256: string };
+
+export type BatchStart = { job_id: string; folder: string };
+
+function relativeName(f: File) {
+  return f.webkitRelativePath || f.name;
+}
+
+function postBatch(files: File[], manifest?: ManifestEntry[]) {
+  const formData = new FormData();
+  files.forEach((f) => formData.append("files", f, relativeName(f)));
+  if (manifest) formData.append("manifest", JSON.stringify(manifest));
+  return fetch(`${API_BASE_URL}/convert/batch`, {
+    method: "POST",
+    body: formData,
+  });
+}
+
+// Hash every file and ask the server which PDFs it still needs
+async function negotiate(
+  files: File[],
+  onProgress: (message: string) => void
+): Promise<{ manifest: ManifestEntry[]; missing: Set<string> }> {
+  const hashes = await hashFiles(files, (done) =>
+    onProgress(`Checking files ${done}/${files.length}`)
+  );
+  const manifest = files.map((f, i) => ({
+    name: relativeName(f),
+    size: f.size,
+    sha256: hashes[i],
+  }));
+  const res = await fetch(`${API_BASE_URL}/convert/batch/prepare`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ files: manifest }),
+  });
+  if (!res.ok) throw new Error(`prepare failed (${res.status})`);
+  const data = await res.json();
+  return { manifest, missing: new Set<string>(data.missing) };
+}
+
+// One file per hash the server is missing
+function filesToSend(
+  files: File[],
+  manifest: ManifestEntry[],
+  missing: Set<string>
+) {
+  const picked = new Set<string>();
+  return files.filter((_, i) => {
+    const sha256 = manifest[i].sha256;
+    if (!missing.has(sha256) || picked.has(sha256)) return false;
+    picked.add(sha256);
+    return true;
+  });
+}
+
+/**
+ * Start a batch, uploading only the PDFs the server doesn't have yet.
+ * Sends everything if hashing or /convert/batch/prepare isn't available
+ * (Web Crypto needs https or localhost).
+ */
+export async function startBatch(
+  files: File[],
+  onProgress: (message: string) => void = () => {}
+): Promise<BatchStart> {
+  let negotiated: Awaited<ReturnType<typeof negotiate>> | undefined;
+  try {
+    negotiated = await negotiate(files, onProgress);
+  } catch (err) {
+    console.warn("Sending every file:", err);
+  }
+
+  if (negotiated) {
+    const { manifest, missing } = negotiated;
+    for (let attempt = 0; attempt < 2; attempt++) {
+      const toSend = filesToSend(files, manifest, missing);
+      onProgress(`Uploading ${toSend.length} of ${files.length} files`);
+      const res = await postBatch(toSend, manifest);
+      if (res.status !== 409) {
+        if (!res.ok) throw new Error(`Upload failed (${res.status})`);
+        return res.json();
+      }
+      // Some PDFs left the server since prepare: send those too
+      const data = await res.json();
+      (data.detail.missing as string[]).forEach((h) => missing.add(h));
+    }
+  }
+
+  onProgress(`Uploading ${files.length} files`);
+  const res = await postBatch(files);
+  if (!res.ok) throw new Error(`Upload failed (${res.status})`);
+  return res.json();
+}
@@ -0,0 +1,50 @@
+// SHA-256 of each file, computed in a small pool of Web Workers.
+const POOL_SIZE = Math.min(4, navigator.hardwareConcurrency || 2);
+
+type HashResult = { id: number; sha256?: string; error?: string };
+
+export async function hashFiles(
+  files: File[],
+  onProgress?: (done: number) => void
+): Promise<string[]> {
+  const hashes: string[] = new Array(files.length);
+  let next = 0;
+  let done = 0;
+
+  const workers = Array.from(
+    { length: Math.min(POOL_SIZE, files.length) },
+    () =>
+      new Worker(new URL("../workers/sha256.worker.ts", import.meta.url), {
+        type: "module",
+      })
+  );
+
+  try {
+    await Promise.all(
+      workers.map(
+        (worker) =>
+          new Promise<void>((resolve, reject) => {
+            const take = () => {
+              if (next >= files.length) return resolve();
+              const id = next++;
+              worker.postMessage({ id, file: files[id] });
+            };
+            worker.onmessage = (e: MessageEvent<HashResult>) => {
+              if (!e.data.sha256) {
+                reject(new Error(e.data.error || "Hashing failed"));
+                return;
+              }
+              hashes[e.data.id] = e.data.sha256;
+              onProgress?.(++done);
+              take();
+            };
+            worker.onerror = (e) => reject(new Error(e.message));
+            take();
+          })
+      )
+    );
+  } finally {
+    workers.forEach((w) => w.terminate());
+  }
+  return hashes;
+}
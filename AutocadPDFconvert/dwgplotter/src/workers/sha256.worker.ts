@@ -0,0 +1,15 @@
+// Hashes files off the main thread, so a big drawing set doesn't freeze the page.
+type HashRequest = { id: number; file: File };
+
+self.onmessage = async (e: MessageEvent<HashRequest>) => {
+  const { id, file } = e.data;
+  try {
+    const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+    const sha256 = Array.from(new Uint8Array(digest), (b) =>
+      b.toString(16).padStart(2, "0")
+    ).join("");
+    self.postMessage({ id, sha256 });
+  } catch (err) {
+    self.postMessage({ id, error: String(err) });
+  }
+};